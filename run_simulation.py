@@ -43,7 +43,9 @@ NOTICE
 
 """
 
+import os
 import sys
+import time
 import argparse
 from datetime import datetime, timedelta as td
 import stevedore
@@ -231,11 +233,72 @@ def main(argv):
                             default=[], nargs='+',
                             dest='inputData')
 
+        parser.add_argument('--cachebudget', help=" Size limit of the input data"
+                                                  " directory in GB. Least recently"
+                                                  " used files are removed to stay"
+                                                  " within it",
+                            default=None, type=float, dest='cachebudget')
+
+        parser.add_argument('--prefetch', help=" Download the input data of the"
+                                               " following days in the background"
+                                               " while the current day runs",
+                            dest='prefetch', action='store_true')
+
+        parser.add_argument('--prefetchbandwidth', help=" Bandwidth limit of the"
+                                                        " background downloads in MB/s",
+                            default=None, type=float, dest='prefetchbandwidth')
+
+        parser.add_argument('--peers', help=" Try other nodes of the cluster"
+                                            " serving their input data (--serve)"
+                                            " before the data servers",
+                            dest='peers', action='store_true')
+
+        parser.add_argument('--serve', help=" Serve the input data of this node"
+                                            " read-only to other nodes on this"
+                                            " port. Without --start only serve",
+                            default=None, type=int, dest='serve')
+
+        parser.add_argument('--pipeline', help=" Prepare each input file in a"
+                                               " separate process as soon as it"
+                                               " is downloaded",
+                            dest='pipeline', action='store_true')
+
+        parser.add_argument('--crophalo', help=" Crop global GRIB2 inputs to the"
+                                               " outer domain plus this many degrees"
+                                               " before ungrib",
+                            default=None, type=float, dest='crophalo')
+
+        parser.add_argument('--poll', help=" Wait up to this many minutes for"
+                                           " real-time input files (GFSFCST, RAP,"
+                                           " NAM) not yet published, downloading"
+                                           " each one as soon as it appears",
+                            default=None, type=float, dest='poll')
+
+        parser.add_argument('--listings', help=" List the server directories,"
+                                               " keeping each listing this many"
+                                               " minutes, and only download files"
+                                               " they show",
+                            default=None, type=float, dest='listings')
+
         args = parser.parse_args()
 
     except Exception, general_exception:
         print 'Exception '+ str(general_exception)
 
+    #Start the prepare process while this process has no other thread (see stevedore.PreparePipeline).
+    if args.pipeline and not args.nopreprocess:
+        stevedore.get_prepare_pipeline()
+
+    #Share the input data of this node with the rest of the cluster.
+    if args.serve is not None:
+        server = stevedore.CacheServer(os.environ.get('DEEPTHUNDER_ROOT', '/opt/deepthunder')+
+                                       '/data/inputDataSets', args.serve)
+        server.start()
+        if args.start is None:
+            print 'Serving input data on port '+str(server.port)
+            while True:
+                time.sleep(3600)
+
     # create date objects
     hour_start = int(args.hour)
     #get the start date expecting it to be in the format YYYY-MM-DD
@@ -252,6 +315,9 @@ def main(argv):
     print "Running "+ str(date_delta.days+1) +" individual simulation each being "\
     +str(forecast_length) +" hours in length. UTC start is "+ str(hour_start)
 
+    #Fetches the input data of later days in the background (--prefetch)
+    prefetcher = None
+
     # loop over days to create forecasts
     for i in range(date_delta.days + 1):
 
@@ -290,16 +356,31 @@ def main(argv):
                                        boundaryConditions=args.boundaryConditions,
                                        inputData=args.inputData,
                                        tsfile=args.tslistfile,
-                                       history_interval=args.history_interval)
+                                       history_interval=args.history_interval,
+                                       cachebudget=args.cachebudget,
+                                       peers=args.peers,
+                                       pipeline=args.pipeline,
+                                       crophalo=args.crophalo,
+                                       poll=args.poll,
+                                       listings=args.listings)
 
 
         # check if the object is sane.
         #Check for sanity
         is_sane(stevedore_instance)
 
+        #Start fetching the input data of the following days in the background.
+        if args.prefetch and not args.nopreprocess and prefetcher is None:
+            prefetcher = start_prefetcher(stevedore_instance, date_delta.days, args)
+
+        #Let the prefetcher know that this day is fetched in the foreground.
+        if prefetcher is not None:
+            prefetcher.advance(stevedore_instance.datetimeStartUTC)
+
         # check if input data sets already exist, if not download it.
         if not args.nopreprocess:
-            stevedore_instance.check_input_data()
+            #Downloads carry on while pre-processing starts with the data it has.
+            stevedore_instance.check_input_data(block=False)
 
             # run pre-processing System
             stevedore_instance.run_preprocessing()
@@ -307,9 +388,38 @@ def main(argv):
         # run WRF
         stevedore_instance.run_WRF()
 
+    #Let the prefetcher finish the file it is downloading rather than cut it off at exit.
+    if prefetcher is not None:
+        prefetcher.stop()
+        prefetcher.join()
 
     print 'Stevedore has finished'
 
+def start_prefetcher(stevedore_instance, days, args):
+    '''
+    Start a background prefetcher for the days after the run of stevedore_instance.
+    '''
+    runs = []
+    for j in range(1, days+1):
+        runs.append(stevedore.PlannedRun(stevedore_instance.datetimeStartUTC+td(days=j),
+                                         stevedore_instance.forecastLength,
+                                         list(stevedore_instance.inputDataSets),
+                                         stevedore_instance.get_bbox(), args.is_analysis))
+
+    bandwidth = None
+    if args.prefetchbandwidth is not None:
+        bandwidth = args.prefetchbandwidth*1024**2
+    disk_budget = None
+    if args.cachebudget is not None:
+        disk_budget = args.cachebudget*1024**3
+
+    prefetcher = stevedore.Prefetcher(stevedore_instance.directory_root_inputDataSets, runs,
+                                      bandwidth=bandwidth, disk_budget=disk_budget,
+                                      configure=stevedore_instance.configure_download,
+                                      crop_halo=stevedore_instance.crop_halo)
+    prefetcher.start()
+    return prefetcher
+
 if __name__ == '__main__':
     try:
         main(sys.argv[1:])
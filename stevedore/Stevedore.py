@@ -39,12 +39,22 @@ from datetime import datetime, timedelta
 from math import pi, cos
 import os
 import logging
-from multiprocessing import Process, Queue, cpu_count
 import shutil
 import subprocess
+from functools import partial
 import pytz
 from netCDF4 import Dataset
 from inputdataset import InputDataSet
+from cache import InputDataCache
+from manifest import Manifest
+from mirrors import MirrorHealth
+from peers import get_peer_registry
+from scheduler import DownloadScheduler
+from planner import InputFileStore, get_dataset_class
+from crop import cropped_name
+from pipeline import get_prepare_pipeline
+from poller import PublicationPoller
+from availability import AvailabilityIndex, get_availability_index
 from datasets_aux import *
 from datasets_fcst import *
 from datasets_hist import *
@@ -59,8 +69,9 @@ class Stevedore(object):
     #Log level for items printed to the screen.
     SCREEN_LOG_LEVEL = logging.INFO
 
-    #Number of workers to use when downloading data. When using RDA I suggest you set this to 1.
-    DOWNLOAD_WORKERS = 1
+    #Maximum number of downloads in flight. Each server is further limited by
+    #scheduler.HostLimits.HOST_LIMITS (rda.ucar.edu only allows one session).
+    DOWNLOAD_WORKERS = 16
 
     #Max number of domains supported by namelist instrumentation
     MAXINSTRUMENTEDDOMAINS = 4
@@ -68,6 +79,25 @@ class Stevedore(object):
     #Seconds in an hour
     SEC_IN_HOUR = 3600
 
+    #The WPS Vtable read by ungrib.exe for each ungrib prefix (InputDataSet.ungrib_prefix).
+    #GFS and FNL depend on the date, see _get_vtable.
+    VTABLES = {'SSTNCEP': 'Vtable.SST',
+               'SSTOI': 'Vtable.SST',
+               'SSTJPL': 'Vtable.SST',
+               'SSTSPORT': 'Vtable.SST',
+               'SSTMUR': 'Vtable.SST',
+               'ECMWF_sigma': 'Vtable.ECMWF_sigma',
+               'RAP': 'Vtable.RAP.hybrid.ncep',
+               'RAP_noLSM': 'Vtable.RAP_noLSM',
+               'NAM': 'Vtable.NAM',
+               'NASALISCONUS': 'Vtable.LIS',
+               'ERAISFC': 'Vtable.ERA-interim.ml',
+               'ERAI': 'Vtable.ERA-interim.ml',
+               'GFSNEW': 'Vtable.GFSNEW',
+               'GFSsubset': 'Vtable.GFSNEW',
+               'GFSRDA': 'Vtable.GFSRDA',
+               'CFSR': 'Vtable.CFSR2_web'}
+
     #The defualt dataset. If no dataset is added this will be used.
     DEFAULT_DS = "GFS"
 
@@ -79,7 +109,9 @@ class Stevedore(object):
                  gridratio=3, gridspacinginner=1.5, ngridew=100, ngridns=100, nvertlevels=40, phys_mp=17, phys_ralw=4,
                  phys_rasw=4, phys_cu=1, phys_pbl=1, phys_sfcc=1, phys_sfc=2, phys_urb=0, wps_map_proj='lambert', runshort=0,
                  auxhist7=False, auxhist2=False, feedback=False, adaptivets=False, projectdir='default', norunwrf=False, is_analysis=False,
-                 altftpserver=None, initialConditions=['GFS'], boundaryConditions=['GFS'], inputData=[], tsfile=None, history_interval=60):
+                 altftpserver=None, initialConditions=['GFS'], boundaryConditions=['GFS'], inputData=[], tsfile=None, history_interval=60,
+                 cachebudget=None, peers=False, pipeline=False, crophalo=None, poll=None,
+                 listings=None):
         '''
         Constructor
         '''
@@ -218,9 +250,27 @@ class Stevedore(object):
             print 'Add dataset '+ str(ds)
             self.inputDataSets[str(ds)] = None
 
-        #Store all input files as inputDataSet
+        #Store all input files as inputDataSet (an InputFileStore once check_input_data ran)
         self.inputfiles = []
 
+        #The DownloadScheduler of check_input_data while downloads are in flight and
+        #the keys of the downloads of each dataset.
+        self.download_scheduler = None
+        self.download_keys = {}
+
+        #Prepare each input file as soon as it is downloaded (see pipeline.PreparePipeline).
+        self.use_pipeline = pipeline
+        self.pipeline = None
+
+        #Halo in degrees around the outer domain that large GRIB2 inputs are cropped
+        #to before ungrib. None to give ungrib the whole files.
+        self.crop_halo = None if crophalo is None else float(crophalo)
+
+        #Minutes to wait for real-time files (see InputDataSet.realtime) that are not
+        #published yet, each downloaded as soon as it appears. None to not wait.
+        self.poll_minutes = poll
+        self.poller = None
+
         #Store forecastLength in hours
         self.forecastLength = forecastLength
 
@@ -257,6 +307,33 @@ class Stevedore(object):
         #alt ftp. - download all data from this server if set.
         self.alt_ftp_server_url = altftpserver
 
+        #Size limit of the input data directory in GB. If set, downloaded files are kept in a
+        #content addressed cache and the least recently used are removed to stay within it.
+        self.cache = None
+        if cachebudget is not None:
+            self.cache = InputDataCache(self.directory_root_inputDataSets, int(float(cachebudget)*1024**3))
+        InputDataSet.cache = self.cache
+
+        #Index of the downloaded and prepared input data files.
+        self.manifest = Manifest(self.directory_root_inputDataSets+'/manifest.db')
+        InputDataSet.manifest = self.manifest
+
+        #Download statistics of the data servers, used to pick the fastest mirror.
+        self.mirror_health = MirrorHealth(self.directory_root_inputDataSets+'/mirror_health.json')
+        InputDataSet.mirror_health = self.mirror_health
+
+        #Fetch input data from other nodes of the cluster before the data servers.
+        InputDataSet.peers = None
+        if peers:
+            InputDataSet.peers = get_peer_registry(self.directory_root_inputDataSets)
+
+        #Check the directory listings of the data servers, kept for this many minutes,
+        #before downloading so that no request goes out for a file that is not there.
+        InputDataSet.availability = None
+        if listings is not None:
+            InputDataSet.availability = get_availability_index()
+            InputDataSet.availability.ttl = float(listings)*60 or AvailabilityIndex.TTL
+
         #Define a pytz time zone object for Coordinated Universal Time (UTC)
         utc = pytz.utc
         #Create a datetime object for the forecast start time in local time zone
@@ -340,9 +417,13 @@ class Stevedore(object):
 
 
 
-    def check_input_data(self):
+    def check_input_data(self, block=True):
         """
         Determines the file names of required input data and downloads it.
+        Initial conditions and SSTs are downloaded first, then the boundary
+        conditions in lead time order. If block is False the downloads carry
+        on in the background and run_preprocessing waits for each dataset
+        before it is used (see wait_for_input_data).
         """
 
         #Log entering check_input_data
@@ -352,19 +433,24 @@ class Stevedore(object):
         if not os.path.exists(self.directory_root_inputDataSets):
             os.mkdir(self.directory_root_inputDataSets)
 
-        #Set up multiprocessing
-        workers = self.DOWNLOAD_WORKERS
-        work_queue = Queue()
-        done_queue = Queue()
-        processes = []
+        #Set up the download scheduler
+        scheduler = DownloadScheduler(self.DOWNLOAD_WORKERS)
+        self.download_scheduler = scheduler
+        self.download_keys = {}
+        self.download_tasks = {}
+        self.inputfiles = InputFileStore(self.datetimeStartUTC, self.directory_root_inputDataSets,
+                                         self.get_bbox(), self.is_analysis)
+        if self.use_pipeline:
+            self.pipeline = get_prepare_pipeline()
+            self.pipeline.begin(self._get_prepare_args())
+        if self.poll_minutes is not None:
+            self.poller = PublicationPoller(float(self.poll_minutes)*60)
         baddata = []
 
         for ids in self.inputDataSets:
             try:
-                idsMethodName = eval('InputDataSet'+str(ids))
-                logging.debug('check_input_data: Download input data. with '+ str(idsMethodName))
-                inputDataSet = idsMethodName(self.datetimeStartUTC, 0, self.directory_root_inputDataSets, is_analysis=self.is_analysis)
-                intervalhours = inputDataSet.intervalseconds/self.SEC_IN_HOUR
+                logging.debug('check_input_data: Download input data. with '+ str(get_dataset_class(ids)))
+                inputDataSet, tasks = self.inputfiles.expand(ids, self.forecastLength)
 
                 #Set the intervalseconds to the lowest of the datasets.
                 if inputDataSet.intervalseconds > self.maxintervalseconds:
@@ -382,20 +468,13 @@ class Stevedore(object):
                 #Store input dataset object also as attribute of the DeepThunder object
                 self.inputDataSets[ids] = (inputDataSet)
 
-                #For hours in the simulation length + 1 / the interval between files in hours.
-                for hour_steps in range((self.forecastLength/intervalhours)+1):
-                    #Create a input dataset object
-                    #note we pass the hour steps rather than the new date as this depends on the dataset if we increment the date etc.
-                    inputDataSet = idsMethodName(self.datetimeStartUTC, hour_steps*intervalhours,
-                                                 self.directory_root_inputDataSets, lon_min=self.lon_min[0],
-                                                 lon_max=self.lon_max[0], lat_min=self.lat_min[0], lat_max=self.lat_max[0], is_analysis=self.is_analysis)
-
-                    #Store input dataset object also as attribute of the DeepThunder object
-                    work_queue.put(inputDataSet)
-                    #Store input dataset object also as attribute of the DeepThunder object
-                    self.inputfiles.append(inputDataSet)
-                    #Log information to DeepThunder log-file
-                    logging.debug(str(ids)+ ' filename: '+ inputDataSet.get_filename())
+                for task in tasks:
+                    #Queue the download of the file
+                    self._queue_download(scheduler, ids, task)
+
+                #The prepare pipeline hears once of every distinct file of the dataset.
+                if self.pipeline is not None and self.inputDataSets[ids].ungrib:
+                    self.pipeline.expect(ids, self.inputDataSets[ids], len(self.download_keys[ids]))
             except:
                 logging.error('ERROR: ' + str(ids)+ ' may not be a recognised dataset. It will not be used.')
                 baddata.append(ids)
@@ -405,42 +484,175 @@ class Stevedore(object):
             logging.error('Removing : ' + str(ids)+ ' from datasets')
             del self.inputDataSets[ids]
 
-        #Work on work_queue
-        for worker_id in range(workers):
-            try:
-                #
-                logging.debug('check_input_data: starting worker ' + str(worker_id))
-                process = Process(target=self._worker_download_input_data, args=(work_queue, done_queue))
-                process.start()
-                processes.append(process)
-                work_queue.put('STOP')
-            except:
-                logging.error("ERROR problem processing the queue")
+        if self.poller is not None:
+            self.poller.start()
+
+        #Download everything, each server running as many downloads as it allows.
+        scheduler.run(block)
+        if block:
+            self.wait_for_input_data()
+
+
+    def wait_for_input_data(self, ids=None):
+        """
+        Wait for the files of the dataset ids (all datasets if None) queued by
+        check_input_data to be downloaded.
+        """
+        scheduler = self.download_scheduler
+        if scheduler is None:
+            return
+
+        if ids is not None:
+            logging.info('wait_for_input_data: waiting for '+str(ids))
+            scheduler.wait(self.download_keys.get(ids, []))
+            return
+
+        scheduler.wait()
+        self.download_scheduler = None
+        self.mirror_health.save()
 
-        #Wait for it all to finish downloading.
-        for process in processes:
-            process.join()
+        #Make room for the next runs. Files of this run are pinned and stay.
+        if self.cache is not None:
+            self.manifest.forget(self.cache.evict())
 
         #log that we are all done.
         logging.info('check_input_data: data downloaded.')
 
 
-    def _worker_download_input_data(self, work_queue, done_queue):
+    def get_bbox(self):
         """
-        Downloads the file(s) defined by and inputDataSet object
-        stored in the work_queue.
+        The bounding box of the outer domain as passed to the InputDataSet constructors.
         """
-        logging.debug('_worker_download_input_data')
-        #Get next object waiting in the work_queue
+        return {'lon_min': self.lon_min[0], 'lon_max': self.lon_max[0],
+                'lat_min': self.lat_min[0], 'lat_max': self.lat_max[0]}
 
-        for inputDataSet in iter(work_queue.get, 'STOP'):
-            #if alt_ftp_server_url flag is set the pass it on.
-            if self.alt_ftp_server_url != None:
-                logging.info('_worker_download_input_data Setting alternate ftp server as '+str(self.alt_ftp_server_url)+ 'for '+ str(inputDataSet.name))
-                inputDataSet.alt_server_url = str(self.alt_ftp_server_url)
 
-            #Download the input data set file
+    def _queue_download(self, scheduler, ids, task):
+        """
+        Queue the download of the file(s) of a task of self.inputfiles of the dataset ids.
+        The file is known from its plan (see InputFileStore.planned), its object
+        is created by the download thread, only the task ID is queued.
+        """
+        planned = self.inputfiles.planned(task)
+        if self.alt_ftp_server_url != None:
+            first_url = str(self.alt_ftp_server_url)
+        else:
+            first_url = planned.urls[0]
+        #Log information to DeepThunder log-file
+        logging.debug(str(ids)+ ' filename: '+ planned.name)
+
+        #The initial conditions and the SST constant come first, then the boundary
+        #conditions by lead time.
+        if self.inputDataSets[ids].is_sst or (ids in self.initialConditions and planned.hour == 0):
+            priority = (0, planned.hour)
+        else:
+            priority = (1, planned.hour)
+
+        #Files used by several hour steps or datasets (i.e. daily SSTs) are
+        #downloaded once for all of them.
+        key = planned.download_key()
+        if key not in self.download_keys.setdefault(ids, []):
+            self.download_keys[ids].append(key)
+        dependants = self.download_tasks.get(key)
+        if dependants is not None:
+            if ids not in dependants:
+                dependants.append(ids)
+            logging.debug('_queue_download '+str(planned.name)+' is queued already')
+            return
+        self.download_tasks[key] = [ids]
+
+        #Download the input data set file, once it is published if it is a real-time file.
+        submit = partial(scheduler.submit, first_url, self._download_and_queue,
+                         self.download_tasks[key], task, priority=priority, key=key)
+        if self.poller is not None and self.alt_ftp_server_url is None:
+            #Whether the file is a real-time one depends on its date, the object knows.
+            inputDataSet = self.inputfiles.get(task)
+            if inputDataSet.realtime:
+                self.configure_download(inputDataSet)
+                scheduler.defer(key)
+                self.poller.watch(inputDataSet, submit)
+                return
+        submit()
+
+
+    def _download_and_queue(self, dependants, task):
+        """
+        Download the file of a task of self.inputfiles, crop it if wanted and pass
+        it on to the prepare pipeline for each of the datasets dependants using it.
+        """
+        try:
+            inputDataSet = self.inputfiles.get(task)
+            self.configure_download(inputDataSet)
+            name = inputDataSet.name
             inputDataSet.download()
+            if inputDataSet.name != name:
+                self.inputfiles.keep(task, inputDataSet)
+            if self.crop_halo is not None and inputDataSet.croppable:
+                inputDataSet.crop(self.get_bbox(), self.crop_halo)
+        finally:
+            if self.pipeline is not None:
+                for ids in dependants:
+                    self.pipeline.downloaded(ids)
+
+
+    def _get_prepare_args(self):
+        """
+        The arguments of InputDataSet.prepare for this run.
+        """
+        return {'pre_processing_input_dir': self.directory_PreProcessing_input,
+                'lon_min': self.lon_min, 'lon_max': self.lon_max,
+                'lat_min': self.lat_min, 'lat_max': self.lat_max}
+
+
+    def configure_download(self, inputDataSet, datetime_start=None):
+        """
+        Apply the download settings of this run to an inputDataSet object, or
+        of the same run started at datetime_start (i.e. a prefetched later day).
+        Returns the url of the first server it will try.
+        """
+        #if alt_ftp_server_url flag is set the pass it on.
+        if self.alt_ftp_server_url != None:
+            logging.info('_queue_download Setting alternate ftp server as '+str(self.alt_ftp_server_url)+ 'for '+ str(inputDataSet.name))
+            inputDataSet.alt_server_url = str(self.alt_ftp_server_url)
+            first_url = inputDataSet.alt_server_url
+        else:
+            first_url = inputDataSet.server_url[0]
+
+        #Tell the dataset which Vtable ungrib will use so it only downloads those fields.
+        inputDataSet.vtable = self._get_vtable(inputDataSet.ungrib_prefix, datetime_start)
+        return first_url
+
+
+    def _get_ungrib_prefixes(self):
+        """
+        Returns the ungrib prefixes that have a Vtable in this run.
+        """
+        prefixes = self.VTABLES.keys() + ['GFS', 'FNL']
+        #ERAI - Vtable (model levels used). Note this Will not work if grib files contain pressure level data
+        if self.inputDataSets.get('ERAI') is None:
+            prefixes.remove('ERAI')
+        return prefixes
+
+
+    def _get_vtable(self, ungribPrefix, datetime_start=None):
+        """
+        Returns the path of the WPS Vtable used by ungrib for the ungrib prefix
+        of a dataset or None if there is none. datetime_start is the start of
+        the run if not this one.
+        """
+        vtable = self.VTABLES.get(ungribPrefix)
+        datetime_start = datetime_start or self.datetimeStartUTC
+
+        #If the forecast starts on a date after January 15, 2015  use the upgraded version of the Global Forecast System (GFS)
+        if ungribPrefix in ('GFS', 'FNL'):
+            if datetime_start <= datetime(2015, 1, 15, tzinfo=pytz.utc):
+                vtable = 'Vtable.GFS'
+            else:
+                vtable = 'Vtable.GFSNEW'
+
+        if vtable is None:
+            return None
+        return self.directory_WPS_input+'/ungrib/Variable_Tables/'+vtable
 
 
 
@@ -491,6 +703,23 @@ class Stevedore(object):
 
             #If input data set for initial and boundary conditions are different
         else:
+            #The initial conditions are downloaded first, so they are processed first.
+            #Create a dummy copy of the input data sets
+            dsUngrib = self.inputDataSets.copy()
+
+            #Remove the input data set for the boundary conditions
+            for ids in self.boundaryConditions:
+                dsUngrib.pop(ids, None)
+
+            #Run the WRF Pre-processing System for the initial conditions
+            self._run_WPS(self.directory_PreProcessing_run+'/WPS_initial',
+                          dsUngrib, self.datetimeStartUTC)
+
+            #Run the real.exe for the initial conditions
+            self._run_Real(self.directory_PreProcessing_run+'/Real_initial',
+                           self.directory_PreProcessing_run+'/WPS_initial',
+                           self.initialConditions, self.datetimeStartUTC)
+
             #Create a dummy copy of the input data sets
             dsUngrib = self.inputDataSets.copy()
 
@@ -507,21 +736,18 @@ class Stevedore(object):
                            self.directory_PreProcessing_run+'/WPS_boundary',
                            self.boundaryConditions, self.datetimeEndUTC_wps)
 
-            #Create a dummy copy of the input data sets
-            dsUngrib = self.inputDataSets.copy()
-
-            #Remove the input data set for the boundary conditions
-            for ids in self.boundaryConditions:
-                dsUngrib.pop(ids, None)
-
-            #Run the WRF Pre-processing System for the initial conditions
-            self._run_WPS(self.directory_PreProcessing_run+'/WPS_initial',
-                          dsUngrib, self.datetimeStartUTC)
+        #Finish the downloads of datasets that were not needed above (i.e. for verification).
+        self.wait_for_input_data()
+        if self.pipeline is not None:
+            self.pipeline.finish()
+            self.pipeline = None
 
-            #Run the real.exe for the initial conditions
-            self._run_Real(self.directory_PreProcessing_run+'/Real_initial',
-                           self.directory_PreProcessing_run+'/WPS_initial',
-                           self.initialConditions, self.datetimeStartUTC)
+        #The input data is no longer needed by this run, it may be evicted from the cache.
+        if self.cache is not None:
+            for planned in self.inputfiles:
+                if planned.name_prepared != planned.name:
+                    self.cache.add(planned.path+'/'+planned.name_prepared, pin=False)
+            self.cache.release()
 
 
 
@@ -673,68 +899,9 @@ class Stevedore(object):
         util.link_to(self.directory_WPS_input+'/ungrib/src/ungrib.exe',
                      directory_WPS_run+'/ungrib/src/ungrib.exe')
 
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.SST',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.SSTNCEP')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.SST',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.SSTOI')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.SST',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.SSTJPL')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.SST',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.SSTSPORT')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.SST',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.SSTMUR')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.ECMWF_sigma',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.ECMWF_sigma')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.RAP.hybrid.ncep',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.RAP')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.RAP_noLSM',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.RAP_noLSM')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.NAM',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.NAM')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.LIS',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.NASALISCONUS')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.ERA-interim.ml',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.ERAISFC')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.GFSNEW',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.GFSNEW')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.GFSNEW',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.GFSsubset')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.GFSRDA',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.GFSRDA')
-
-        util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.CFSR2_web',
-                     directory_WPS_run+'/ungrib/Variable_Tables/Vtable.CFSR')
-
-
-        #ERAI - Vtable (model levels used). Note this Will not work if grib files contain pressure level data
-        if self.inputDataSets.get('ERAI') is not None:
-            util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.ERA-interim.ml',
-                         directory_WPS_run+'/ungrib/Variable_Tables/Vtable.ERAI')
-
-        #If the forecast starts on a date after January 15, 2015  use the upgraded version of the Global Forecast System (GFS)
-        if self.datetimeStartUTC <= datetime(2015, 1, 15, tzinfo=pytz.utc):
-            util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.GFS',
-                         directory_WPS_run+'/ungrib/Variable_Tables/Vtable.GFS')
-            util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.GFS',
-                         directory_WPS_run+'/ungrib/Variable_Tables/Vtable.FNL')
-        else:
-            util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.GFSNEW',
-                         directory_WPS_run+'/ungrib/Variable_Tables/Vtable.GFS')
-            util.link_to(self.directory_WPS_input+'/ungrib/Variable_Tables/Vtable.GFSNEW',
-                         directory_WPS_run+'/ungrib/Variable_Tables/Vtable.FNL')
+        for ungribPrefix in self._get_ungrib_prefixes():
+            util.link_to(self._get_vtable(ungribPrefix),
+                         directory_WPS_run+'/ungrib/Variable_Tables/Vtable.'+ungribPrefix)
 
         #Run the linking script of WPS
         util.link_to(self.directory_WPS_input+'/link_grib.csh', directory_WPS_run+'/link_grib.csh')
@@ -757,15 +924,34 @@ class Stevedore(object):
         #Set all the location variables in namelist.wps
         self._replace_location_strings('namelist.wps')
 
+        #geogrid.exe does not need input data. Run it while the downloads finish.
+        #Before running geogrid make a picture of the domain.
+        logging.info('Making an image of the domains with plotgrids.ncl')
+        util.link_to(self.directory_WPS_input+'/util/plotgrids_new.ncl', directory_WPS_run+'/plotgrids_new.ncl')
+        util.replace_string_in_file('plotgrids_new.ncl', 'x11', 'pdf')
+        process = subprocess.Popen(['ncl', directory_WPS_run+'/plotgrids_new.ncl'])
+        process.wait()
+
+
+        #Log information to DeepThunder log-file
+        logging.info('WPS: run geogrid.exe')
+        #Run geogrid.exe
+        process = subprocess.Popen([directory_WPS_run+'/geogrid.exe'])
+        process.wait()
+
         #For each input dataset label
         dictUngrib = []
 
         #For each input dataset file of this label
-        for ids in self.inputDataSets.iterkeys():
-            idso = self.inputDataSets[ids]
+        for ids in dsUngrib.iterkeys():
+            idso = dsUngrib[ids]
             #Call the prepare function of objects of class InputDataSet
             if idso.ungrib:
-                idso.prepare(pre_processing_input_dir=self.directory_PreProcessing_input, lon_min=self.lon_min, lon_max=self.lon_max, lat_min=self.lat_min, lat_max=self.lat_max)
+                #The pipeline prepares the files while they arrive, unless it has failed.
+                if self.pipeline is None or not self.pipeline.wait_ready(ids):
+                    #Wait for the files of this dataset, the others may still be downloading.
+                    self.wait_for_input_data(ids)
+                    idso.prepare(**self._get_prepare_args())
                 if idso.ungrib:
                         #Run the ungrib function
                     if idso.name not in dictUngrib:
@@ -780,7 +966,7 @@ class Stevedore(object):
 
 
         #If ERAI compute pressure on Model levels for real.exe
-        if self.inputDataSets.get('ERAI') is not None:
+        if dsUngrib.get('ERAI') is not None:
             #Setup
             util.link_to(self.directory_WPS_input+'_IBM/util/ecmwf_coeffs', directory_WPS_run+'/ecmwf_coeffs')     #ecmwf_coeffs
             util.link_to(self.directory_WPS_input+'/util/src/calc_ecmwf_p.exe', directory_WPS_run+'/calc_ecmwf_p.exe') #calc_ecmwf_p.exe
@@ -804,20 +990,6 @@ class Stevedore(object):
 
         self._replace_location_strings('namelist.wps')
 
-        #Before running geogrid make a picture of the domain.
-        logging.info('Making an image of the domains with plotgrids.ncl')
-        util.link_to(self.directory_WPS_input+'/util/plotgrids_new.ncl', directory_WPS_run+'/plotgrids_new.ncl')
-        util.replace_string_in_file('plotgrids_new.ncl', 'x11', 'pdf')
-        process = subprocess.Popen(['ncl', directory_WPS_run+'/plotgrids_new.ncl'])
-        process.wait()
-
-
-        #Log information to DeepThunder log-file
-        logging.info('WPS: run geogrid.exe')
-        #Run geogrid.exe
-        process = subprocess.Popen([directory_WPS_run+'/geogrid.exe'])
-        process.wait()
-
         if self.inputDataSets.get('ECMWF') is not None:
             os.remove(directory_WPS_run+'/metgrid/METGRID.TBL')
             shutil.copy(self.directory_WPS_input+'/metgrid/METGRID.TBL.ARW', directory_WPS_run+'/metgrid/METGRID.TBL')
@@ -863,7 +1035,7 @@ class Stevedore(object):
                     logging.info('WPS run metgrid.exe chosen to include ' +str(idso.type) + ' as a SST')
 
         #ERAI - add pressure files
-        if self.inputDataSets.get('ERAI') is not None:
+        if dsUngrib.get('ERAI') is not None:
             fg_name.append('PRES')  #'ERAI','PRES'. That is TWO strings is all we need.
 
         logging.debug('fg_name is '+str(fg_name))
@@ -918,7 +1090,6 @@ class Stevedore(object):
         listOfFileNames = self._get_list_of_inputdatasets(dataType)
         logging.debug('_ungrib: list of files to link based on dataType '+str(dataType)+' is '+str(listOfFileNames))
 
-        listOfFileNames = list(set(listOfFileNames)) # ERAI - Unique grib filenames only.
 
         logging.info('_ungrib: running link_grib.csh')
 
@@ -946,12 +1117,27 @@ class Stevedore(object):
 
         listOfFileNames = []
 
-        for idso in self.inputfiles:
-            if idso.type == dataType:
+        #Several hour steps may share a file (i.e. ERAI, daily SSTs), the store holds
+        #it once. The manifest knows it by the first of them, the one that downloaded it.
+        for task in xrange(len(self.inputfiles)):
+            dataset = self.inputfiles.dataset_of(task)
+            if dataset.type != dataType:
+                continue
+            idso = self.inputfiles.planned(task)
+            #Skip files that never arrived.
+            if self.manifest.get(dataType, self.inputfiles.valid_time(task), idso.name) is not None:
                 if dataType == 'ERAI':
-                    listOfFileNames.append(idso.name_prepared.strip())                      # We already have absolute paths. Strip trailing spaces now.
+                    filename = idso.name_prepared.strip()                      # We already have absolute paths. Strip trailing spaces now.
                 else:
-                    listOfFileNames.append(idso.path+'/'+idso.name_prepared)                # Prefix data dir path to filenames (other than ERAI).
+                    filename = idso.path+'/'+idso.name_prepared                # Prefix data dir path to filenames (other than ERAI).
+                    #The copy cut down to the domain when it was downloaded, if it could be.
+                    if self.crop_halo is not None and dataset.croppable:
+                        cropped = cropped_name(filename, self.get_bbox(), self.crop_halo)
+                        if os.path.isfile(cropped):
+                            filename = cropped
+                #Keep the order of the files, ERAI needs UA first, SFC next.
+                if filename not in listOfFileNames:
+                    listOfFileNames.append(filename)
 
         return listOfFileNames
 
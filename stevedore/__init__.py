@@ -34,13 +34,30 @@ NOTICE
 
 """
 
+from availability import *
+from cache import *
+from crop import *
 from datasets_aux import *
 from datasets_fcst import *
 from datasets_hist import *
 from datasets_sst import *
+from decompress import *
+from downloader import *
+from filelock import *
+from gribindex import *
+from gribstream import *
 from inputdataset import *
+from mirrors import *
+from peers import *
+from pipeline import *
+from poller import *
+from planner import *
+from prefetch import *
+from rda import *
+from registry import *
 import sanity
 from Stevedore import *
+from subsets import *
 import util
 
 
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Index of the files available on the data servers, built from directory
+    listings cached for a while per (host, path). Used to find the name a
+    file is actually published under and to skip servers that do not have
+    it, so that no request goes out for a file that does not exist.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import time
+import logging
+import threading
+import urlparse
+from downloader import get_downloader, DownloadError
+from scheduler import get_host_limits
+
+
+class AvailabilityIndex(object):
+    '''
+    Directory listings of the data servers, each one fetched once and kept
+    for TTL seconds. Listings that can not be had (i.e. RDA, servers without
+    index pages) are unknown and do not stop a download.
+    '''
+
+    #Seconds a listing is used for.
+    TTL = 10*60
+
+    def __init__(self, ttl=None):
+        '''
+        Constructor of an AvailabilityIndex object.
+        '''
+        self.ttl = ttl or self.TTL
+        #(host, path) -> (time listed, set of names or None if unknown)
+        self._listings = {}
+        #(host, path) -> Event of a listing in progress.
+        self._listing = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_of(url):
+        """
+        The (host, path) of a directory url.
+        """
+        parts = urlparse.urlsplit(url)
+        return (parts.scheme+'://'+parts.netloc,
+                '/'+'/'.join(name for name in parts.path.split('/') if name))
+
+    def listing(self, url):
+        """
+        The names in the directory url, None if they are unknown. Threads
+        asking for a directory being listed wait for that listing.
+        """
+        key = self.key_of(url)
+        while True:
+            with self._lock:
+                cached = self._listings.get(key)
+                if cached is not None and time.time()-cached[0] < self.ttl:
+                    return cached[1]
+                event = self._listing.get(key)
+                first = event is None
+                if first:
+                    event = self._listing[key] = threading.Event()
+            if first:
+                break
+            event.wait(60)
+
+        names = None
+        try:
+            with get_host_limits().slot(url):
+                names = set(get_downloader().list_directory(url))
+            #An empty listing is more likely a page we can not read than an empty directory.
+            if not names:
+                names = None
+        except DownloadError, err:
+            logging.info('AvailabilityIndex: can not list '+url+': '+str(err))
+        finally:
+            with self._lock:
+                self._listings[key] = (time.time(), names)
+                del self._listing[key]
+            event.set()
+        return names
+
+    def update(self, url, names):
+        """
+        Store a listing of the directory url made elsewhere (i.e. by the PublicationPoller).
+        """
+        with self._lock:
+            self._listings[self.key_of(url)] = (time.time(), set(names) or None)
+
+    def has(self, url):
+        """
+        False if the listing of its directory shows that url does not exist, True otherwise.
+        """
+        directory, _, name = url.rpartition('/')
+        names = self.listing(directory)
+        return names is None or name in names
+
+    def forget(self, url):
+        """
+        Drop the listing of the directory url, i.e. once it is known to be out of date.
+        """
+        with self._lock:
+            self._listings.pop(self.key_of(url), None)
+
+    def resolve(self, inputDataSet):
+        """
+        Work out the name the file of inputDataSet is published under, the
+        first of inputDataSet.get_alternatives() that a server lists, and the
+        servers that may have it. Returns (name, server indexes); the name is
+        None if every server was listed and none has the file.
+        """
+        candidates = inputDataSet.get_alternatives()
+        listings = []
+        for i in range(len(inputDataSet.server_url)):
+            names = None
+            if not inputDataSet.is_rda[i]:
+                names = self.listing(inputDataSet.server_url[i]+'/'+inputDataSet.server_path[i])
+            listings.append(names)
+
+        known = [names for names in listings if names is not None]
+        name = inputDataSet.name
+        for candidate in candidates:
+            if any(candidate in names for names in known):
+                name = candidate
+                break
+        else:
+            if known and len(known) == len(listings):
+                return None, []
+
+        return name, [i for i, names in enumerate(listings) if names is None or name in names]
+
+
+#The availability index shared by every download of this process.
+_SHARED_INDEX = None
+_SHARED_LOCK = threading.Lock()
+
+
+def get_availability_index():
+    """
+    Return the AvailabilityIndex shared by this process, creating it on first use.
+    """
+    global _SHARED_INDEX
+    with _SHARED_LOCK:
+        if _SHARED_INDEX is None:
+            _SHARED_INDEX = AvailabilityIndex()
+        return _SHARED_INDEX
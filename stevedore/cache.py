@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Content addressed cache of downloaded input data. Every file under the
+    input data directory is a hard link to an object named by the SHA-1 of
+    its content, so identical files of different datasets take up space once.
+    Objects are evicted least recently used first to keep the cache within a
+    byte budget, except those pinned by runs still in progress.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+
+import os
+import time
+import socket
+import hashlib
+import logging
+import sqlite3
+
+
+class InputDataCache(object):
+    '''
+    The cache of the input data directory shared by every run using it.
+    '''
+
+    #Name of the cache directory under the input data directory.
+    CACHE_DIR = '.cache'
+
+    #Pins of runs on other hosts are dropped after this many seconds.
+    PIN_TIMEOUT = 2*24*3600
+
+    #Bytes read at a time when hashing a file.
+    BLOCK_SIZE = 1024*1024
+
+    def __init__(self, root, budget=None):
+        '''
+        Constructor of a InputDataCache object.
+        root is the input data directory and budget the maximum size of the
+        cache in bytes (None for no limit).
+        '''
+        self.root = root
+        self.budget = budget
+        self.directory = root+'/'+self.CACHE_DIR
+        self.directory_objects = self.directory+'/objects'
+        self.database = self.directory+'/index.db'
+        #Identifies the pins of this run.
+        self.host = socket.gethostname()
+        self.pid = os.getpid()
+
+        if not os.path.exists(self.directory_objects):
+            try:
+                os.makedirs(self.directory_objects)
+            except OSError:
+                pass
+
+        db = self._connect()
+        try:
+            db.execute('CREATE TABLE IF NOT EXISTS objects (hash TEXT PRIMARY KEY,'
+                       ' size INTEGER, last_access REAL)')
+            db.execute('CREATE TABLE IF NOT EXISTS links (path TEXT PRIMARY KEY,'
+                       ' hash TEXT, inode INTEGER, mtime REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS links_hash ON links (hash)')
+            db.execute('CREATE TABLE IF NOT EXISTS pins (path TEXT, host TEXT,'
+                       ' pid INTEGER, pinned_at REAL)')
+            db.commit()
+        finally:
+            db.close()
+
+    def _connect(self):
+        """
+        Open the index. Several threads and runs use it at the same time.
+        """
+        return sqlite3.connect(self.database, timeout=120)
+
+    def _object(self, digest):
+        """
+        Path of the object with the hash digest.
+        """
+        return self.directory_objects+'/'+digest[:2]+'/'+digest
+
+    def _hash(self, path):
+        """
+        SHA-1 of the content of a file.
+        """
+        sha = hashlib.sha1()
+        with open(path, 'rb') as infile:
+            while True:
+                data = infile.read(self.BLOCK_SIZE)
+                if not data:
+                    break
+                sha.update(data)
+        return sha.hexdigest()
+
+    def add(self, path, pin=True):
+        """
+        Store the file path in the cache. If the same content is already cached
+        path is replaced by a link to it. The file is pinned for this run unless
+        pin is False.
+        """
+        if not os.path.isfile(path):
+            return
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+
+        db = self._connect()
+        try:
+            row = db.execute('SELECT hash, inode, mtime FROM links WHERE path = ?',
+                             (path,)).fetchone()
+            #Nothing to do if the file has not changed since it was added.
+            if row is not None and row[1] == stat.st_ino and row[2] == stat.st_mtime:
+                digest = row[0]
+            else:
+                digest = self._hash(path)
+                if not self._link(path, digest):
+                    return
+                stat = os.stat(path)
+                db.execute('INSERT OR IGNORE INTO objects (hash, size, last_access) VALUES (?, ?, ?)',
+                           (digest, stat.st_size, time.time()))
+                db.execute('INSERT OR REPLACE INTO links (path, hash, inode, mtime) VALUES (?, ?, ?, ?)',
+                           (path, digest, stat.st_ino, stat.st_mtime))
+            db.execute('UPDATE objects SET last_access = ? WHERE hash = ?', (time.time(), digest))
+            if pin:
+                self._pin(db, path)
+            db.commit()
+        finally:
+            db.close()
+
+    def _link(self, path, digest):
+        """
+        Make path and the object digest the same file. Returns False if the file
+        system does not support hard links.
+        """
+        obj = self._object(digest)
+        try:
+            if not os.path.exists(os.path.dirname(obj)):
+                try:
+                    os.mkdir(os.path.dirname(obj))
+                except OSError:
+                    pass
+
+            if not os.path.exists(obj):
+                os.link(path, obj)
+            elif not os.path.samefile(path, obj):
+                #Same content is cached already, keep a single copy.
+                tmp = path+'.cache'
+                os.link(obj, tmp)
+                os.rename(tmp, path)
+                logging.info('InputDataCache: '+path+' is a duplicate of '+digest)
+        except OSError, err:
+            logging.error('InputDataCache: can not link '+path+' into the cache: '+str(err))
+            return False
+        return True
+
+    def touch(self, path):
+        """
+        Mark path as used by this run, pinning it. Returns False if it is not cached.
+        """
+        path = os.path.abspath(path)
+        db = self._connect()
+        try:
+            row = db.execute('SELECT hash FROM links WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                return False
+            db.execute('UPDATE objects SET last_access = ? WHERE hash = ?', (time.time(), row[0]))
+            self._pin(db, path)
+            db.commit()
+        finally:
+            db.close()
+        return True
+
+    def _pin(self, db, path):
+        """
+        Protect path from eviction until this run releases it.
+        """
+        db.execute('INSERT INTO pins (path, host, pid, pinned_at) VALUES (?, ?, ?, ?)',
+                   (path, self.host, self.pid, time.time()))
+
+    def release(self):
+        """
+        Drop every pin of this run.
+        """
+        db = self._connect()
+        try:
+            db.execute('DELETE FROM pins WHERE host = ? AND pid = ?', (self.host, self.pid))
+            db.commit()
+        finally:
+            db.close()
+
+    def _drop_stale_pins(self, db):
+        """
+        Remove pins of runs that have finished without releasing them.
+        """
+        for host, pid in db.execute('SELECT DISTINCT host, pid FROM pins').fetchall():
+            if host != self.host or pid == self.pid:
+                continue
+            try:
+                os.kill(pid, 0)
+            except OSError:
+                logging.info('InputDataCache: dropping pins of finished run '+str(pid))
+                db.execute('DELETE FROM pins WHERE host = ? AND pid = ?', (host, pid))
+        db.execute('DELETE FROM pins WHERE pinned_at < ?', (time.time()-self.PIN_TIMEOUT,))
+
+    def size(self):
+        """
+        Number of bytes stored in the cache.
+        """
+        db = self._connect()
+        try:
+            return db.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+        finally:
+            db.close()
+
+    def evict(self):
+        """
+        Remove the least recently used objects that are not pinned, and every
+        file linked to them, until the cache fits into the budget.
+        Returns the paths that have been removed.
+        """
+        removed = []
+        if self.budget is None:
+            return removed
+
+        db = self._connect()
+        try:
+            self._drop_stale_pins(db)
+            db.commit()
+            total = db.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+            if total <= self.budget:
+                return removed
+
+            candidates = db.execute('SELECT hash, size FROM objects WHERE hash NOT IN'
+                                    ' (SELECT links.hash FROM links JOIN pins'
+                                    ' ON links.path = pins.path)'
+                                    ' ORDER BY last_access').fetchall()
+            for digest, size in candidates:
+                if total <= self.budget:
+                    break
+                paths = [row[0] for row in
+                         db.execute('SELECT path FROM links WHERE hash = ?', (digest,))]
+                for path in paths + [self._object(digest)]:
+                    if os.path.isfile(path):
+                        os.remove(path)
+                db.execute('DELETE FROM links WHERE hash = ?', (digest,))
+                db.execute('DELETE FROM objects WHERE hash = ?', (digest,))
+                db.commit()
+                total = total - size
+                removed.extend(paths)
+                logging.info('InputDataCache: evicted '+', '.join(paths)+' ('+str(size)+' bytes)')
+
+            if total > self.budget:
+                logging.warning('InputDataCache: '+str(total)+' bytes in use by running'
+                                ' simulations, more than the budget of '+str(self.budget))
+        finally:
+            db.close()
+        return removed
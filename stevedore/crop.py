@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Cropping of global GRIB2 files to the bounding box of the outer domain
+    with wgrib2 -small_grib, so that ungrib.exe and metgrid.exe only read
+    the part of the grid the simulation needs.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import os
+import logging
+import subprocess
+
+
+def is_grib2(filename):
+    """
+    True if filename starts with a GRIB edition 2 message.
+    """
+    with open(filename, 'rb') as infile:
+        head = infile.read(8)
+    return len(head) == 8 and head[:4] == 'GRIB' and ord(head[7]) == 2
+
+
+def crop_box(bbox, halo):
+    """
+    The (lon_min, lon_max, lat_min, lat_max) of bbox grown by halo degrees.
+    """
+    return (bbox['lon_min']-halo, bbox['lon_max']+halo,
+            max(-90.0, bbox['lat_min']-halo), min(90.0, bbox['lat_max']+halo))
+
+
+def cropped_name(filename, bbox, halo):
+    """
+    Name of the copy of filename cropped to bbox plus halo degrees. Files cropped
+    for another domain or halo have another name.
+    """
+    return filename+'.crop_%g_%g_%g_%g' % crop_box(bbox, halo)
+
+
+def crop_grib(filename, destination, bbox, halo):
+    """
+    Cut the GRIB2 file filename down to bbox plus halo degrees, written to
+    destination. Returns False if the file can not be cropped (i.e. GRIB1).
+    """
+    if not is_grib2(filename):
+        logging.debug('crop_grib: '+filename+' is not GRIB2, not cropped')
+        return False
+
+    lon_min, lon_max, lat_min, lat_max = crop_box(bbox, halo)
+    #wgrib2 takes longitudes west of Greenwich as negative values.
+    part = destination+'.part'
+    try:
+        with open(os.devnull, 'w') as devnull:
+            returncode = subprocess.call(['wgrib2', filename, '-small_grib',
+                                          '%g:%g' % (lon_min, lon_max),
+                                          '%g:%g' % (lat_min, lat_max), part],
+                                         stdout=devnull, stderr=devnull)
+    except OSError, err:
+        logging.warning('crop_grib: can not run wgrib2: '+str(err))
+        return False
+
+    if returncode != 0 or not os.path.isfile(part) or os.path.getsize(part) == 0:
+        logging.warning('crop_grib: wgrib2 could not crop '+filename)
+        if os.path.isfile(part):
+            os.remove(part)
+        return False
+
+    os.rename(part, destination)
+    logging.info('crop_grib: cropped '+filename+' from '+str(os.path.getsize(filename))+
+                 ' to '+str(os.path.getsize(destination))+' bytes')
+    return True
@@ -42,13 +42,16 @@ import time
 from datetime import datetime, timedelta
 import subprocess
 import shutil
-import glob
 from inputdataset import *
+from registry import get_spec
 
 class InputDataSetMESONET(InputDataSet):
     '''
     A class defining a MADIS (MESONET) input data set file in netcdf.
     '''
+
+    #File names and servers, see registry.py.
+    SPEC = get_spec('MESONET')
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
 
@@ -60,11 +63,9 @@ class InputDataSetMESONET(InputDataSet):
         self.path = path+'/MESONET'
         self.name = self.get_filename()
         self.name_prepared = self.get_filename()
-        self.server_url = ['ftp://pftp.madis-data.noaa.gov']
+        self.server_url, self.server_path = self.SPEC.get_servers(date_delta)
         self.ungrib_prefix = None
         self.ungrib = False
-        self.server_path = ['archive/'+str(date_delta.year)+str(date_delta.month).zfill(2)+\
-                            str(date_delta.day).zfill(2)+'/LDAD/mesonet/netCDF/']
 
 
     def get_filename(self):
@@ -72,9 +73,7 @@ class InputDataSetMESONET(InputDataSet):
         Generate a filename to download for this dataset for the time given.
         '''
 
-        date_delta = self.date+timedelta(self.hour/24.)
-        return str(date_delta.year)+str(date_delta.month).zfill(2)+str(date_delta.day).zfill(2)+\
-               '_'+str(date_delta.hour).zfill(2)+'00.gz'
+        return self.SPEC.get_filename(self.date+timedelta(self.hour/24.))
 
 
 class InputDataSetMETAR(InputDataSet):
@@ -82,6 +81,9 @@ class InputDataSetMETAR(InputDataSet):
     A class defining a MADIS (METAR) input data set file in netcdf.
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('METAR')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
 
@@ -92,12 +94,11 @@ class InputDataSetMETAR(InputDataSet):
         self.path = path+'/METAR'
         self.name = self.get_filename()
         self.name_prepared = self.get_filename()
-        self.server_url = ['ftp://madis-data.ncep.noaa.gov']
+        self.server_url, self.server_path = self.SPEC.get_servers(date_delta)
         self.ungrib = False
         self.ungrib_prefix = None
-        self.server_path = ['archive/'+str(date_delta.year)+'/'+str(date_delta.month).zfill(2)+\
-                           '/'+str(date_delta.day).zfill(2)+'/point/metar/netcdf/']
         self.is_rda = [False]
+        self.decompress = 'gz'
 
 
     def get_filename(self):
@@ -105,9 +106,7 @@ class InputDataSetMETAR(InputDataSet):
         Generate a filename to download for this dataset for the time given.
         '''
 
-        date_delta = self.date+timedelta(self.hour/24.)
-        return str(date_delta.year)+str(date_delta.month).zfill(2)+\
-               str(date_delta.day).zfill(2)+'_'+str(date_delta.hour).zfill(2)+'00.gz'
+        return self.SPEC.get_filename(self.date+timedelta(self.hour/24.))
 
     #prepare is never called so we can ditch this.
     def prepare(self, **args):
@@ -116,14 +115,10 @@ class InputDataSetMETAR(InputDataSet):
         by WPS or by other functions as required
         '''
         os.chdir(self.path)
-        for filename in glob.glob('*.gz'):
+        for filename in self._files_to_prepare('*.gz'):
 
-            #find the extracted name
-            ename = filename[:-3]
-
-            #gunzip it and move it.
-            process = subprocess.Popen(['gunzip', filename])
-            process.wait()
+            #gunzip it (unless done while downloading) and move it.
+            ename = self._decompress(filename)
             logging.info('preparing METAR data')
 
             #make self.directory_root_observations+'/MADIS/
@@ -138,6 +133,7 @@ class InputDataSetMETAR(InputDataSet):
             #Move the file now to this directory.
             logging.info('preparing METAR data moving '+ ename +' to '+ pdir +ename)
             shutil.move(ename, pdir +ename)
+            self._mark_prepared(filename, pdir +ename)
 
 
 class InputDataSetPREPBufr(InputDataSet):
@@ -160,7 +156,7 @@ class InputDataSetPREPBufr(InputDataSet):
         self.server_path = ['data/ds337.0/tarfiles/'+str(date_delta.year)+'/'+self.get_filename()]
         self.ungrib = False
         self.ungrib_prefix = None
-        self.is_rda = True
+        self.is_rda = [True]
 
     def get_filename(self):
         '''
@@ -185,9 +181,10 @@ class InputDataSetPREPBufr(InputDataSet):
         '''
         logging.info('Extracting Prepbufr...')
         os.chdir(self.path)
-        for filename in glob.glob('*.gz'):
+        for filename in self._files_to_prepare('*.gz'):
             process = subprocess.Popen(['tar', '-zxvf', filename])
             process.wait()
+            self._mark_prepared(filename, filename[:-len('.tar.gz')])
 
 
 class InputDataSetLittleRSurface(InputDataSet):
@@ -198,6 +195,9 @@ class InputDataSetLittleRSurface(InputDataSet):
     e.g. https://rda.ucar.edu/data/ds461.0/little_r/2017/SURFACE_OBS:2017010100
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('LittleRSurface')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
 
@@ -209,8 +209,7 @@ class InputDataSetLittleRSurface(InputDataSet):
         self.path = path+'/LITTLE_R'
         self.name = self.get_filename()
         self.name_prepared = self.get_filename_prepared()
-        self.server_url = ['http://rda.ucar.edu']
-        self.server_path = ['data/ds461.0/little_r/'+str(self.lrdate_delta.year)]
+        self.server_url, self.server_path = self.SPEC.get_servers(self.lrdate_delta)
         self.ungrib = False
         self.ungrib_prefix = None
         self.is_rda = [True]
@@ -219,16 +218,14 @@ class InputDataSetLittleRSurface(InputDataSet):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        return 'SURFACE_OBS:'+str(self.lrdate_delta.year)+str(self.lrdate_delta.month).zfill(2)+\
-                str(self.lrdate_delta.day).zfill(2)+str(self.lrdate_delta.hour).zfill(2)
+        return self.SPEC.get_filename(self.lrdate_delta)
 
     def get_filename_prepared(self):
         '''
         Generate a filename for the processed output file for a given time
         for this dataset
         '''
-        return 'SURFACE_OBS:'+str(self.lrdate_delta.year)+str(self.lrdate_delta.month).zfill(2)+\
-                str(self.lrdate_delta.day).zfill(2)+str(self.lrdate_delta.hour).zfill(2)
+        return self.SPEC.get_filename(self.lrdate_delta)
 
 
 
@@ -240,6 +237,9 @@ class InputDataSetLittleRUpperAir(InputDataSet):
     e.g. https://rda.ucar.edu/data/ds351.0/little_r/2017/OBS:2017010318
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('LittleRUpperAir')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
 
@@ -251,8 +251,7 @@ class InputDataSetLittleRUpperAir(InputDataSet):
         self.path = path+'/LITTLE_R'
         self.name = self.get_filename()
         self.name_prepared = self.get_filename_prepared()
-        self.server_url = ['http://rda.ucar.edu']
-        self.server_path = ['data/ds351.0/little_r/'+str(self.lrdate_delta.year)]
+        self.server_url, self.server_path = self.SPEC.get_servers(self.lrdate_delta)
         self.ungrib = False
         self.ungrib_prefix = None
         self.is_rda = [True]
@@ -261,16 +260,14 @@ class InputDataSetLittleRUpperAir(InputDataSet):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        return 'OBS:'+str(self.lrdate_delta.year)+str(self.lrdate_delta.month).zfill(2)+\
-                str(self.lrdate_delta.day).zfill(2)+str(self.lrdate_delta.hour).zfill(2)
+        return self.SPEC.get_filename(self.lrdate_delta)
 
     def get_filename_prepared(self):
         '''
         Generate a filename for the processed output file for a given time
         for this dataset
         '''
-        return 'OBS:'+str(self.lrdate_delta.year)+str(self.lrdate_delta.month).zfill(2)+\
-                str(self.lrdate_delta.day).zfill(2)+str(self.lrdate_delta.hour).zfill(2)
+        return self.SPEC.get_filename(self.lrdate_delta)
 
 
 class InputDataSetNASALISCONUS(InputDataSet):
@@ -278,6 +275,9 @@ class InputDataSetNASALISCONUS(InputDataSet):
     A class defining a NASA SPoRT LIS 3-km data (CONUS) data set file.
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('NASALISCONUS')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -286,8 +286,7 @@ class InputDataSetNASALISCONUS(InputDataSet):
         self.path = path+'/sportlis_3km'
         self.name = self.get_filename()
         self.name_prepared = self.get_filename()
-        self.server_url = ['ftp://geo.msfc.nasa.gov']
-        self.server_path = ['SPoRT/modeling/lis/conus3km']
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date)
         self.ungrib_prefix = 'NASALISCONUS'
         self.is_rda = [False]
         self.intervalseconds = 3600   #Every hour
@@ -297,9 +296,7 @@ class InputDataSetNASALISCONUS(InputDataSet):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-
-        return 'sportlis_conus3km_model_'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                str(self.date.day).zfill(2)+'_'+str(self.date.hour).zfill(2)+'00.grb2'
+        return self.SPEC.get_filename(self.date)
 
 
 class InputDataSetNASAGF(InputDataSet):
@@ -325,6 +322,9 @@ class InputDataSetNASAGF(InputDataSet):
         self.ungrib_prefix = None
         self.server_path = ['SPoRT/modeling/viirsgvf/global']
         self.is_rda = [False]
+        #Large file, download it in parallel segments.
+        self.segments = 4
+        self.decompress = 'bz2'
 
 
     def get_filename(self):
@@ -349,6 +349,5 @@ class InputDataSetNASAGF(InputDataSet):
         by WPS or by other functions as required
         '''
         os.chdir(self.path)
-        for filename in glob.glob('*.bz2'):
-            process = subprocess.Popen(['bunzip2', filename])
-            process.wait()
+        for filename in self._files_to_prepare('*.bz2'):
+            self._mark_prepared(filename, self._decompress(filename))
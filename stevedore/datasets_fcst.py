@@ -42,13 +42,18 @@ import time
 from datetime import datetime, timedelta
 import subprocess
 import shutil
-import glob
 from inputdataset import *
+from registry import get_spec
+from crop import crop_grib
+from subsets import GLOBE, SubsetIndex, grid_region, subset_name
 
 class InputDataSetGFSFCST(InputDataSet):
     '''
     Global Forecast System (GFS) input data set file in grib format.
     '''
+
+    #File names and servers, see registry.py.
+    SPEC = get_spec('GFSFCST')
     # pylint: disable=too-many-instance-attributes
 
     def __init__(self, date, hour, path, **args):
@@ -60,22 +65,21 @@ class InputDataSetGFSFCST(InputDataSet):
         self.name = self.get_filename()
         self.keep_existing_file = True
         self.name_prepared = self.get_filename()
-        self.server_url = ['http://soostrc.comet.ucar.edu']
-        self.server_path = ['data/grib/gfs/'+str(self.date.year)+\
-                            str(self.date.month).zfill(2)+str(self.date.day).zfill(2)+\
-                            '/grib.t'+str(self.date.hour).zfill(2)+'z']
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date, self.hour)
 
         self.is_rda = [False]
+        self.partial_download = True
         self.ungrib_prefix = 'GFS'
+        #Global grid, worth cropping to the domain.
+        self.croppable = True
+        self.realtime = True
 
     def get_filename(self):
         '''
         Generate a filename to download for this dataset for the time given.
         17062718.gfs.t18z.0p50.pgrb2f036
         '''
-        return str(self.date.year)[2:]+str(self.date.month).zfill(2)+\
-                str(self.date.day).zfill(2)+str(self.date.hour).zfill(2)+\
-                '.gfs.t'+str(self.date.hour).zfill(2)+'z.0p50.pgrb2f'+str(self.hour).zfill(3)
+        return self.SPEC.get_filename(self.date, self.hour)
 
 
 class InputDataSetGFSsubset(InputDataSet):
@@ -83,29 +87,33 @@ class InputDataSetGFSsubset(InputDataSet):
     Global Forecast System (GFS) input data set file with 0.25 degree resolution
     in grib format for the upgraded version after January 15, 2015.
     This only has data about 12 days old. It is hourly
+    The region around the domain is downloaded for a box aligned to
+    SUBSET_GRID degrees, shared with the runs on nearby domains (see subsets.py).
     '''
 
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
-        if args:
-            lon_min = args['lon_min']
-            lon_max = args['lon_max']
-            lat_min = args['lat_min']
-            lat_max = args['lat_max']
+        #The bounding box of the domain and the grid aligned box downloaded for it.
+        self.bbox = GLOBE
+        if 'lon_min' in args:
+            self.bbox = {'lon_min': args['lon_min'], 'lon_max': args['lon_max'],
+                         'lat_min': args['lat_min'], 'lat_max': args['lat_max']}
+        self.region = grid_region(self.bbox)
 
         self.type = 'GFSsubset'
         self.path = path+'/GFSsubset'
         self.name = 'filter_gfs_0p25.pl?file=gfs.t'+str(self.date.hour).zfill(2)+\
                     'z.pgrb2.0p25.f'+str(self.hour).zfill(3)+\
-                    '&all_lev=on&all_var=on&subregion=&leftlon='+str(lon_min)+\
-                    '&rightlon='+str(lon_max)+'&toplat='+str(lat_max)+\
-                    '&bottomlat='+str(lat_min)+'&dir=%2Fgfs.'+str(self.date.year)+\
+                    '&all_lev=on&all_var=on&subregion=&leftlon=%g' % self.region['lon_min']+\
+                    '&rightlon=%g' % self.region['lon_max']+'&toplat=%g' % self.region['lat_max']+\
+                    '&bottomlat=%g' % self.region['lat_min']+'&dir=%2Fgfs.'+str(self.date.year)+\
                     str(self.date.month).zfill(2)+str(self.date.day).zfill(2)+\
                     str(self.date.hour).zfill(2)
 
-        self.name_prepared = self.get_filename()
-        self.keep_existing_file = False
+        self.name_prepared = subset_name(self.get_filename(), self.bbox)
+        #A forecast hour does not change once published.
+        self.keep_existing_file = True
         self.ungrib = True
         self.server_url = ['http://nomads.ncep.noaa.gov']
         self.server_path = ['cgi-bin']
@@ -118,7 +126,45 @@ class InputDataSetGFSsubset(InputDataSet):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        return 'gfs.t'+str(self.date.hour).zfill(2)+'z.pgrb2.0p25.f'+str(self.hour).zfill(3)
+        return 'gfs.'+self.date.strftime('%Y%m%d%H')+'.t'+str(self.date.hour).zfill(2)+\
+               'z.pgrb2.0p25.f'+str(self.hour).zfill(3)
+
+
+    def exists(self):
+        '''
+        The file exists if it was downloaded or can be cut from a subset
+        downloaded for a region holding the domain.
+        '''
+        if InputDataSet.exists(self):
+            return True
+
+        cached = SubsetIndex(self.path).find(self.get_filename(), self.bbox)
+        if cached is None or not self._cut(cached, self.name_prepared):
+            return False
+        logging.info('GFSsubset: '+self.name_prepared+' cut from '+os.path.basename(cached))
+        if self.manifest is not None:
+            self.manifest.record(self.type, self.valid_time, self.name, self.path,
+                                 Manifest.FOUND, self.name_prepared)
+            self._mark_prepared(self.name, self.name_prepared)
+        return True
+
+
+    def _cut(self, filename, name):
+        '''
+        Cut the file name for the domain from the subset filename.
+        Without wgrib2 the whole subset is used.
+        '''
+        destination = self.path+'/'+name
+        if os.path.isfile(destination):
+            return True
+        if not crop_grib(filename, destination, self.bbox, 0):
+            try:
+                os.link(filename, destination)
+            except OSError:
+                shutil.copyfile(filename, destination)
+        if self.cache is not None:
+            self.cache.add(destination)
+        return True
 
 
     def prepare(self, **args):
@@ -128,10 +174,29 @@ class InputDataSetGFSsubset(InputDataSet):
         '''
         try:
             os.chdir(self.path)
-            for filename in glob.glob('filter_gfs_0p25.pl*'):
-                logging.info('WPS: Renaming '+filename)
-                pfilename = filename[24:48]
-                os.rename(filename, pfilename)
+            for filename in self._files_to_prepare('filter_gfs_0p25.pl*'):
+                if not os.path.isfile(filename):
+                    continue
+                #Keep the download under the name of its region for later runs.
+                query = dict(field.split('=', 1) for field in filename.split('?', 1)[1].split('&')
+                             if '=' in field)
+                prefix = 'gfs.'+query['dir'].rsplit('.', 1)[1]+query['file'][3:]
+                region = {'lon_min': float(query['leftlon']), 'lon_max': float(query['rightlon']),
+                          'lat_min': float(query['bottomlat']), 'lat_max': float(query['toplat'])}
+                subset = subset_name(prefix, region)
+                logging.info('WPS: Renaming '+filename+' to '+subset)
+                os.rename(filename, subset)
+                if self.cache is not None:
+                    self.cache.add(self.path+'/'+subset)
+
+                #The domain of this run, from the args of the outer domain.
+                pfilename = subset
+                if 'lon_min' in args:
+                    self.bbox = {'lon_min': args['lon_min'][0], 'lon_max': args['lon_max'][0],
+                                 'lat_min': args['lat_min'][0], 'lat_max': args['lat_max'][0]}
+                    pfilename = subset_name(prefix, self.bbox)
+                    self._cut(self.path+'/'+subset, pfilename)
+                self._mark_prepared(filename, pfilename)
 
         except:
             logging.warning('GFSsubset prepare failure')
@@ -143,6 +208,9 @@ class InputDataSetRAP(InputDataSet):
     Rapid Refresh (RAP) input data set file.
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('RAP')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -153,33 +221,19 @@ class InputDataSetRAP(InputDataSet):
         self.name = self.get_filename()
         self.name_prepared = self.get_filename()
         self.is_rda = [False]
+        self.partial_download = True
         self.ungrib_prefix = 'RAP'
-        if self.date.date() >= datetime.today().date() - timedelta(days=2):
-            self.keep_existing_file = False
-            self.server_url = ['ftp://ftp.ncep.noaa.gov']
-            self.server_path = ['pub/data/nccf/com/rap/prod']
-        else:
-            self.keep_existing_file = True
-            self.server_url = ['http://soostrc.comet.ucar.edu']
-            self.server_path = ['data/grib/rap/'+str(self.date.year)+\
-                                str(self.date.month).zfill(2)+\
-                                str(self.date.day).zfill(2)+'/hybrid']
+        #The last days are on the NCEP real-time server, older ones in the archive.
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date, self.hour)
+        recent = self.SPEC.rule_of(self.date) is not None
+        self.keep_existing_file = not recent
+        self.realtime = recent
 
     def get_filename(self):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        fileout = ''
-
-        if self.date.date() >= datetime.today().date()  - timedelta(days=2):
-            fileout = 'rap.t'+str(self.date.hour).zfill(2)+'z.awp130bgrbf'+\
-                       str(self.hour).zfill(2)+'.grib2'
-        else:
-            fileout = str(self.date.year)[2:4]+str(self.date.month).zfill(2)+\
-                      str(self.date.day).zfill(2)+str(self.date.hour).zfill(2)+\
-                      '.rap.t'+str(self.date.hour).zfill(2)+'z.awp130bgrbf00.grib2'
-
-        return fileout
+        return self.SPEC.get_filename(self.date, self.hour)
 
 
 
@@ -188,6 +242,9 @@ class InputDataSetNAM(InputDataSet):
     North American Mesoscale Forecast System (NAM) input data set file.
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('NAM')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -198,31 +255,18 @@ class InputDataSetNAM(InputDataSet):
         self.name_prepared = self.get_filename()
         self.is_rda = [False]
 
-        if self.date.date() > datetime.today().date() - timedelta(days=30):
-            self.keep_existing_file = False
-            self.server_url = ['ftp://ftp.ncep.noaa.gov']
-            self.server_path = ['pub/data/nccf/com/nam/prod/']
-        else:
-            self.keep_existing_file = False
-            self.server_url = ['ftp://nomads.ncdc.noaa.gov']
-            self.server_path = ['NAM/Grid218/'+str(self.date.year)+\
-                                str(self.date.month).zfill(2)+'/'+str(self.date.year)+\
-                                str(self.date.month).zfill(2)+str(self.date.day).zfill(2)]
+        #The last 30 days are on the NCEP real-time server, older ones in the archive.
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date, self.hour)
+        self.keep_existing_file = False
+        self.realtime = self.SPEC.rule_of(self.date) is not None
 
         self.ungrib_prefix = 'NAM'
+        #Large grid, worth cropping to the domain.
+        self.croppable = True
 
 
     def get_filename(self):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        filename = ''
-        if self.date.date() > datetime.today().date() - timedelta(days=30):
-            filename = 'nam.t'+str(self.date.hour).zfill(2)+'z.awphys'+\
-                        str(self.hour).zfill(2)+'.grb2.tm00'
-        else:
-            filename = 'nam_218_'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                        str(self.date.day).zfill(2)+'_'+str(self.date.hour).zfill(2)+\
-                        '00_0' + str(self.hour).zfill(2) + '.grb'
-
-        return filename
+        return self.SPEC.get_filename(self.date, self.hour)
@@ -42,13 +42,16 @@ import time
 from datetime import datetime, timedelta
 import subprocess
 import shutil
-import glob
 from inputdataset import *
+from registry import get_spec
 
 class InputDataSetGFS(InputDataSet):
     '''
     Global Forecast System (GFS) input data set file in grib format.
     '''
+
+    #File names and servers, see registry.py.
+    SPEC = get_spec('GFS')
     # pylint: disable=too-many-instance-attributes
 
     def __init__(self, date, hour, path, **args):
@@ -58,21 +61,19 @@ class InputDataSetGFS(InputDataSet):
         self.path = path+'/GFS'
         self.name = self.get_filename()
         self.name_prepared = self.get_filename()
-        self.server_url = ['ftp://nomads.ncdc.noaa.gov']
-        self.server_path = ['GFS/Grid4/'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                           '/'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                           str(self.date.day).zfill(2)]
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date, self.hour)
 
         self.is_rda = [False]
+        self.partial_download = True
         self.ungrib_prefix = 'GFS'
+        #Global grid, worth cropping to the domain.
+        self.croppable = True
 
     def get_filename(self):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        return 'gfs_4_'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                str(self.date.day).zfill(2)+'_'+str(self.date.hour).zfill(2)+\
-                '00_'+str(self.hour).zfill(3)+'.grb2'
+        return self.SPEC.get_filename(self.date, self.hour)
 
 
 class InputDataSetGFSp25(InputDataSet):
@@ -80,6 +81,9 @@ class InputDataSetGFSp25(InputDataSet):
     Global Forecast System (GFS) input data set file in grib format.
     0.25 degree gfs data ds084.1
     '''
+
+    #File names and servers, see registry.py.
+    SPEC = get_spec('GFSp25')
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -91,19 +95,17 @@ class InputDataSetGFSp25(InputDataSet):
         self.keep_existing_file = True
         self.ungrib = True
         self.ungrib_prefix = 'GFSRDA'
-        self.server_url = ['http://rda.ucar.edu']
-        self.server_path = ['data/ds084.1/'+str(self.date.year)+'/'+\
-                           str(self.date.year)+str(self.date.month).zfill(2)+\
-                           str(self.date.day).zfill(2)]
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date, self.hour)
         self.is_rda = [True]
+        self.partial_download = True
+        #Global grid, worth cropping to the domain.
+        self.croppable = True
 
     def get_filename(self):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        return 'gfs.0p25.'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                str(self.date.day).zfill(2)+str(self.date.hour).zfill(2)+'.f'+\
-                str(self.hour).zfill(3)+'.grib2'
+        return self.SPEC.get_filename(self.date, self.hour)
 
 
 
@@ -118,6 +120,9 @@ class InputDataSetFNL(InputDataSet):
     you can get 0.25 degree data.
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('FNL')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -129,18 +134,17 @@ class InputDataSetFNL(InputDataSet):
         self.name_prepared = self.get_filename()
         self.keep_existing_file = True
         self.intervalseconds = 21600
-        self.server_url = ['http://rda.ucar.edu']
-        self.server_path = ['data/ds083.2/grib2/'+str(self.date.year)+'/'+\
-                            str(self.date.year)+'.'+str(self.date.month).zfill(2)]
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date)
         self.ungrib_prefix = 'FNL'
         self.is_rda = [True]
+        #Global grid, worth cropping to the domain.
+        self.croppable = True
 
     def get_filename(self):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        return 'fnl_'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                str(self.date.day).zfill(2)+'_'+str(self.date.hour).zfill(2)+'_00.grib2'
+        return self.SPEC.get_filename(self.date)
 
 
 class InputDataSetFNLp25(InputDataSet):
@@ -152,6 +156,9 @@ class InputDataSetFNLp25(InputDataSet):
     can get 0.25 degree data.
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('FNLp25')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -162,19 +169,18 @@ class InputDataSetFNLp25(InputDataSet):
         self.name_prepared = self.get_filename()
         self.keep_existing_file = True
         self.intervalseconds = 21600
-        self.server_url = ['http://rda.ucar.edu']
-        self.server_path = ['data/ds083.3/'+str(self.date.year)+'/'+\
-                            str(self.date.year)+str(self.date.month).zfill(2)]
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date)
         self.ungrib_prefix = 'FNL'
         self.is_rda = [True]
+        #Global grid, worth cropping to the domain.
+        self.croppable = True
 
     def get_filename(self):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
         #Using f00 for each file might not be what you were expecting. Edit if needed.
-        return 'gdas1.fnl0p25.'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                str(self.date.day).zfill(2)+str(self.date.hour).zfill(2)+'.f00.grib2'
+        return self.SPEC.get_filename(self.date)
 
 class InputDataSetCFSR(InputDataSet):
     '''
@@ -183,6 +189,9 @@ class InputDataSetCFSR(InputDataSet):
     See: https://climatedataguide.ucar.edu/climate-data/climate-forecast-system-reanalysis-cfsr
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('CFSR')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -193,24 +202,18 @@ class InputDataSetCFSR(InputDataSet):
         self.name_prepared = self.get_filename()
         self.keep_existing_file = True
         self.intervalseconds = 21600
-        self.server_url = ['http://soostrc.comet.ucar.edu']
-        self.server_path = ['data/grib/cfsr/'+str(self.date.year)+'/'+str(self.date.month).zfill(2)]
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date)
         self.ungrib_prefix = 'CFSR'
         self.is_rda = [False]
+        #Global grid, worth cropping to the domain.
+        self.croppable = True
 
     def get_filename(self):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        outname = ''
-        if self.date.date() > datetime(2011, 04, 01).date():
-            outname = str(self.date.year)[2:]+str(self.date.month).zfill(2)+\
-                      str(self.date.day).zfill(2)+str(self.date.hour).zfill(2)+\
-                      '.cfsrr.t'+str(self.date.hour).zfill(2)+'z.pgrb2f00'
-        else:
-            outname = 'pgbh00.cfsr.'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                       str(self.date.day).zfill(2)+str(self.date.hour).zfill(2)+'.grb2'
-        return outname
+        #The name changed after 2011-04-01, see the DateRule of the spec.
+        return self.SPEC.get_filename(self.date)
 
 
 class InputDataSetCFDDA(InputDataSet):
@@ -227,6 +230,9 @@ class InputDataSetCFDDA(InputDataSet):
     https://rda.ucar.edu/datasets/ds604.0/docs/CFDDA_User_Documentation_Rev3.pdf
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('CFDDA')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -237,8 +243,7 @@ class InputDataSetCFDDA(InputDataSet):
         self.name_prepared = self.get_filename_prepared()
         self.keep_existing_file = True
         self.intervalseconds = 3600
-        self.server_url = ['http://rda.ucar.edu']
-        self.server_path = ['data/ds604.0/'+str(self.date.year)+'/'+str(self.date.month).zfill(2)]
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date)
         self.ungrib_prefix = 'CFDDA'
         self.is_rda = [True]
 
@@ -246,15 +251,14 @@ class InputDataSetCFDDA(InputDataSet):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        return 'cfdda_'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                str(self.date.day).zfill(2)+str(self.date.hour).zfill(2)+'.v2.nc'
+        return self.SPEC.get_filename(self.date)
 
     def get_filename_prepared(self):
         '''
         Generate a filename for the processed output file for a given time
         for this dataset
         '''
-        return self.get_filename()+'.grb1'
+        return self.get_filename()+self.SPEC.prepared
 
     def prepare(self, **args):
         '''
@@ -264,13 +268,14 @@ class InputDataSetCFDDA(InputDataSet):
         logging.info('WPS: Converting netCDF to GRIB1 file for WPS')
         try:
             os.chdir(self.path)
-            for filename in glob.glob('*.nc'):
+            for filename in self._files_to_prepare('*.nc'):
                 process = subprocess.Popen(['ncks', '-3', filename, 'temp.nc'])
                 process.wait()
                 process = subprocess.Popen(['cdo', '-a', '-f', 'grb1', 'copy',
                                             'temp.nc', filename+'.grb1'])
                 process.wait()
                 os.remove('temp.nc')
+                self._mark_prepared(filename, filename+'.grb1')
         except:
             logging.warning('WPS: Converting netCDF to GRIB1 file for WPS Failed')
 
@@ -283,6 +288,9 @@ class InputDataSetERAISFC(InputDataSet):
     NOTE: You need to download the data to your own server then edit this entry.
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('ERAISFC')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -292,18 +300,18 @@ class InputDataSetERAISFC(InputDataSet):
         self.name = self.get_filename()
         self.name_prepared = self.get_filename()
         self.keep_existing_file = True
-	    #You need to download the data and put it on an ftp server yourself.
-        self.server_url = ['ftp://10.118.50.245']
-        self.server_path = ['/pub']
+	    #You need to download the data and put it on an ftp server yourself (see registry.py).
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date)
         self.is_rda = [False]
+        #Large file, download it in parallel segments.
+        self.segments = 4
         self.ungrib_prefix = 'ERAI'
 
     def get_filename(self):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-
-        return 'ERA-Int_sfc_'+str(self.date.year)+str(self.date.month).zfill(2)+'01.grb'
+        return self.SPEC.get_filename(self.date)
 
 
 
@@ -313,6 +321,9 @@ class InputDataSetERAIML(InputDataSet):
     NOTE: You need to download the data to your own server then edit this entry.
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('ERAIML')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -322,14 +333,15 @@ class InputDataSetERAIML(InputDataSet):
         self.name = self.get_filename()
         self.name_prepared = self.get_filename()
         self.keep_existing_file = True
-        #You need to download the data and put it on an ftp server yourself.
-        self.server_url = ['ftp://10.118.50.245']
-        self.server_path = ['/pub']
+        #You need to download the data and put it on an ftp server yourself (see registry.py).
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date)
         self.is_rda = [False]
+        #Large file, download it in parallel segments.
+        self.segments = 4
         self.ungrib_prefix = 'ERAI'
 
     def get_filename(self):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        return 'ERA-Int_ml_'+str(self.date.year)+str(self.date.month).zfill(2)+'01.grb'
+        return self.SPEC.get_filename(self.date)
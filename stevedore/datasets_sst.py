@@ -42,14 +42,17 @@ import time
 from datetime import datetime, timedelta
 import subprocess
 import shutil
-import glob
 from inputdataset import *
+from registry import get_spec
 
 class InputDataSetSSTNCEP(InputDataSet):
     '''
     NCEP Sea Surface Temperature (SST) input data set file in grib format.
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('SSTNCEP')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -66,16 +69,10 @@ class InputDataSetSSTNCEP(InputDataSet):
             self.date = self.date + timedelta(hours=self.hour)
         self.name = self.get_filename()
         self.name_prepared = self.get_filename()
-        if self.date.date() == datetime.today().date():
-            self.keep_existing_file = False
-            self.server_url = ['ftp://ftp.ncep.noaa.gov']
-            self.date_sst = self.get_sst_date()
-            self.server_path = ['pub/data/nccf/com/gfs/prod/sst.'+str(self.date_sst.year)+\
-                                str(self.date_sst.month).zfill(2)+str(self.date_sst.day).zfill(2)]
-        else:
-            self.keep_existing_file = True
-            self.server_url = ['ftp://polar.ncep.noaa.gov']
-            self.server_path = ['pub/history/sst/ophi']
+        self.date_sst = self.date
+        #Today's file is on the NCEP real-time server and changes during the day.
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date_sst)
+        self.keep_existing_file = self.SPEC.rule_of(self.date) is None
 
         self.ungrib_prefix = 'SSTNCEP'
 
@@ -91,15 +88,7 @@ class InputDataSetSSTNCEP(InputDataSet):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        filename = ''
-        if self.date.date() == datetime.today().date():
-            filename = 'rtgssthr_grb_0.083.grib2'
-        else:
-            self.date_sst = self.date
-            filename = 'rtg_sst_grb_hr_0.083.'+str(self.date_sst.year)+\
-                        str(self.date_sst.month).zfill(2) + str(self.date_sst.day).zfill(2)
-
-        return filename
+        return self.SPEC.get_filename(self.date)
 
 
 
@@ -109,6 +98,9 @@ class InputDataSetSSTOISST(InputDataSet):
     This is a daily sst.
     '''
 
+    #File names and servers, see registry.py.
+    SPEC = get_spec('SSTOISST')
+
     # pylint: disable=too-many-instance-attributes
     def __init__(self, date, hour, path, **args):
         InputDataSet.__init__(self, date, hour, path, **args)
@@ -125,11 +117,7 @@ class InputDataSetSSTOISST(InputDataSet):
         self.name = self.get_filename()
         self.name_prepared = self.get_filename_prepared()
         self.keep_existing_file = True
-        self.server_url = ['http://www.ncei.noaa.gov', 'ftp://eclipse.ncdc.noaa.gov']
-        self.server_path = ['data/sea-surface-temperature-optimum-interpolation/'
-                            'access/avhrr-only/'+str(self.date.year)+\
-                             str(self.date.month).zfill(2), '/pub/oisst/NetCDF/'+\
-                             str(self.date.year)+'/AVHRR/']
+        self.server_url, self.server_path = self.SPEC.get_servers(self.date)
         self.ungrib_prefix = 'SSTOI'
         self.ungrib = True
 
@@ -143,25 +131,29 @@ class InputDataSetSSTOISST(InputDataSet):
         '''
         Generate a filename to download for this dataset for the time given.
         '''
-        #get the delta from     current time:
-        deltadate = datetime.today().date() - self.date.date()
-        name_out = ''
-        #There seams to be 17 days of _preliminary files... Not sure why 17 but there you go.
-        if deltadate.days < 17:
-            name_out = 'avhrr-only-v2.'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                       str(self.date.day).zfill(2)+'_preliminary.nc'
-        else:
-            name_out = 'avhrr-only-v2.'+str(self.date.year)+str(self.date.month).zfill(2)+\
-                       str(self.date.day).zfill(2)+'.nc'
-
-        return name_out
+        #The files of the last 17 days are _preliminary, see the DateRule of the spec.
+        return self.SPEC.get_filename(self.date)
 
     def get_filename_prepared(self):
         '''
         Generate a filename for the processed output file for a given time
         for this dataset
         '''
-        return self.get_filename()+'.grb2'
+        return self.get_filename()+self.SPEC.prepared
+
+    def get_alternatives(self):
+        '''
+        The final file if it is out already, the preliminary one otherwise.
+        Which one is out does not always follow the 17 day rule of get_filename.
+        '''
+        return [self.SPEC.filename(self.date)]+[rule.filename(self.date) for rule in self.SPEC.rules]
+
+    def use_name(self, name):
+        '''
+        Download the file under name and prepare it to name.grb2.
+        '''
+        self.name = name
+        self.name_prepared = name+'.grb2'
 
     def prepare(self, **args):
         '''
@@ -170,7 +162,7 @@ class InputDataSetSSTOISST(InputDataSet):
         '''
         try:
             os.chdir(self.path)
-            for filename in glob.glob('*.nc'):
+            for filename in self._files_to_prepare('*.nc'):
                 logging.info('WPS: Converting '+filename+' netCDF to GRIB2 file for WPS')
                 process = subprocess.Popen(['ncks', '-3', '-v', 'sst', filename,
                                             'temp.nc'])
@@ -191,6 +183,7 @@ class InputDataSetSSTOISST(InputDataSet):
                 os.remove('temp.nc')
                 os.remove('temp.grb2')
                 os.remove('temp2.grb2')
+                self._mark_prepared(filename, filename+'.grb2')
         except:
             logging.warning('OISST prepare failure')
 
@@ -219,6 +212,9 @@ class InputDataSetSSTJPL(InputDataSet):
                             str(self.date.year)+'/'+str(self.date.strftime("%j")).zfill(3)]
         self.ungrib_prefix = 'SSTJPL'
         self.is_rda = [False]
+        #Large file, download it in parallel segments.
+        self.segments = 4
+        self.decompress = 'bz2'
 
     def get_sst_date(self):
         '''
@@ -249,14 +245,12 @@ class InputDataSetSSTJPL(InputDataSet):
         Steps to transform the downloaded input data into the files needed
         by WPS or by other functions as required
         '''
-        pre_processing_input_dir = ''
         lon_min = []
         lon_max = []
         lat_min = []
         lat_max = []
 
         if args:
-            pre_processing_input_dir = args['pre_processing_input_dir']
             lon_min = args['lon_min']
             lon_max = args['lon_max']
             lat_min = args['lat_min']
@@ -267,49 +261,19 @@ class InputDataSetSSTJPL(InputDataSet):
 
         os.chdir(self.path)
         try:
-            for filename in glob.glob('*.bz2'):
-
-                process = subprocess.Popen(['bunzip2', filename])
-                process.wait()
-
-                logging.info('WPS: Extracting latitude/longitude'
-                             ' bounding box from JPL SST with max lat ')
-
-                process = subprocess.Popen(['ncea', '-d', 'lat,'+\
-                                             str(lat_min[0])+','+str(lat_max[0]),
-                                            '-d', 'lon,'+str(lon_min[0])+','+str(lon_max[0]),
-                                            filename[0:-4], 'sst.nc'])
-                process.wait()
-
-                logging.info('WPS: Running Poisson Interpolation to fill land mask')
-                process = subprocess.Popen(['ncl', pre_processing_input_dir+\
-                                            '/interpolate_SST-JPL.ncl'])
-                process.wait()
-
-                process = subprocess.Popen(['ncrename', '-O', '-v', 'SST,T', 'interp.nc'])
-                process.wait()
-                process = subprocess.Popen(['ncks', '-3', '-v', 'lat,lon,T,time',
-                                            'interp.nc', 'sst1.nc'])
-                process.wait()
+            for filename in self._files_to_prepare('*.bz2'):
 
-                logging.info('WPS: Converting netCDF to GRIB2 file for WPS')
-                process = subprocess.Popen(['cdo', '-a', '-f', 'grb2', 'copy',
-                                            'sst1.nc', 'sst1.grb2'])
-                process.wait()
-
-                logging.info('WPS: Inverting latitudes in GRIB2 file')
-                process = subprocess.Popen(['cdo', 'invertlat', 'sst1.grb2', 'sst2.grb2'])
-                process.wait()
+                self._decompress(filename)
 
-                process = subprocess.Popen(['wgrib2', 'sst2.grb2', '-set_center',
-                                            '7', '-grib_out', filename[0:-4]+'.grb2'])
-                process.wait()
+                #numpy is only needed here, the package works without it.
+                from sstprep import prepare_sst
 
-                os.remove('interp.nc')
-                os.remove('sst.nc')
-                os.remove('sst1.nc')
-                os.remove('sst1.grb2')
-                os.remove('sst2.grb2')
+                #Crop to the domain, fill the land mask and write GRIB2 for WPS in one go.
+                logging.info('WPS: Preparing the JPL SST of the bounding box for WPS')
+                prepare_sst(filename[0:-4], filename[0:-4]+'.grb2', 'analysed_sst', self.date,
+                            {'lon_min': lon_min[0], 'lon_max': lon_max[0],
+                             'lat_min': lat_min[0], 'lat_max': lat_max[0]})
+                self._mark_prepared(filename, filename[0:-4]+'.grb2')
 
         except:
             logging.warning('JPL prepare failure')
@@ -340,6 +304,8 @@ class InputDataSetSSTSPORT(InputDataSet):
         self.server_path = ['SPoRT/sst/northHemis/grib2', 'data/grib/sst']
         self.ungrib_prefix = 'SSTSPORT'
         self.server_pos = 0
+        if self.name.endswith('.gz'):
+            self.decompress = 'gz'
 
     def get_filename(self):
         '''
@@ -386,68 +352,29 @@ class InputDataSetSSTSPORT(InputDataSet):
         Steps to transform the downloaded input data into the files needed
         by WPS or by other functions as required
         '''
-
-        pre_processing_input_dir = ''
-        #If prepare has been called properly
-        if args:
-            pre_processing_input_dir = args['pre_processing_input_dir']
-        else:
-            logging.error('Error prepare will not function correctly for '+ str(self.type))
-
-
         glob_txt = '*.gz'
         if self.server_pos == 1:
             glob_txt = '*.grb2'
 
         try:
             os.chdir(self.path)
-            for filename in glob.glob(glob_txt):
+            for filename in self._files_to_prepare(glob_txt):
 
                 if self.server_pos == 0:
-                    process = subprocess.Popen(['gunzip', filename])
-                    process.wait()
+                    self._decompress(filename)
 
                 logging.info('WPS: SST-SPORT: Converting GRIB2 file to netCDF file for processing')
                 process = subprocess.Popen(['wgrib2', filename[0:-3], '-netcdf', 'sst.nc'])
                 process.wait()
 
-                logging.info('WPS: SST-SPORT: Assigning attributes to TMP_surface')
-                process = subprocess.Popen(['ncatted', '-O', '-a',
-                                            '_FillValue,TMP_surface,o,f,-9999', 'sst.nc'])
-                process.wait()
-
-                logging.info('WPS: Running Poisson Interpolation to fill land mask')
-                process = subprocess.Popen(['ncl', pre_processing_input_dir+\
-                                            '/interpolate_SST-SPORT.ncl'])
-                process.wait()
-
-                process = subprocess.Popen(['ncrename', '-O', '-v', 'SST,T', 'interp.nc'])
-                process.wait()
-
-                process = subprocess.Popen(['ncks', '-3', '-v', 'latitude,longitude,T,time',
-                                            'interp.nc', 'sst1.nc'])
-                process.wait()
-
-                logging.info('WPS: Converting netCDF back to GRIB2 for WPS')
-                process = subprocess.Popen(['cdo', '-a', '-f', 'grb2', 'copy',
-                                            'sst1.nc', 'sst1.grb2'])
-                process.wait()
-
-                logging.info('WPS: Inverting latitudes in GRIB2 file')
-                process = subprocess.Popen(['cdo', 'invertlat', 'sst1.grb2',
-                                            'sst2.grb2'])
-                process.wait()
-
-                process = subprocess.Popen(['wgrib2', 'sst2.grb2', '-set_center',
-                                            '7', '-grib_out', filename[0:-3]+'.grb2'])
-                process.wait()
+                #Land points are missing values (_FillValue) of TMP_surface.
+                from sstprep import prepare_sst
+                logging.info('WPS: SST-SPORT: Filling the land mask and writing GRIB2 for WPS')
+                prepare_sst('sst.nc', filename[0:-3]+'.grb2', 'TMP_surface', self.get_sst_date())
 
-                os.remove('interp.nc')
                 os.remove('sst.nc')
-                os.remove('sst1.nc')
-                os.remove('sst1.grb2')
-                os.remove('sst2.grb2')
                 os.remove(filename[0:-3])
+                self._mark_prepared(filename, filename[0:-3]+'.grb2')
 
         except:
             logging.warning('SPORT prepare failure')
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Decompression of .gz and .bz2 files while they are downloaded, so that
+    the compressed file does not have to be read back and written out again
+    once the download is over. bzip2 files made of several streams (i.e.
+    written by pbzip2) have their streams decoded on several threads.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import os
+import re
+import bz2
+import zlib
+import threading
+import multiprocessing
+from gribstream import GribError
+
+#Start of a bzip2 stream: 'BZh', the block size and the magic number of its first block.
+BZ2_STREAM = re.compile(r'BZh[1-9]1AY&SY')
+
+#Length of the start of a bzip2 stream.
+BZ2_STREAM_LENGTH = 10
+
+
+class DecompressError(GribError):
+    '''
+    Raised when a compressed file is truncated or corrupt. A GribError at offset 0
+    so that the Downloader throws the data away and downloads the file again.
+    '''
+
+    def __init__(self, message):
+        GribError.__init__(self, message, 0)
+
+
+class Bz2Job(object):
+    '''
+    Decodes one complete bzip2 stream on a thread of its own.
+    '''
+
+    def __init__(self, data):
+        self.data = data
+        self.output = None
+        self.error = None
+        #Whether the data held the whole stream.
+        self.ended = False
+        self.thread = threading.Thread(target=self._run, name='bunzip2')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        """
+        Decode the stream. bz2 lets other threads run while it works.
+        """
+        output = []
+        data = self.data
+        try:
+            while data:
+                decompressor = bz2.BZ2Decompressor()
+                output.append(decompressor.decompress(data))
+                data = decompressor.unused_data
+            self.ended = _bz2_ended(decompressor)
+        except IOError, err:
+            self.error = err
+        self.output = ''.join(output)
+        self.data = None
+
+
+def _bz2_ended(decompressor):
+    """
+    True if decompressor has seen the end of its stream.
+    """
+    if decompressor.unused_data:
+        return True
+    try:
+        decompressor.decompress('')
+    except EOFError:
+        return True
+    return False
+
+
+def _gz_ended(decompressor):
+    """
+    True if decompressor has seen the end of its gzip member.
+    """
+    if decompressor.unused_data:
+        return True
+    #Data after the end of a member is left over, anything else is taken as more input.
+    probe = decompressor.copy()
+    try:
+        probe.decompress('\0')
+    except zlib.error:
+        return False
+    return probe.unused_data != ''
+
+
+class StreamDecompressor(object):
+    '''
+    Decompresses a .gz or .bz2 file fed to it in pieces, in order, into
+    destination. It follows a download the same way a gribstream.GribValidator
+    does, so the Downloader can decompress a file while it arrives.
+    '''
+
+    #Number of bzip2 streams decoded at the same time.
+    WORKERS = multiprocessing.cpu_count()
+
+    #A bzip2 stream longer than this (i.e. a file written by bzip2 rather than
+    #pbzip2) is decoded as it arrives instead of waiting for its end.
+    SERIAL_SIZE = 8*1024*1024
+
+    def __init__(self, fmt, destination):
+        '''
+        Constructor of a StreamDecompressor object.
+        fmt is 'gz' or 'bz2'.
+        '''
+        if fmt not in ('gz', 'bz2'):
+            raise ValueError('Unknown compression '+str(fmt))
+        self.fmt = fmt
+        self.destination = destination
+        #Decompressed data is written here and moved to destination once complete.
+        self.part = destination+'.part'
+        self._outfile = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything seen so far to decompress a file from the start again.
+        """
+        #Number of compressed bytes fed so far.
+        self.offset = 0
+        #Number of decompressed bytes written.
+        self.written = 0
+        if self._outfile is not None:
+            self._outfile.close()
+            self._outfile = None
+
+        self._gz = zlib.decompressobj(16+zlib.MAX_WBITS)
+        #bzip2 streams waiting to be written, in order.
+        self._jobs = []
+        #Start of the bzip2 stream still arriving, its size and its last bytes.
+        self._chunks = []
+        self._size = 0
+        self._tail = ''
+        #Decompressor of a long bzip2 stream decoded as it arrives.
+        self._bz2 = None
+
+    def feed(self, data):
+        """
+        Decompress the next piece of the file. Raises DecompressError as soon
+        as something is wrong.
+        """
+        try:
+            if self.fmt == 'gz':
+                self._feed_gz(data)
+            else:
+                self._feed_bz2(data)
+        except (zlib.error, IOError), err:
+            raise DecompressError('Corrupt '+self.fmt+' data before byte '+
+                                  str(self.offset+len(data))+': '+str(err))
+        self.offset = self.offset + len(data)
+
+    def finish(self):
+        """
+        Check that the file is complete and move it to destination.
+        """
+        if self.fmt == 'gz':
+            ended = self.offset > 0 and _gz_ended(self._gz)
+            self._write(self._gz.flush())
+        elif self._bz2 is not None:
+            ended = _bz2_ended(self._bz2)
+        else:
+            if self._chunks:
+                self._jobs.append(Bz2Job(''.join(self._chunks)))
+                self._chunks = []
+            ended = self.offset > 0
+            while self._jobs:
+                self._write_job()
+
+        if not ended:
+            raise DecompressError(self.fmt+' file truncated after '+str(self.offset)+' bytes')
+
+        self._write('')
+        self._outfile.close()
+        self._outfile = None
+        os.rename(self.part, self.destination)
+
+    def catch_up(self, filename, end):
+        """
+        Feed the bytes of filename from what has been decompressed so far up to end.
+        """
+        if self.offset >= end:
+            return
+        with open(filename, 'rb') as infile:
+            infile.seek(self.offset)
+            while self.offset < end:
+                data = infile.read(min(1024*1024, end-self.offset))
+                if not data:
+                    break
+                self.feed(data)
+
+    def _write(self, data):
+        """
+        Append decompressed data to the output file.
+        """
+        if self._outfile is None:
+            self._outfile = open(self.part, 'wb')
+        self._outfile.write(data)
+        self.written = self.written + len(data)
+
+    def _feed_gz(self, data):
+        """
+        Decompress gzip data. A file may be made of several gzip members.
+        """
+        while data:
+            self._write(self._gz.decompress(data))
+            data = self._gz.unused_data
+            if data:
+                self._write(self._gz.flush())
+                self._gz = zlib.decompressobj(16+zlib.MAX_WBITS)
+
+    def _feed_bz2(self, data):
+        """
+        Cut bzip2 data into streams and hand every complete stream to a thread.
+        """
+        while data:
+            if self._bz2 is not None:
+                data = self._decode_serial(data)
+                continue
+
+            #Look for the start of the next stream, which may begin in the bytes seen last.
+            base = self._size-len(self._tail)
+            window = self._tail+data
+            found = None
+            for match in BZ2_STREAM.finditer(window):
+                if base+match.start() > 0:
+                    found = base+match.start()
+                    break
+
+            if found is None:
+                self._chunks.append(data)
+                self._size = self._size + len(data)
+                self._tail = window[-(BZ2_STREAM_LENGTH-1):]
+                if self._size > self.SERIAL_SIZE:
+                    data = self._start_serial()
+                    continue
+                return
+
+            stream = ''.join(self._chunks)+data
+            self._chunks = []
+            self._size = 0
+            self._tail = ''
+            if len(self._jobs) >= self.WORKERS:
+                self._write_job()
+            self._jobs.append(Bz2Job(stream[:found]))
+            data = stream[found:]
+
+    def _start_serial(self):
+        """
+        Decode the stream arriving as it comes, once the streams before it are written.
+        Returns the data after the end of the stream if it ended already.
+        """
+        while self._jobs:
+            self._write_job()
+        data = ''.join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        self._tail = ''
+        self._bz2 = bz2.BZ2Decompressor()
+        return self._decode_serial(data)
+
+    def _decode_serial(self, data):
+        """
+        Feed data to the decompressor of the stream decoded as it arrives.
+        Returns the data after the end of the stream, if any.
+        """
+        try:
+            self._write(self._bz2.decompress(data))
+        except EOFError:
+            #The stream ended with the previous piece.
+            self._bz2 = None
+            return data
+        data = self._bz2.unused_data
+        if data:
+            self._bz2 = None
+        return data
+
+    def _write_job(self):
+        """
+        Wait for the oldest bzip2 stream and write it out.
+        """
+        job = self._jobs.pop(0)
+        job.thread.join()
+        if job.error is not None:
+            raise DecompressError('Corrupt bz2 stream: '+str(job.error))
+        if not job.ended:
+            raise DecompressError('bz2 stream truncated')
+        self._write(job.output)
+
+
+def decompress_file(source, destination, fmt):
+    """
+    Decompress the file source into destination.
+    """
+    decompressor = StreamDecompressor(fmt, destination)
+    decompressor.catch_up(source, os.path.getsize(source))
+    decompressor.finish()
@@ -0,0 +1,912 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    In-process HTTP/FTP download client used by InputDataSet.download().
+    Connections are kept open and reused per host so that fetching many
+    files from the same server costs one handshake / login rather than one
+    per file.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import os
+import re
+import logging
+import socket
+import threading
+import time
+import ftplib
+import httplib
+import urllib
+import urlparse
+from collections import deque
+from contextlib import contextmanager
+from partialfile import PartialFile
+from scheduler import get_host_limits
+from gribstream import GribError
+
+
+class DownloadError(Exception):
+    '''
+    Raised when a url could not be downloaded.
+    '''
+
+    def __init__(self, message, url=None, status=None, retry=True):
+        Exception.__init__(self, message)
+        self.url = url
+        #HTTP status or FTP reply code if there was one.
+        self.status = status
+        #False if trying again will not help (i.e. the file does not exist).
+        self.retry = retry
+
+
+class Transfer(object):
+    '''
+    An open transfer of a single url. Data is pulled from it with read().
+    '''
+
+    def __init__(self, url, status, headers, size, reader, release):
+        self.url = url
+        #HTTP status code (226 is used for FTP transfers)
+        self.status = status
+        #Response headers with lower case keys.
+        self.headers = headers
+        #Number of bytes this transfer will deliver or None if unknown.
+        self.size = size
+        self._reader = reader
+        self._release = release
+        self._received = 0
+        self._closed = False
+
+    def read(self, size):
+        """
+        Read up to size bytes. An empty string marks the end of the transfer.
+        """
+        #Never read past the end of what was asked for (i.e. a segment of an FTP file).
+        if self.size is not None:
+            size = min(size, self.size-self._received)
+            if size <= 0:
+                return ''
+        data = self._reader(size)
+        self._received = self._received + len(data)
+        return data
+
+    def complete(self):
+        """
+        True if everything the server announced has been read.
+        """
+        return self.size is None or self._received >= self.size
+
+    def close(self):
+        """
+        Finish the transfer. The connection is returned to the pool only if
+        the transfer was read to the end.
+        """
+        if not self._closed:
+            self._closed = True
+            self._release(self.complete())
+
+
+class Downloader(object):
+    '''
+    A download client that keeps HTTP and FTP connections open per host and
+    reuses them for every file fetched from that host.
+    '''
+
+    #Attempts per url before giving up (same as wget -t 5)
+    RETRIES = 5
+
+    #Seconds to wait between attempts (same as wget --waitretry=17)
+    WAIT_RETRY = 17
+
+    #Socket timeout in seconds.
+    TIMEOUT = 120
+
+    #Number of bytes read from the network at a time.
+    BLOCK_SIZE = 1024*1024
+
+    #Maximum number of HTTP redirects to follow.
+    MAX_REDIRECTS = 5
+
+    #HTTP status codes of a redirect.
+    REDIRECT_STATUS = [301, 302, 303, 307, 308]
+
+    #HTTP status codes worth trying again.
+    RETRY_STATUS = [408, 429, 500, 502, 503, 504]
+
+    #Bytes written between two updates of the journal of a partial download.
+    JOURNAL_INTERVAL = 16*1024*1024
+
+    #Files are not split into segments smaller than this.
+    MIN_SEGMENT = 8*1024*1024
+
+    def __init__(self):
+        '''
+        Constructor of a Downloader object.
+        '''
+        self._lock = threading.Lock()
+        #Idle connections per (scheme, host, port)
+        self._idle = {}
+        #Seconds the last request to each host took to answer.
+        self._latency = {}
+        #The throttle of the transfers of each thread (see throttled).
+        self._local = threading.local()
+
+    @contextmanager
+    def throttled(self, throttle):
+        """
+        Within the with block, call throttle(nbytes) with every block read by the
+        transfers of the calling thread and of the segments it starts. throttle
+        may sleep (i.e. TokenBucket.consume) to hold the transfer to a rate.
+        """
+        previous = getattr(self._local, 'throttle', None)
+        self._local.throttle = throttle
+        try:
+            yield
+        finally:
+            self._local.throttle = previous
+
+    def fetch(self, url, destination, headers=None, segments=1, validator=None, retries=None):
+        """
+        Download url to the file destination. Tries RETRIES times, waiting
+        WAIT_RETRY seconds between attempts. Each attempt carries on from the data
+        the previous one (or a previous run) left in destination+'.part'.
+        With segments > 1 up to that many parts of the file are downloaded at the
+        same time, as far as the host limits allow. If a validator
+        (gribstream.GribValidator) is given the data is checked as it arrives and
+        the download resumes from the last good message if it is corrupt. A
+        decompress.StreamDecompressor given instead decompresses the data as it arrives.
+        retries overrides RETRIES. Returns the size of the file.
+        """
+        part = PartialFile(destination)
+
+        def attempt():
+            if validator is not None:
+                validator.reset()
+            size = None
+            #The size is needed to split the file or to check that earlier data is still valid.
+            if segments > 1 or os.path.isfile(part.journal):
+                size = self.size(url, headers)
+
+            if size is None:
+                #Read the whole file from the start.
+                transfer = self.open(url, headers=headers)
+                part.open(url, transfer.size)
+                self._fetch_piece(url, headers, part, 0, None, transfer, validator)
+            else:
+                part.open(url, size)
+                self._fetch_missing(url, headers, part, segments, validator)
+
+            if part.size is not None and not part.is_complete():
+                raise DownloadError('Transfer of '+url+' is incomplete', url)
+
+            #Check what was not seen while downloading (i.e. segments fetched in parallel).
+            if validator is not None:
+                try:
+                    validator.catch_up(part.part, os.path.getsize(part.part))
+                    validator.finish()
+                except GribError as err:
+                    part.truncate(err.offset)
+                    raise DownloadError(str(err)+' in '+url, url)
+            part.finish()
+            return os.path.getsize(destination)
+
+        return self._retry(url, attempt, retries)
+
+    def size(self, url, headers=None):
+        """
+        Return the size of url in bytes. None if the server does not say or
+        can not send parts of the file, which then has to be read from the start.
+        """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme == 'ftp':
+            return self._ftp_size(url)
+
+        try:
+            transfer = self.open(url, headers=headers, offset=0, length=1)
+        except DownloadError as err:
+            if err.status == 200:
+                return None
+            raise
+        self._read(transfer, 1)
+        transfer.close()
+
+        #i.e. Content-Range: bytes 0-0/1234
+        found = re.match(r'bytes\s+\d+-\d+/(\d+)', transfer.headers.get('content-range', ''))
+        if found is None:
+            return None
+        return int(found.group(1))
+
+    def version(self, url, headers=None):
+        """
+        What identifies the copy of url on the server: a dictionary of its
+        'etag', 'last_modified' (Last-Modified over HTTP, MDTM over FTP) and
+        'size', each None if the server does not say.
+        """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme == 'ftp':
+            return self._retry(url, lambda: self._ftp_version(url))
+
+        def attempt():
+            transfer = self.open(url, headers=headers, offset=0, length=1)
+            self._read(transfer, 1)
+            transfer.close()
+            found = re.match(r'bytes\s+\d+-\d+/(\d+)', transfer.headers.get('content-range', ''))
+            return {'etag': transfer.headers.get('etag'),
+                    'last_modified': transfer.headers.get('last-modified'),
+                    'size': None if found is None else int(found.group(1))}
+
+        return self._retry(url, attempt)
+
+    def is_unchanged(self, url, version, headers=None):
+        """
+        True if url on the server is still the copy described by version (see
+        version()). Over HTTP the server is asked with a conditional request.
+        """
+        request_headers = dict(headers or {})
+        if version.get('etag'):
+            request_headers['If-None-Match'] = version['etag']
+        if version.get('last_modified') and not url.startswith('ftp'):
+            request_headers['If-Modified-Since'] = version['last_modified']
+        try:
+            current = self.version(url, request_headers)
+        except DownloadError as err:
+            if err.status == 304:
+                return True
+            raise
+        return same_version(version, current)
+
+    def _fetch_missing(self, url, headers, part, segments, validator=None):
+        """
+        Download the ranges of part not yet on disk, splitting them into segments
+        fetched in parallel. The calling thread downloads one segment with the
+        host slot it already holds, the others only run while a slot is free.
+        The validator only follows the data live if it all arrives in order.
+        """
+        pieces = deque(self._split(part.missing(), segments))
+        limits = get_host_limits()
+        host = limits.host_of(url)
+        extra = 0
+        while extra < min(segments, len(pieces))-1 and limits.try_acquire(host):
+            extra = extra + 1
+        if extra:
+            logging.info('Downloader: fetching '+url+' in '+str(len(pieces))+' segments with '+
+                         str(extra+1)+' connections')
+            validator = None
+
+        errors = []
+        throttle = getattr(self._local, 'throttle', None)
+
+        def worker():
+            while True:
+                try:
+                    first, last = pieces.popleft()
+                except IndexError:
+                    return
+                try:
+                    self._fetch_piece(url, headers, part, first, last, validator=validator)
+                except Exception as err:
+                    errors.append(err)
+                    return
+
+        def extra_worker():
+            try:
+                with self.throttled(throttle):
+                    worker()
+            finally:
+                limits.release(host)
+
+        threads = [threading.Thread(target=extra_worker, name='segment-'+str(host))
+                   for _ in range(extra)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        worker()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+    def _split(self, missing, segments):
+        """
+        Cut the missing (first, last) ranges into at most about segments pieces.
+        """
+        if segments <= 1:
+            return missing
+        total = sum(last-first+1 for first, last in missing)
+        piece = max(self.MIN_SEGMENT, (total+segments-1)/segments)
+        pieces = []
+        for first, last in missing:
+            while first <= last:
+                pieces.append((first, min(last, first+piece-1)))
+                first = first+piece
+        return pieces
+
+    def _fetch_piece(self, url, headers, part, first, last, transfer=None, validator=None):
+        """
+        Download bytes first to last (None for the end of the file) of url into
+        the partial file part, recording progress in its journal as it goes.
+        A corrupt message found by validator ends the transfer and is dropped
+        from the journal so that the next attempt fetches it again.
+        """
+        if transfer is None:
+            length = None if last is None else last-first+1
+            transfer = self.open(url, headers=headers, offset=first, length=length)
+
+        position = first
+        journaled = first
+        outfile = open(part.part, 'r+b')
+        try:
+            outfile.seek(first)
+            try:
+                #Check the data on disk before this piece first.
+                if validator is not None:
+                    validator.catch_up(part.part, first)
+                while True:
+                    data = self._read(transfer, self.BLOCK_SIZE)
+                    if not data:
+                        break
+                    outfile.write(data)
+                    position = position + len(data)
+                    if validator is not None:
+                        validator.feed(data)
+                    if position-journaled >= self.JOURNAL_INTERVAL:
+                        self._sync(outfile)
+                        part.record(journaled, position-1)
+                        journaled = position
+            finally:
+                transfer.close()
+                #Keep whatever did arrive for the next attempt.
+                self._sync(outfile)
+                part.record(journaled, position-1)
+        except GribError as err:
+            part.truncate(err.offset)
+            raise DownloadError(str(err)+' in '+url, url)
+        finally:
+            outfile.close()
+
+        if not transfer.complete():
+            raise DownloadError('Transfer of '+url+' ended early after '+
+                                str(position-first)+' of '+str(transfer.size)+' bytes', url)
+
+    @staticmethod
+    def _sync(outfile):
+        """
+        Make sure everything written to outfile is on disk.
+        """
+        outfile.flush()
+        os.fsync(outfile.fileno())
+
+    def fetch_ranges(self, url, ranges, destination, headers=None, validator=None):
+        """
+        Download only the byte ranges of url, a list of (first, last) tuples
+        (last may be None for the end of the file), into destination one after
+        the other and check the result with validator if given. destination
+        is only replaced once every range has arrived and been checked.
+        Returns the number of bytes written.
+        """
+        written = 0
+        part = destination+PartialFile.PART_SUFFIX
+        outfile = open(part, 'wb')
+        try:
+            for first, last in ranges:
+                length = None if last is None else last-first+1
+                start = outfile.tell()
+
+                def attempt(first=first, length=length, start=start):
+                    outfile.seek(start)
+                    outfile.truncate()
+                    return self._copy(self.open(url, headers=headers, offset=first,
+                                                length=length), outfile)
+
+                written = written + self._retry(url, attempt)
+        finally:
+            outfile.close()
+
+        if validator is not None:
+            validator.reset()
+            try:
+                validator.catch_up(part, written)
+                validator.finish()
+            except GribError as err:
+                raise DownloadError(str(err)+' in ranges of '+url, url)
+        os.rename(part, destination)
+        return written
+
+    def read_url(self, url, headers=None):
+        """
+        Return the content of a small file such as an inventory or a listing.
+        """
+        def attempt():
+            data = []
+            transfer = self.open(url, headers=headers)
+            try:
+                while True:
+                    block = self._read(transfer, self.BLOCK_SIZE)
+                    if not block:
+                        break
+                    data.append(block)
+            finally:
+                transfer.close()
+            if not transfer.complete():
+                raise DownloadError('Transfer of '+url+' ended early', url)
+            return ''.join(data)
+
+        return self._retry(url, attempt)
+
+    def list_directory(self, url, headers=None):
+        """
+        Names of the files in the directory url: an NLST over FTP, the links of
+        the index page over HTTP. A directory that does not exist (yet) is empty.
+        """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme == 'ftp':
+            return self._retry(url, lambda: self._ftp_list(url))
+
+        try:
+            page = self.read_url(url.rstrip('/')+'/', headers=headers)
+        except DownloadError as err:
+            if err.status == 404:
+                return []
+            raise
+        names = []
+        for link in re.findall(r'href\s*=\s*["\']?([^"\'\s>]+)', page, re.IGNORECASE):
+            #Skip sort links, parent directories and links off this directory.
+            if link.startswith('?') or link.startswith('/') or link.startswith('..') or \
+               '://' in link:
+                continue
+            name = urllib.unquote(link.rstrip('/').rsplit('/', 1)[-1])
+            if name and name not in names:
+                names.append(name)
+        return names
+
+    def post(self, url, body, headers=None):
+        """
+        Send a POST request with a form encoded body over the connection pooled
+        for the host of url. Returns (status, headers, content) of the response,
+        headers being a mimetools.Message so that repeated headers such as
+        Set-Cookie can be read one by one. Redirects are not followed.
+        """
+        request_headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        request_headers.update(headers or {})
+        return self.request(url, 'POST', body, request_headers)
+
+    def request(self, url, method='GET', body=None, headers=None):
+        """
+        Send a single request over the connection pooled for the host of url and
+        read the whole response. Returns (status, headers, content) as post does.
+        """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise DownloadError('Unsupported url '+url, url, retry=False)
+        key = self._key(parts)
+
+        conn, response = self._http_request(key, self._path(parts), headers or {}, method, body)
+        try:
+            content = response.read()
+        except (socket.error, httplib.HTTPException) as err:
+            self._release_http(key, conn, response, False)
+            raise DownloadError('Connection lost reading '+url+': '+str(err), url)
+        self._release_http(key, conn, response, True)
+        return response.status, response.msg, content
+
+    def _retry(self, url, attempt, retries=None):
+        """
+        Call attempt() until it succeeds, RETRIES (or retries) times at most,
+        waiting WAIT_RETRY seconds in between.
+        """
+        count = 0
+        while True:
+            count = count + 1
+            try:
+                return attempt()
+            except DownloadError as err:
+                logging.info('Download attempt '+str(count)+' of '+url+' failed: '+str(err))
+                if not err.retry or count >= (retries or self.RETRIES):
+                    raise
+            time.sleep(self.WAIT_RETRY)
+
+    def _copy(self, transfer, outfile):
+        """
+        Copy everything from transfer into the open file outfile and close the transfer.
+        """
+        try:
+            written = self._write(transfer, outfile)
+        finally:
+            transfer.close()
+
+        if not transfer.complete():
+            raise DownloadError('Transfer of '+transfer.url+' ended early after '+
+                                str(written)+' of '+str(transfer.size)+' bytes', transfer.url)
+        return written
+
+    def _write(self, transfer, outfile):
+        """
+        Copy everything from transfer into the open file outfile.
+        """
+        written = 0
+        while True:
+            data = self._read(transfer, self.BLOCK_SIZE)
+            if not data:
+                break
+            outfile.write(data)
+            written = written + len(data)
+        return written
+
+    def _read(self, transfer, size):
+        """
+        Read from a transfer turning socket level failures into DownloadError.
+        The data read is charged to the throttle of the thread, if any.
+        """
+        try:
+            data = transfer.read(size)
+        except (socket.error, httplib.HTTPException, EOFError) as err:
+            raise DownloadError('Connection lost reading '+transfer.url+': '+str(err),
+                                transfer.url)
+        throttle = getattr(self._local, 'throttle', None)
+        if throttle is not None and data:
+            throttle(len(data))
+        return data
+
+    def open(self, url, headers=None, offset=0, length=None):
+        """
+        Open a transfer for url starting at byte offset. If length is given only
+        that many bytes are read.
+        """
+        parts = urlparse.urlsplit(url)
+        started = time.time()
+        if parts.scheme in ('http', 'https'):
+            transfer = self._open_http(url, headers or {}, offset, length)
+        elif parts.scheme == 'ftp':
+            transfer = self._open_ftp(url, offset, length)
+        else:
+            raise DownloadError('Unsupported url '+url, url, retry=False)
+        with self._lock:
+            self._latency[parts.hostname] = time.time()-started
+        return transfer
+
+    def latency_of(self, host):
+        """
+        Seconds the last request to host took to answer, None if there was none.
+        """
+        with self._lock:
+            return self._latency.get(host)
+
+    def close(self):
+        """
+        Close every idle connection.
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for key in idle:
+            for conn in idle[key]:
+                self._discard(key, conn)
+
+    def _checkout(self, key):
+        """
+        Take an idle connection for key from the pool. Returns None if there is none.
+        """
+        with self._lock:
+            conns = self._idle.get(key)
+            if conns:
+                return conns.pop()
+        return None
+
+    def _checkin(self, key, conn):
+        """
+        Return a connection to the pool.
+        """
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    @staticmethod
+    def _discard(key, conn):
+        """
+        Close a connection that will not be reused.
+        """
+        logging.debug('Downloader: closing connection to '+key[1])
+        try:
+            conn.close()
+        except (socket.error, EOFError, ftplib.Error):
+            pass
+
+    def _connect(self, key):
+        """
+        Make a new connection for key.
+        """
+        scheme, host, port = key
+        logging.debug('Downloader: new connection to '+scheme+'://'+host+':'+str(port))
+        try:
+            if scheme == 'https':
+                return httplib.HTTPSConnection(host, port, timeout=self.TIMEOUT)
+            elif scheme == 'http':
+                return httplib.HTTPConnection(host, port, timeout=self.TIMEOUT)
+
+            conn = ftplib.FTP(timeout=self.TIMEOUT)
+            conn.connect(host, port)
+            conn.login('anonymous', 'anonymous@')
+            conn.voidcmd('TYPE I')
+            return conn
+        except ftplib.error_perm as err:
+            raise DownloadError('FTP login to '+host+' refused: '+str(err), host, retry=False)
+        except (socket.error, ftplib.Error, EOFError) as err:
+            raise DownloadError('Could not connect to '+host+': '+str(err), host)
+
+    @staticmethod
+    def _key(parts):
+        """
+        The pool key for a split url.
+        """
+        default_port = {'http': 80, 'https': 443, 'ftp': 21}[parts.scheme]
+        return (parts.scheme, parts.hostname, parts.port or default_port)
+
+    @staticmethod
+    def _path(parts):
+        """
+        The path of a split url with duplicate slashes collapsed.
+        """
+        path = re.sub('/+', '/', parts.path) or '/'
+        if parts.query:
+            path = path+'?'+parts.query
+        return path
+
+    def _open_http(self, url, headers, offset, length):
+        """
+        Send a GET request for url, following redirects.
+        """
+        for _ in range(self.MAX_REDIRECTS+1):
+            parts = urlparse.urlsplit(url)
+            key = self._key(parts)
+            request_headers = dict(headers)
+            if length is not None:
+                request_headers['Range'] = 'bytes='+str(offset)+'-'+str(offset+length-1)
+            elif offset:
+                request_headers['Range'] = 'bytes='+str(offset)+'-'
+
+            conn, response = self._http_request(key, self._path(parts), request_headers)
+            status = response.status
+            response_headers = dict((k.lower(), v) for k, v in response.getheaders())
+
+            if status in self.REDIRECT_STATUS and 'location' in response_headers:
+                response.read()
+                self._release_http(key, conn, response, True)
+                url = urlparse.urljoin(url, response_headers['location'])
+                logging.debug('Downloader: redirected to '+url)
+                continue
+
+            if status not in (200, 206):
+                response.read()
+                self._release_http(key, conn, response, True)
+                raise DownloadError('HTTP '+str(status)+' '+str(response.reason)+' for '+url,
+                                    url, status, status in self.RETRY_STATUS)
+
+            if (offset or length is not None) and status != 206:
+                response.close()
+                self._discard(key, conn)
+                raise DownloadError('Server ignored range request for '+url, url, status, False)
+
+            size = response_headers.get('content-length')
+            if size is not None:
+                size = int(size)
+
+            def release(completed, key=key, conn=conn, response=response):
+                self._release_http(key, conn, response, completed)
+
+            return Transfer(url, status, response_headers, size, response.read, release)
+
+        raise DownloadError('Too many redirects for '+url, url, retry=False)
+
+    def _http_request(self, key, path, headers, method='GET', body=None):
+        """
+        Send a request on a pooled connection, falling back to a fresh
+        connection if the pooled one was closed by the server while idle.
+        """
+        conn = self._checkout(key)
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = self._connect(key)
+            try:
+                conn.request(method, path, body, headers)
+                return conn, conn.getresponse()
+            except (socket.error, httplib.HTTPException) as err:
+                self._discard(key, conn)
+                conn = None
+                if not reused:
+                    raise DownloadError('HTTP request to '+key[1]+' failed: '+str(err), key[1])
+                reused = False
+
+    def _release_http(self, key, conn, response, completed):
+        """
+        Pool the connection if the response was read to the end and the server
+        is happy to keep it open.
+        """
+        if completed and not response.will_close:
+            response.close()
+            self._checkin(key, conn)
+        else:
+            response.close()
+            self._discard(key, conn)
+
+    def _ftp_size(self, url):
+        """
+        The size of an FTP file or None if the server does not support SIZE.
+        """
+        parts = urlparse.urlsplit(url)
+        key = self._key(parts)
+        conn = self._checkout(key) or self._connect(key)
+        try:
+            size = conn.size(self._path(parts).lstrip('/'))
+        except ftplib.error_perm:
+            self._checkin(key, conn)
+            return None
+        except (socket.error, ftplib.Error, EOFError) as err:
+            self._discard(key, conn)
+            raise DownloadError('FTP SIZE of '+url+' failed: '+str(err), url)
+        self._checkin(key, conn)
+        return size
+
+    def _ftp_version(self, url):
+        """
+        The MDTM and SIZE of an FTP file, None where the server does not support them.
+        """
+        parts = urlparse.urlsplit(url)
+        key = self._key(parts)
+        path = self._path(parts).lstrip('/')
+        conn = self._checkout(key) or self._connect(key)
+        version = {'etag': None, 'last_modified': None, 'size': None}
+        try:
+            try:
+                #i.e. 213 20170101063012
+                version['last_modified'] = conn.sendcmd('MDTM '+path)[4:].strip()
+            except ftplib.error_perm as err:
+                if str(err)[:3] == '550':
+                    self._checkin(key, conn)
+                    raise DownloadError('FTP '+str(err)+' for '+url, url, '550', False)
+            try:
+                version['size'] = conn.size(path)
+            except ftplib.error_perm:
+                pass
+        except (socket.error, ftplib.Error, EOFError) as err:
+            self._discard(key, conn)
+            raise DownloadError('FTP MDTM of '+url+' failed: '+str(err), url)
+        self._checkin(key, conn)
+        return version
+
+    def _ftp_list(self, url):
+        """
+        The names listed by NLST for the FTP directory url.
+        """
+        parts = urlparse.urlsplit(url)
+        key = self._key(parts)
+        conn = self._checkout(key) or self._connect(key)
+        try:
+            names = conn.nlst(self._path(parts).strip('/') or '/')
+        except ftplib.error_perm as err:
+            self._checkin(key, conn)
+            #Servers answer 550 (or 450) for missing or empty directories.
+            if str(err)[:3] in ('450', '550'):
+                return []
+            raise DownloadError('FTP '+str(err)+' listing '+url, url, str(err)[:3], False)
+        except (socket.error, ftplib.Error, EOFError) as err:
+            self._discard(key, conn)
+            raise DownloadError('FTP listing of '+url+' failed: '+str(err), url)
+        self._checkin(key, conn)
+        return [name.rstrip('/').rsplit('/', 1)[-1] for name in names]
+
+    def _open_ftp(self, url, offset, length):
+        """
+        Start a binary RETR of url. If length is given the transfer ends after
+        that many bytes.
+        """
+        parts = urlparse.urlsplit(url)
+        key = self._key(parts)
+        path = self._path(parts).lstrip('/')
+
+        conn = self._checkout(key)
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = self._connect(key)
+            try:
+                size = None
+                try:
+                    size = conn.size(path)
+                except ftplib.error_perm:
+                    #Not every server supports SIZE.
+                    pass
+                datasock = conn.transfercmd('RETR '+path, offset or None)
+                break
+            except ftplib.error_perm as err:
+                self._checkin(key, conn)
+                raise DownloadError('FTP '+str(err)+' for '+url, url, str(err)[:3], False)
+            except (socket.error, ftplib.Error, EOFError) as err:
+                self._discard(key, conn)
+                conn = None
+                if not reused:
+                    raise DownloadError('FTP transfer of '+url+' failed: '+str(err), url)
+                reused = False
+
+        if size is not None:
+            size = size - offset
+        #The server keeps sending after length bytes so the connection can not be reused.
+        limited = length is not None and (size is None or length < size)
+        if limited:
+            size = length
+        datafile = datasock.makefile('rb')
+
+        def release(completed, key=key, conn=conn):
+            datafile.close()
+            datasock.close()
+            if completed and not limited:
+                try:
+                    conn.voidresp()
+                    self._checkin(key, conn)
+                    return
+                except (socket.error, ftplib.Error, EOFError):
+                    pass
+            self._discard(key, conn)
+
+        return Transfer(url, 226, {}, size, datafile.read, release)
+
+
+def same_version(old, new):
+    """
+    True if the versions old and new (see Downloader.version) are of the same
+    copy of a file: everything both of them know agrees, and they know something.
+    """
+    known = False
+    for key in ('etag', 'last_modified', 'size'):
+        if old.get(key) is None or new.get(key) is None:
+            continue
+        if old[key] != new[key]:
+            return False
+        known = True
+    return known
+
+
+#The download client shared by every InputDataSet of this process.
+_SHARED_DOWNLOADER = None
+_SHARED_LOCK = threading.Lock()
+
+
+def get_downloader():
+    """
+    Return the Downloader shared by this process, creating it on first use.
+    """
+    global _SHARED_DOWNLOADER
+    with _SHARED_LOCK:
+        if _SHARED_DOWNLOADER is None:
+            _SHARED_DOWNLOADER = Downloader()
+        return _SHARED_DOWNLOADER
+
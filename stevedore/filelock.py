@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Advisory file locks shared by the processes of a host, so that runs
+    sharing an input data directory download each file only once.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import os
+import errno
+import fcntl
+import logging
+
+
+class FileLock(object):
+    '''
+    Exclusive lock on filename+'.lock' held by one process of the host at a
+    time, i.e. the run downloading filename. The lock file is left in place:
+    removing it would let two processes each lock a file of their own.
+    '''
+
+    #Suffix of the lock file.
+    SUFFIX = '.lock'
+
+    def __init__(self, filename):
+        '''
+        Constructor of a FileLock object.
+        '''
+        self.filename = filename+self.SUFFIX
+        #Did acquire() have to wait for another process.
+        self.waited = False
+        self._file = None
+
+    def acquire(self):
+        """
+        Take the lock, waiting while another process holds it.
+        """
+        self._file = open(self.filename, 'a')
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError, err:
+            if err.errno not in (errno.EACCES, errno.EAGAIN):
+                self._file.close()
+                self._file = None
+                raise
+            logging.info('FileLock: waiting for the process holding '+self.filename)
+            self.waited = True
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def release(self):
+        """
+        Give the lock back.
+        """
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def modified(filename):
+    """
+    The time filename was last modified, None if it does not exist.
+    """
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
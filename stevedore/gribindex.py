@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Selection of GRIB2 messages from a wgrib2 style inventory (.idx file) using
+    the fields listed in a WPS ungrib Vtable. Used to download only the byte
+    ranges of a GRIB2 file that ungrib.exe will actually read.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import re
+import hashlib
+import logging
+
+#wgrib2 abbreviations of GRIB2 parameters (discipline, category, number) used by the Vtables.
+GRIB2_NAMES = {(0, 0, 0): 'TMP',
+               (0, 0, 6): 'DPT',
+               (0, 0, 17): 'SKINT',
+               (0, 1, 0): 'SPFH',
+               (0, 1, 1): 'RH',
+               (0, 1, 11): 'SNOD',
+               (0, 1, 13): 'WEASD',
+               (0, 1, 22): 'CLWMR',
+               (0, 1, 23): 'ICMR',
+               (0, 1, 24): 'RWMR',
+               (0, 1, 25): 'SNMR',
+               (0, 1, 32): 'GRLE',
+               (0, 2, 2): 'UGRD',
+               (0, 2, 3): 'VGRD',
+               (0, 2, 8): 'VVEL',
+               (0, 3, 0): 'PRES',
+               (0, 3, 1): 'PRMSL',
+               (0, 3, 5): 'HGT',
+               (0, 3, 192): 'MSLET',
+               (0, 3, 198): 'MSLMA',
+               (2, 0, 0): 'LAND',
+               (2, 0, 2): 'TSOIL',
+               (2, 0, 192): 'SOILW',
+               (2, 0, 196): 'CNWAT',
+               (2, 0, 198): 'VGTYP',
+               (2, 3, 0): 'SOTYP',
+               (2, 3, 18): 'TSOIL',
+               (2, 3, 192): 'SOILL',
+               (10, 2, 0): 'ICEC'}
+
+#wgrib2 level descriptions of GRIB2 fixed surface types.
+LEVEL_PATTERNS = {1: re.compile(r'^surface$'),
+                  6: re.compile(r'^max wind$'),
+                  7: re.compile(r'^tropopause$'),
+                  100: re.compile(r' (mb|Pa)$'),
+                  101: re.compile(r'^mean sea level$'),
+                  103: re.compile(r'^([\d.]+) m above ground$'),
+                  104: re.compile(r' sigma level$'),
+                  105: re.compile(r' hybrid level$'),
+                  106: re.compile(r'^([\d.]+)-([\d.]+) m below ground$'),
+                  108: re.compile(r' mb above ground$')}
+
+
+class VtableField(object):
+    '''
+    A GRIB2 field requested by one line of a Vtable.
+    '''
+
+    def __init__(self, name, level_type, level1, level2):
+        #wgrib2 name of the parameter.
+        self.name = name
+        #GRIB2 fixed surface type.
+        self.level_type = level_type
+        #From / To levels as written in the Vtable ('*' or '' for any).
+        self.level1 = level1
+        self.level2 = level2
+
+    def matches(self, name, level):
+        """
+        True if an inventory line with variable name and level description holds this field.
+        """
+        if name != self.name:
+            return False
+
+        pattern = LEVEL_PATTERNS.get(self.level_type)
+        #Unknown level types match any level. ungrib discards what it does not need.
+        if pattern is None:
+            return True
+        found = pattern.search(level)
+        if found is None:
+            return False
+
+        #Height above ground in m (i.e. 2 m temperature, 10 m wind).
+        if self.level_type == 103 and self.level1 not in ('*', ''):
+            return abs(float(found.group(1))-float(self.level1)) < 1e-6
+
+        #Soil layers are given in cm in the Vtable and in m by wgrib2.
+        if self.level_type == 106 and self.level1 not in ('*', '') and self.level2 not in ('*', ''):
+            return abs(float(found.group(1))-float(self.level1)/100.0) < 1e-6 and \
+                   abs(float(found.group(2))-float(self.level2)/100.0) < 1e-6
+
+        return True
+
+
+def read_vtable(filename):
+    """
+    Read the GRIB2 fields of a Vtable. Returns None if a field can not be
+    translated to a wgrib2 name, in which case the whole file is needed.
+    """
+    fields = []
+    for line in open(filename):
+        columns = [column.strip() for column in line.split('|')]
+        if len(columns) < 11 or not columns[7].isdigit():
+            continue
+
+        key = (int(columns[7]), int(columns[8]), int(columns[9]))
+        if key not in GRIB2_NAMES:
+            logging.info('read_vtable: GRIB2 parameter '+str(key)+' in '+filename+
+                         ' is unknown, partial download disabled')
+            return None
+
+        fields.append(VtableField(GRIB2_NAMES[key], int(columns[10]), columns[2], columns[3]))
+
+    return fields
+
+
+def fields_key(fields):
+    """
+    Short identifier of a set of VtableFields, kept with the files cut down to
+    them so that a run needing other fields does not use such a file.
+    """
+    lines = sorted(set(field.name+':'+str(field.level_type)+':'+field.level1+':'+field.level2
+                       for field in fields))
+    return hashlib.sha1('\n'.join(lines)).hexdigest()[:16]
+
+
+def select_ranges(inventory, fields):
+    """
+    Work out the byte ranges of the messages in an .idx inventory that hold one
+    of fields. Returns a list of (first byte, last byte) tuples, merged where
+    messages are next to each other. The last byte is None for the last
+    message of the file. Returns None if the inventory can not be parsed.
+    """
+    #Offsets of every message and whether it is wanted. Sub-messages (i.e. 5.1, 5.2)
+    #share the offset of their message.
+    offsets = []
+    wanted = set()
+    for line in inventory.splitlines():
+        columns = line.split(':')
+        if len(columns) < 6:
+            continue
+        try:
+            offset = int(columns[1])
+        except ValueError:
+            return None
+        if not offsets or offsets[-1] != offset:
+            offsets.append(offset)
+        if any(field.matches(columns[3], columns[4]) for field in fields):
+            wanted.add(offset)
+
+    if not offsets:
+        return None
+
+    ranges = []
+    for i, offset in enumerate(offsets):
+        if offset not in wanted:
+            continue
+        last = offsets[i+1]-1 if i+1 < len(offsets) else None
+        if ranges and ranges[-1][1] == offset-1:
+            ranges[-1] = (ranges[-1][0], last)
+        else:
+            ranges.append((offset, last))
+
+    return ranges
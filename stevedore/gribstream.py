@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Streaming check of GRIB1 and GRIB2 files. The section headers and message
+    lengths are parsed as the data arrives from the server and every message
+    must end with the 7777 marker, so a truncated or corrupt file is noticed
+    during the download rather than by a second pass with wgrib2. The same
+    pass builds a wgrib2 -s style inventory of the messages.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+
+import struct
+import logging
+from gribindex import GRIB2_NAMES
+
+
+class GribError(Exception):
+    '''
+    Raised when a GRIB file is truncated or corrupt.
+    '''
+
+    def __init__(self, message, offset):
+        Exception.__init__(self, message)
+        #Start of the first bad message. Everything before it is fine.
+        self.offset = offset
+
+
+def _signed(value, bits):
+    """
+    GRIB stores negative numbers as a sign bit followed by the magnitude.
+    """
+    sign = 1 << (bits-1)
+    if value & sign:
+        return -(value & (sign-1))
+    return value
+
+
+def _level_value(scale, value):
+    """
+    The value of a GRIB2 fixed surface or None if it is missing.
+    """
+    if scale == 255 or value == 0xffffffff:
+        return None
+    return _signed(value, 32)/10.0**_signed(scale, 8)
+
+
+def level_description(type1, value1, type2, value2):
+    """
+    wgrib2 description of a GRIB2 level (as matched by gribindex.LEVEL_PATTERNS).
+    """
+    if type1 == 1:
+        return 'surface'
+    elif type1 == 6:
+        return 'max wind'
+    elif type1 == 7:
+        return 'tropopause'
+    elif type1 == 101:
+        return 'mean sea level'
+    elif type1 == 100 and value1 is not None:
+        return '%g mb' % (value1/100.0)
+    elif type1 == 103 and value1 is not None:
+        return '%g m above ground' % value1
+    elif type1 == 104 and value1 is not None:
+        return '%g sigma level' % value1
+    elif type1 == 105 and value1 is not None:
+        return '%g hybrid level' % value1
+    elif type1 == 106 and value1 is not None and type2 == 106 and value2 is not None:
+        return '%g-%g m below ground' % (value1, value2)
+    elif type1 == 108 and value1 is not None and type2 == 108 and value2 is not None:
+        return '%g-%g mb above ground' % (value1/100.0, value2/100.0)
+    return 'level type '+str(type1)
+
+
+class GribValidator(object):
+    '''
+    Checks a GRIB file fed to it in pieces, in order. Files that do not start
+    with a GRIB message are not checked.
+    '''
+
+    #Product definition templates that share the layout of template 4.0 up to octet 34.
+    PDT_LIKE_40 = [0, 1, 2, 8, 11, 12, 15]
+
+    #Units of the forecast time (code table 4.4) in hours.
+    TIME_UNITS = {0: 1/60.0, 1: 1, 2: 24, 10: 3, 11: 6, 12: 12, 13: 1/3600.0}
+
+    def __init__(self):
+        '''
+        Constructor of a GribValidator object.
+        '''
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything seen so far to check a file from the start again.
+        """
+        #Number of bytes fed so far.
+        self.offset = 0
+        #None until the first bytes arrive, then whether the file is GRIB at all.
+        self.is_grib = None
+        #End of the last complete message.
+        self.good = 0
+        #Inventory lines of the complete messages.
+        self.inventory = []
+        #Number of complete messages.
+        self.count = 0
+
+        self._buf = ''
+        self._need = 16
+        self._skip = 0
+        self._state = self._start
+        self._consumed = 0
+        self._message = None
+
+    def feed(self, data):
+        """
+        Check the next piece of the file. Raises GribError as soon as something is wrong.
+        """
+        if self.is_grib is False:
+            self.offset = self.offset + len(data)
+            return
+
+        pos = 0
+        while True:
+            if self._skip:
+                if self._buf:
+                    n = min(self._skip, len(self._buf))
+                    self._buf = self._buf[n:]
+                elif pos < len(data):
+                    n = min(self._skip, len(data)-pos)
+                    pos = pos + n
+                else:
+                    break
+                self._skip = self._skip - n
+                self._consumed = self._consumed + n
+                continue
+
+            if len(self._buf) < self._need and pos < len(data):
+                n = min(self._need-len(self._buf), len(data)-pos)
+                self._buf = self._buf + data[pos:pos+n]
+                pos = pos + n
+
+            if len(self._buf) < self._need:
+                break
+
+            buf = self._buf[:self._need]
+            rest = self._buf[self._need:]
+            start = self._consumed
+            leftover = self._state(buf, start) or ''
+            self._consumed = start + len(buf) - len(leftover)
+            self._buf = leftover + rest
+            if self.is_grib is False:
+                break
+
+        self.offset = self.offset + len(data)
+
+    def finish(self):
+        """
+        Check that the file did not end in the middle of a message.
+        """
+        if not self.is_grib:
+            return
+        if self._message is not None or self._buf[:4] == 'GRIB'[:len(self._buf[:4])] and self._buf:
+            raise GribError('GRIB file truncated after '+str(self.offset)+' bytes', self.good)
+
+    def catch_up(self, filename, end):
+        """
+        Feed the bytes of filename from what has been checked so far up to end.
+        """
+        if self.offset >= end:
+            return
+        with open(filename, 'rb') as infile:
+            infile.seek(self.offset)
+            while self.offset < end:
+                data = infile.read(min(1024*1024, end-self.offset))
+                if not data:
+                    break
+                self.feed(data)
+
+    def write_inventory(self, filename):
+        """
+        Write the inventory of the file, one line per field.
+        """
+        with open(filename, 'w') as inventory:
+            for line in self.inventory:
+                inventory.write(line+'\n')
+
+    def _error(self, message):
+        """
+        Raise a GribError for the message being parsed.
+        """
+        start = self._message['start'] if self._message else self._consumed
+        raise GribError(message+' in GRIB message at byte '+str(start), start)
+
+    def _start(self, buf, start):
+        """
+        Parse section 0 of the next message.
+        """
+        if buf[:4] != 'GRIB':
+            if start == 0:
+                logging.debug('GribValidator: not a GRIB file')
+                self.is_grib = False
+                return None
+            #Padding between or after messages.
+            found = buf.find('GRIB', 1)
+            if found < 0:
+                found = max(1, len(buf)-3)
+            return buf[found:]
+
+        self.is_grib = True
+        edition = ord(buf[7])
+        if edition == 2:
+            length = struct.unpack('>Q', buf[8:16])[0]
+            self._message = {'start': start, 'end': start+length, 'discipline': ord(buf[6]),
+                             'date': '', 'fields': [], 'field': None}
+            if length < 16+4:
+                self._error('Bad length '+str(length))
+            self._next_section(start+16)
+            return None
+        elif edition == 1:
+            length = struct.unpack('>I', '\0'+buf[4:7])[0]
+            self._message = {'start': start, 'end': start+length, 'fields': []}
+            if length < 8+28+4:
+                self._error('Bad length '+str(length))
+            self._need = 28
+            self._state = self._grib1_pds
+            #The first bytes of the product definition section are already in buf.
+            return buf[8:]
+
+        self._message = {'start': start}
+        self._error('Unknown GRIB edition '+str(edition))
+
+    def _next_section(self, position):
+        """
+        Expect the next GRIB2 section at position, or the end marker.
+        """
+        end = self._message['end']
+        if position == end-4:
+            self._need = 4
+            self._state = self._end
+        elif position > end-4:
+            self._error('Section runs past the end of the message')
+        else:
+            self._need = 5
+            self._state = self._section
+
+    def _section(self, buf, start):
+        """
+        Parse the length and number of a GRIB2 section.
+        """
+        if buf[:4] == '7777':
+            self._error('End marker before the end of the message')
+        length = struct.unpack('>I', buf[:4])[0]
+        number = ord(buf[4])
+        if number < 1 or number > 7 or length < 5 or start+length > self._message['end']-4:
+            self._error('Bad section '+str(number)+' of length '+str(length))
+
+        self._message['section'] = (number, start+length)
+        if number in (1, 4) and length > 5:
+            self._need = length-5
+            self._state = self._section_body
+            return None
+
+        if number == 7 and self._message['field'] is not None:
+            self._message['fields'].append(self._message['field'])
+        self._skip = length-5
+        self._next_section(start+length)
+        return None
+
+    def _section_body(self, buf, start):
+        """
+        Parse the identification (1) and product definition (4) sections.
+        """
+        number, end = self._message['section']
+        if number == 1 and len(buf) >= 12:
+            year = struct.unpack('>H', buf[7:9])[0]
+            self._message['date'] = '%04d%02d%02d%02d' % (year, ord(buf[9]), ord(buf[10]), ord(buf[11]))
+        elif number == 4 and len(buf) >= 29:
+            self._message['field'] = self._grib2_field(buf)
+        self._next_section(end)
+        return None
+
+    def _grib2_field(self, body):
+        """
+        Describe the field of a product definition section.
+        """
+        template = struct.unpack('>H', body[2:4])[0]
+        key = (self._message['discipline'], ord(body[4]), ord(body[5]))
+        name = GRIB2_NAMES.get(key, 'var'+'_'.join(str(k) for k in key))
+        if template not in self.PDT_LIKE_40:
+            return name+':template 4.'+str(template)+':'
+
+        level1 = _level_value(ord(body[18]), struct.unpack('>I', body[19:23])[0])
+        level2 = _level_value(ord(body[24]), struct.unpack('>I', body[25:29])[0])
+        level = level_description(ord(body[17]), level1, ord(body[23]), level2)
+
+        forecast = struct.unpack('>I', body[13:17])[0]*self.TIME_UNITS.get(ord(body[12]), 1)
+        if forecast == 0:
+            return name+':'+level+':anl:'
+        return name+':'+level+':'+('%g' % forecast)+' hour fcst:'
+
+    def _grib1_pds(self, buf, start):
+        """
+        Parse the product definition section of a GRIB1 message and skip the rest.
+        """
+        year = (ord(buf[24])-1)*100+ord(buf[12])
+        self._message['fields'].append('d=%04d%02d%02d%02d:kpds5=%d:kpds6=%d:kpds7=%d:' %
+                                       (year, ord(buf[13]), ord(buf[14]), ord(buf[15]),
+                                        ord(buf[8]), ord(buf[9]),
+                                        struct.unpack('>H', buf[10:12])[0]))
+        end = self._message['end']
+        self._skip = end-4-(start+len(buf))
+        if self._skip < 0:
+            self._error('Product definition section runs past the end of the message')
+        self._need = 4
+        self._state = self._end
+        return None
+
+    def _end(self, buf, start):
+        """
+        Check the end marker and add the message to the inventory.
+        """
+        if buf != '7777':
+            self._error('Missing 7777 end marker')
+
+        message = self._message
+        self.count = self.count + 1
+        number = str(self.count)
+        fields = message['fields']
+        for i, field in enumerate(fields):
+            if len(fields) > 1:
+                label = number+'.'+str(i+1)
+            else:
+                label = number
+            if message.get('date'):
+                field = 'd='+message['date']+':'+field
+            self.inventory.append(label+':'+str(message['start'])+':'+field)
+
+        self.good = message['end']
+        self._message = None
+        self._need = 16
+        self._state = self._start
+        return None
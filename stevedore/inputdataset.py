@@ -35,12 +35,23 @@ NOTICE
 """
 
 import os
+import glob
+import fnmatch
 import logging
-import ftplib
-from multiprocessing import current_process
+import threading
+from threading import current_thread
 import time
-import subprocess
-import shutil
+from datetime import timedelta
+from downloader import get_downloader, DownloadError
+from scheduler import get_host_limits
+from gribindex import read_vtable, select_ranges, fields_key
+from manifest import Manifest
+from gribstream import GribValidator
+from decompress import StreamDecompressor, decompress_file
+from crop import crop_grib, cropped_name
+from mirrors import MirrorHealth
+from rda import get_rda_session
+from filelock import FileLock, modified
 
 
 class InputDataSet(object):
@@ -49,12 +60,33 @@ class InputDataSet(object):
     '''
     # pylint: disable=too-many-instance-attributes
 
-    #where to put the rda login file.
-    RDA_LOGIN_PATH = '/opt/deepthunder/data'
-
     #Where to store observation data.
     DIRECTORY_ROOT_OBSERVATIONS = '/opt/deepthunder/data/observations'
 
+    #The InputDataCache of the input data directory (set at runtime, None if not used).
+    cache = None
+
+    #The Manifest of the input data directory (set at runtime). Without it the
+    #file system is searched instead.
+    manifest = None
+
+    #The MirrorHealth used to choose between servers (set at runtime). Without it
+    #the servers are tried in the order they are listed.
+    mirror_health = None
+
+    #The PeerRegistry of the nodes to fetch files from before the data servers
+    #(set at runtime, None if not used).
+    peers = None
+
+    #The AvailabilityIndex of the data servers, used to skip servers that do not
+    #have the file (set at runtime, None if not used).
+    availability = None
+
+    #Files being downloaded by a thread of this process and the event set
+    #when the download is over.
+    _downloading = {}
+    _downloading_lock = threading.Lock()
+
     def __init__(self, date, hour, path, **args):
         '''
         Constructor of a InputDataSet object.
@@ -62,6 +94,8 @@ class InputDataSet(object):
         self.type = None
         self.date = date
         self.hour = hour
+        #The time the data in this file is for.
+        self.valid_time = date+timedelta(hours=hour)
         #sub-directory we want to store the data in
         self.path = path
         #File name.
@@ -91,41 +125,99 @@ class InputDataSet(object):
         self.ungrib_prefix = 'NONE'
         #The server to use, when there are multiple.
         self.server_pos = 0
+        #Does the server publish a wgrib2 .idx inventory next to each GRIB2 file,
+        #allowing only the messages listed in the Vtable to be downloaded.
+        self.partial_download = False
+        #The Vtable used by ungrib.exe for this dataset (set at runtime)
+        self.vtable = None
+        #Number of parts of the file downloaded at the same time. Only worth it for large files.
+        self.segments = 1
+        #Compression of the file on the server ('gz' or 'bz2'). Such files are
+        #decompressed while they download, see local_name().
+        self.decompress = None
+        #Is the file a large (i.e. global) GRIB2 grid worth cropping to the domain before ungrib.
+        self.croppable = False
+        #Is the file published while its cycle runs, so that it may not be on the server yet.
+        self.realtime = False
+        #The url the file was downloaded from and the version of the copy there
+        #(see Downloader.version), kept by the manifest when the file is downloaded every run.
+        self.source = (None, None)
+        #The fields_key of the Vtable fields the file was cut down to when it
+        #was downloaded, None for the whole file.
+        self.fields = None
 
 
     def download(self):
         '''
         Download a given file for a given dataset based on the time and date.
+        If another thread of this process, or another run on this host, is
+        downloading the same file already, wait for it instead of downloading
+        the file a second time.
+        '''
+        destination = self.path+'/'+self.name
+        with InputDataSet._downloading_lock:
+            done = InputDataSet._downloading.get(destination)
+            first = done is None
+            if first:
+                done = InputDataSet._downloading[destination] = threading.Event()
+
+        if not first:
+            logging.info('Waiting for another thread downloading '+self.name)
+            while not done.is_set():
+                done.wait(1.0)
+            return
+
+        try:
+            self._create_directory()
+            #Other runs on this host sharing the directory take the same lock. If one of
+            #them downloads the file while we wait, use its copy.
+            stamp = modified(self.path+'/'+self.local_name())
+            with FileLock(destination) as lock:
+                if lock.waited and modified(self.path+'/'+self.local_name()) != stamp and \
+                   self.exists():
+                    logging.info('Another run downloaded '+self.name+', using its copy')
+                    self._cache_touch()
+                else:
+                    self._download_file()
+        finally:
+            with InputDataSet._downloading_lock:
+                del InputDataSet._downloading[destination]
+            done.set()
+
+
+    def download_key(self):
+        """
+        Identifies the file downloaded by this object: the urls tried and the
+        destination. Objects with the same key download the same file (i.e. a
+        daily SST used for every hour step).
+        """
+        urls = tuple(url+'/'+path+'/'+self.name
+                     for url, path in zip(self.server_url, self.server_path))
+        return (urls, self.path+'/'+self.name)
+
+
+    def _download_file(self):
+        '''
+        Download the file unless it is there already.
         '''
         #Flag to indicate if it has been downloaded or not.
         downloaded = False
-        #Set the initial source to 0.
-        data_source = -1
         #log download has been called.
         logging.debug('download called for '+ self.name)
         #If the file already exists and we are keeping existing files do not download it.
         if self.keep_existing_file and self.exists():
             logging.info('existing file found  '+ self.name + ' will not download.')
+            self._cache_touch()
+
+        #Files downloaded again every run are kept if the server still has the same copy.
+        elif not self.keep_existing_file and self._is_unchanged():
+            logging.info('file unchanged on the server '+ self.name + ' will not download.')
+            self._cache_touch()
 
         #Otherwise begin the download process.
         else:
             #Log what we are downloading
-            logging.debug(str(current_process().name)+', file name:' +self.name)
-
-            # Create directories if they do not exist.
-            if not os.path.exists(self.path):
-                os.mkdir(self.path)
-
-            #Change to the new data directory.
-            os.chdir(self.path)
-
-            # Delete input data set file if it exists
-            if os.path.isfile(self.path+'/'+ self.name):
-                os.remove(self.path+'/'+ self.name)
-
-            # Delete prepared input data set file if it exists
-            if os.path.isfile(self.path+'/'+ self.name_prepared):
-                os.remove(self.path+'/'+ self.name_prepared)
+            logging.debug(str(current_thread().name)+', file name:' +self.name)
 
             #IF you specify that you have an alternate server then we will use
             # it by appending it to the start of the server list
@@ -137,125 +229,345 @@ class InputDataSet(object):
                 self.server_path = ['pub/'+self.type] + self.server_path
                 logging.info('Setting path to  '+ str('pub/'+self.type))
 
-
-            while not downloaded and data_source < (len(self.server_url) -1):
-                #increment the data_source to use.
-                data_source = data_source + 1
+            #Find out which servers have the file, and under which name, before asking them.
+            available = None
+            if self.availability is not None:
+                name, available = self.availability.resolve(self)
+                if name is None:
+                    logging.warning('No server lists '+self.name+', it will not be downloaded')
+                    return
+                if name != self.name:
+                    logging.info('Servers publish '+self.name+' as '+name)
+                    self.use_name(name)
+                    if self.keep_existing_file and self.exists():
+                        logging.info('existing file found  '+ self.name + ' will not download.')
+                        self._cache_touch()
+                        return
+
+            #The file is not deleted first: the new one replaces it when it is complete,
+            #so another run reading it never finds it missing or half written.
+            if self.manifest is not None:
+                self.manifest.remove(self.type, self.valid_time, self.name)
+
+
+            #Another node of the cluster may already have the file.
+            status = None
+            self.source = (None, None)
+            self.fields = None
+            if self.peers is not None:
+                status = self._fetch_from_peers()
+                downloaded = status is not None
+
+            for data_source in ([] if downloaded else self._order_servers()):
+                if available is not None and data_source not in available:
+                    continue
                 self.server_pos = data_source
 
-                #Try to download the file.
+                #construct the full url to the file to download.
+                full_url = self.server_url[data_source]+'/'+\
+                          self.server_path[data_source]+'/'+self.name
+                host = MirrorHealth.host_of(full_url)
+
+                #Try to download the file once a transfer slot on the server is free.
                 try:
-                    #construct the full url to the file to download.
-                    full_url = self.server_url[data_source]+'/'+\
-                              self.server_path[data_source]+'/'+self.name
-
-                    #if the file is an RDA file.
-                    if self.is_rda[data_source]:
-                        #login / check if we need to login.
-                        self.rda_login()
-                        #Download the file passing in the cookie.
-                        process = subprocess.Popen(['wget', '--load-cookies',
-                                                    self.RDA_LOGIN_PATH+'/auth.rda.ucar.edu.$$',
-                                                    full_url,
-                                                    '--output-document='+self.path+'/'+self.name])
-                        process.wait()
-                    else:
-                        #Try to download the file.
-                        #Waiting 17 seconds between tries and trying 5 times.
-                        process = subprocess.Popen(['wget', full_url,
-                                                    '--output-document='\
-                                                    +self.path+'/'+self.name,
-                                                    '--retry-connrefused',
-                                                    '--waitretry=17', '-t 5'])
-                        process.wait()
-
-                    #Log that we have downloaded the file.
-                    logging.info('Downloaded '+full_url)
-
-                    if process.returncode != 0:
-                        logging.info('Failure downloading '+ full_url +' retrying ...')
-                    else:
-                        # check integrity of the file with wgrib2.
-                        # This assumes it is a grib file
-                        try:
-                            process = subprocess.Popen(['wgrib2', self.path+'/'+self.name])
-                            process.wait()
-                            if process.returncode != 0:
-                                logging.info('Grib file appears corrupt.'
-                                             ' Retrying download '+ full_url)
-                            else:
-                                downloaded = True
-                        except OSError:
-                            logging.error('OSError File downloaded but does not exist or wgrib2 is failing.')
-
-
-                except ftplib.error_perm, resp:
-                    logging.info('Current process:'+str(current_process().name)+\
-                                 ' Exception: '+str(resp))
+                    with get_host_limits().slot(full_url):
+                        started = time.time()
+                        status = self._fetch(data_source, full_url)
+                    downloaded = True
+
+                    if self.mirror_health is not None:
+                        self.mirror_health.record_success(host,
+                                                          os.path.getsize(self.path+'/'+self.name),
+                                                          time.time()-started,
+                                                          get_downloader().latency_of(host))
+                    break
+
+                except DownloadError, resp:
+                    logging.info('Current thread:'+str(current_thread().name)+\
+                                 ' Failure downloading '+ full_url +' retrying ... '+str(resp))
                     downloaded = False
+                    if self.mirror_health is not None:
+                        self.mirror_health.record_failure(host, resp)
 
+            #Delete the copies cropped from an older version of the file
+            if downloaded:
+                for cropped in glob.glob(self.path+'/'+self.name_prepared+'.crop_*'):
+                    os.remove(cropped)
 
-    def rda_login(self):
+            #Only the decompressed file is kept.
+            if downloaded and self.decompress is not None and \
+               os.path.isfile(self.path+'/'+self.name):
+                os.remove(self.path+'/'+self.name)
+
+            if downloaded and self.manifest is not None:
+                self.manifest.record(self.type, self.valid_time, self.name, self.path,
+                                     status, self.name_prepared, *self.source, fields=self.fields)
+
+            #Keep the new file in the cache, pinned until this run is done with it.
+            if downloaded and self.cache is not None:
+                self.cache.add(self.path+'/'+self.local_name())
+
+
+    def _is_unchanged(self):
+        """
+        True if the file is on disk and the server it came from still has the
+        same copy (see Downloader.is_unchanged).
+        """
+        if self.manifest is None or not os.path.isfile(self.path+'/'+self.local_name()):
+            return False
+        entry = self.manifest.get(self.type, self.valid_time, self.name)
+        if entry is None or entry['url'] is None:
+            return False
+
+        try:
+            with get_host_limits().slot(entry['url']):
+                return get_downloader().is_unchanged(entry['url'], entry['version'])
+        except DownloadError, err:
+            logging.info('Could not check '+entry['url']+' for changes: '+str(err))
+            return False
+
+
+    def _create_directory(self):
         """
-        Login to rda.ucar.edu using the credentials found in RDA_EMAIL and RDA_PASS
+        Create the directory of the file if it does not exist.
         """
-        loginfile = self.RDA_LOGIN_PATH+'/login'
-        logging.info('looking for '+ loginfile)
+        #Another download thread may be creating it at the same time.
+        if not os.path.exists(self.path):
+            try:
+                os.mkdir(self.path)
+            except OSError:
+                pass
 
-        #set not logged in to True.
-        notloggedin = True
 
-        # Check that the login file is not too old.
-        if os.path.isfile(loginfile):
-            mtime = os.path.getmtime(loginfile)
-            #If the login file was modified more than an hour ago remove it and login again.
-            #Note: assume login once every hour is ok.
-            modtime = int(time.time()) - int(mtime)
-            if modtime > 3600:
-                logging.info('Removing old login file with modification time of '+ str(modtime))
-                os.remove(loginfile)
+    def get_alternatives(self):
+        """
+        Names the file may be published under, the preferred one first. Used
+        with an AvailabilityIndex to download the one the servers have.
+        """
+        return [self.name]
+
+
+    def use_name(self, name):
+        """
+        Download the file under name, one of get_alternatives(), instead.
+        """
+        if self.name_prepared == self.name:
+            self.name_prepared = name
+        self.name = name
+
+
+    def local_name(self):
+        """
+        Name of the downloaded file on disk: without the .gz or .bz2 extension
+        if it is decompressed while it downloads.
+        """
+        if self.decompress is not None and self.name.endswith('.'+self.decompress):
+            return self.name[:-len(self.decompress)-1]
+        return self.name
+
+
+    def _order_servers(self):
+        """
+        Indexes of the servers in the order to try them: the alternate server
+        first if there is one, then the others by expected download time.
+        Servers found to be down are skipped, unless all of them are.
+        """
+        if self.mirror_health is None:
+            return range(len(self.server_url))
+
+        return self.mirror_health.order(self.server_url,
+                                        first=1 if self.alt_server_url is not None else 0)
+
+
+    def _cache_touch(self):
+        """
+        Mark the existing file(s) of this dataset as used by this run.
+        Files downloaded before the cache was used are added to it.
+        """
+        if self.cache is None:
+            return
+        for name in set([self.name, self.local_name(), self.name_prepared]):
+            filename = self.path+'/'+name
+            if os.path.isfile(filename) and not self.cache.touch(filename):
+                self.cache.add(filename)
 
-            notloggedin = not os.path.isfile(loginfile)
 
-        #after defineing notloggedin check its value
-        if notloggedin:
-            logging.info('Login to auth.rda.ucar.edu with credentials'
-                         'supplied by environment variables RDA_EMAIL and RDA_PASS')
+    def _fetch(self, data_source, full_url):
+        """
+        Download the file from full_url, the url of server data_source, and check it.
+        Raises DownloadError if the file could not be downloaded or is corrupt.
+        Returns the Manifest status of the file.
+        """
+        headers = {}
+        validator = self._validator()
+        #if the file is an RDA file use the login shared by every RDA dataset.
+        if not self.is_rda[data_source]:
+            self._download(full_url, headers, validator)
+        else:
+            session = get_rda_session()
+            headers.update(session.headers())
             try:
-                if os.environ.get('RDA_EMAIL') is None:
-                    print "SET the environment variables RDA_EMAIL and RDA_PASS "
-                else:
-                    process = subprocess.Popen(['wget', '--save-cookies',
-                                                'auth.rda.ucar.edu.$$',
-                                                '--post-data="email='\
-                                                +os.environ.get('RDA_EMAIL')\
-                                                +'&passwd='+os.environ.get('RDA_PASS')\
-                                                +'&action=login"',
-                                                'https://rda.ucar.edu/cgi-bin/login'])
-                    process.wait()
-
-                    #Copy the login file and cookie out of here:
-                    if os.path.isfile(self.path+'/login'):
-                        shutil.copyfile(self.path+'/login', loginfile)
-
-                    if os.path.isfile(self.path+'/auth.rda.ucar.edu.$$'):
-                        logging.debug('copy cookie')
-                        shutil.copyfile(self.path+'/auth.rda.ucar.edu.$$',
-                                        self.RDA_LOGIN_PATH+'/auth.rda.ucar.edu.$$')
-            except:
-                logging.error("SET the environment variables RDA_EMAIL and"
-                              " RDA_PASS to use this dataset")
+                self._download(full_url, headers, validator)
+            except DownloadError, err:
+                if err.status not in (401, 403):
+                    raise
+                #The login ran out before we expected it to. Login again and retry once.
+                logging.info('RDA refused the login for '+full_url+', login again')
+                session.invalidate()
+                headers.update(session.headers())
+                self._download(full_url, headers, validator)
+
+        #Log that we have downloaded the file.
+        logging.info('Downloaded '+full_url)
+        return self._checked(validator)
+
+
+    def _fetch_from_peers(self):
+        """
+        Download the file from another node of the cluster that has it.
+        Returns the Manifest status of the file, None if no peer has it.
+        """
+        validator = GribValidator()
+        wanted = self._wanted_fields()
+        if self.peers.fetch(self.path+'/'+self.local_name(), validator, wanted) is None:
+            return None
+        #The peer sent the whole file or one cut to the same fields. Without knowing
+        #which, it is taken for the smaller one.
+        self.fields = wanted
+        return self._checked(validator)
 
+
+    def _validator(self):
+        """
+        What follows the data of a download as it arrives: a StreamDecompressor
+        for compressed files, a GribValidator otherwise.
+        """
+        if self.decompress is not None:
+            return StreamDecompressor(self.decompress, self.path+'/'+self.local_name())
+        return GribValidator()
+
+
+    def _checked(self, validator):
+        """
+        Returns the Manifest status of the file checked by validator while it
+        was downloaded and keeps the inventory of GRIB files.
+        """
+        if not isinstance(validator, GribValidator) or not validator.is_grib:
+            return Manifest.DOWNLOADED
+
+        #Keep the inventory of the messages for later stages.
+        validator.write_inventory(self.path+'/'+self.name+'.inv')
+        logging.debug('Checked '+str(validator.count)+' GRIB messages of '+self.name)
+        return Manifest.VALID
+
+
+    def _download(self, full_url, headers, validator):
+        """
+        Download the file over a connection shared with every other file from
+        this server. If possible only get the messages ungrib needs. GRIB files
+        are checked message by message by validator while they arrive.
+        """
+        #Note which copy is downloaded, to only download it again once it changes.
+        if not self.keep_existing_file and self.manifest is not None:
+            try:
+                self.source = (full_url, get_downloader().version(full_url, headers))
+            except DownloadError, err:
+                logging.info('No version of '+full_url+': '+str(err))
+
+        ranges = self._select_ranges(full_url, headers)
+        self.fields = None if ranges is None else self._wanted_fields()
+        if ranges is None:
+            get_downloader().fetch(full_url, self.path+'/'+self.name, headers=headers,
+                                   segments=self.segments, validator=validator)
         else:
-            logging.info('Already logged in to RDA. Ready to download data...')
-            logging.info('Downloading ' +self.name +\
-                         ' from: http://'+self.server_url[self.server_pos]+\
-                         '/'+self.server_path[self.server_pos])
+            written = get_downloader().fetch_ranges(full_url, ranges, self.path+'/'+self.name,
+                                                    headers=headers, validator=validator)
+            logging.info('Downloaded '+str(written)+' bytes in '+str(len(ranges))+
+                         ' ranges of '+full_url)
+
+
+    def _select_ranges(self, full_url, headers):
+        """
+        Work out the byte ranges of the GRIB2 messages of full_url needed by the
+        Vtable of this dataset using the .idx inventory on the server.
+        Returns None if the whole file has to be downloaded.
+        """
+        #Byte ranges are only available over HTTP.
+        if not self.partial_download or self.vtable is None or \
+           not os.path.isfile(self.vtable) or not full_url.startswith('http'):
+            return None
+
+        fields = read_vtable(self.vtable)
+        if not fields:
+            return None
+
+        if self.availability is not None and not self.availability.has(full_url+'.idx'):
+            logging.info('No inventory listed for '+full_url+', downloading the whole file')
+            return None
+
+        try:
+            inventory = get_downloader().read_url(full_url+'.idx', headers=headers)
+        except DownloadError, err:
+            logging.info('No inventory for '+full_url+', downloading the whole file: '+str(err))
+            return None
+
+        ranges = select_ranges(inventory, fields)
+        if not ranges:
+            logging.info('Inventory of '+full_url+' does not match '+self.vtable+
+                         ', downloading the whole file')
+            return None
+        return ranges
+
+
+    def _wanted_fields(self):
+        """
+        The fields_key of the Vtable fields a partial download of the file keeps,
+        None if the whole file is needed.
+        """
+        if not self.partial_download or self.vtable is None or not os.path.isfile(self.vtable):
+            return None
+        fields = read_vtable(self.vtable)
+        if not fields:
+            return None
+        return fields_key(fields)
+
+
+    def rda_login(self):
+        """
+        Login to rda.ucar.edu using the credentials found in RDA_EMAIL and RDA_PASS.
+        The login is shared by every RDA dataset of this process and renewed
+        before it runs out. Returns True if logged in.
+        """
+        try:
+            get_rda_session().headers()
+        except DownloadError, err:
+            logging.error(str(err))
+            return False
+
+        logging.info('Logged in to RDA. Ready to download data...')
+        return True
 
     def exists(self):
         """
         Does the file exist in either pre or post processed forms? if so return True.
         """
+        if self.manifest is not None:
+            entry = self.manifest.get(self.type, self.valid_time, self.name)
+            #A file cut down to the fields of another Vtable is as good as missing.
+            if entry is not None and entry['fields'] is not None and \
+               entry['fields'] != self._wanted_fields():
+                logging.info(self.name+' only holds the fields of another Vtable, it is needed again')
+                return False
+            if entry is not None:
+                #One look at the disk in case the file was deleted behind the manifest's back.
+                if entry['status'] == Manifest.PREPARED and entry['name_prepared']:
+                    recorded = entry['path']+'/'+entry['name_prepared']
+                else:
+                    recorded = entry['path']+'/'+self.name
+                if os.path.isfile(recorded):
+                    return True
+                self.manifest.remove(self.type, self.valid_time, self.name)
+
         does_exist = False
 
         if os.path.isfile(self.path+'/'+self.name) and \
@@ -266,9 +578,71 @@ class InputDataSet(object):
            os.path.getsize(self.path+'/'+self.name_prepared) > 0:
             does_exist = True
 
+        if os.path.isfile(self.path+'/'+self.local_name()) and \
+           os.path.getsize(self.path+'/'+self.local_name()) > 0:
+            does_exist = True
+
+        #Remember files that were here before the manifest.
+        if does_exist and self.manifest is not None:
+            self.manifest.record(self.type, self.valid_time, self.name, self.path,
+                                 Manifest.FOUND, self.name_prepared)
+
         return does_exist
 
 
+    def _files_to_prepare(self, pattern):
+        """
+        Names of the files in self.path matching pattern that prepare() still has to process.
+        """
+        if self.manifest is None:
+            return glob.glob(pattern)
+        return [filename for filename in self.manifest.pending(self.type, self.path)
+                if fnmatch.fnmatch(filename, pattern)]
+
+
+    def _decompress(self, filename):
+        """
+        Returns the name of filename once decompressed. Files are decompressed
+        while they download, only files that arrived some other way (i.e. from
+        an older run) are decompressed here.
+        """
+        name = filename[:-len(self.decompress)-1]
+        if os.path.isfile(filename):
+            logging.info('Decompressing '+filename)
+            decompress_file(filename, name, self.decompress)
+            os.remove(filename)
+        return name
+
+
+    def crop(self, bbox, halo):
+        """
+        Cut the prepared file down to the bounding box bbox plus halo degrees.
+        The cropped file is kept next to it and reused by later runs on the
+        same domain. Returns the file to give to ungrib: the cropped file or,
+        if it can not be cropped, the prepared file.
+        """
+        filename = self.path+'/'+self.name_prepared
+        cropped = cropped_name(filename, bbox, halo)
+        if os.path.isfile(cropped):
+            if self.cache is not None and not self.cache.touch(cropped):
+                self.cache.add(cropped)
+            return cropped
+
+        if not os.path.isfile(filename) or not crop_grib(filename, cropped, bbox, halo):
+            return filename
+        if self.cache is not None:
+            self.cache.add(cropped)
+        return cropped
+
+
+    def _mark_prepared(self, filename, filename_prepared):
+        """
+        Record that prepare() turned filename into filename_prepared.
+        """
+        if self.manifest is not None:
+            self.manifest.mark_prepared(self.type, self.path, filename, filename_prepared)
+
+
     def prepare(self, **args):
         '''
         Steps to transform the downloaded input data into the files needed
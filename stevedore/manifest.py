@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Manifest of the input data files that have been downloaded and prepared.
+    It answers "is this file here?" and "what is left to prepare?" from a
+    sqlite database instead of stat() and glob() calls on the data volume.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+
+class Manifest(object):
+    '''
+    The manifest of an input data directory. Entries are keyed by dataset
+    type, valid time and file name.
+    '''
+
+    #Downloaded, not a GRIB file so not checked.
+    DOWNLOADED = 'downloaded'
+    #Downloaded and passed the wgrib2 check.
+    VALID = 'valid'
+    #Found on disk, put there before the manifest knew about it.
+    FOUND = 'found'
+    #prepare() has turned it into name_prepared.
+    PREPARED = 'prepared'
+
+    #Bytes read at a time when computing a checksum.
+    BLOCK_SIZE = 1024*1024
+
+    #Columns describing the copy on the server a file was downloaded from, and
+    #the Vtable fields it was cut down to (see gribindex.fields_key, NULL for the whole file).
+    VERSION_COLUMNS = [('url', 'TEXT'), ('etag', 'TEXT'), ('last_modified', 'TEXT'),
+                       ('remote_size', 'INTEGER'), ('fields', 'TEXT')]
+
+    def __init__(self, database):
+        '''
+        Constructor of a Manifest object.
+        '''
+        self.database = database
+        if not os.path.exists(os.path.dirname(database)):
+            os.makedirs(os.path.dirname(database))
+
+        #Shared by the download threads of this run.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(database, timeout=120, check_same_thread=False)
+        with self._lock:
+            self._db.execute('CREATE TABLE IF NOT EXISTS files (dataset TEXT, valid_time TEXT,'
+                             ' name TEXT, path TEXT, size INTEGER, checksum TEXT, status TEXT,'
+                             ' name_prepared TEXT, updated REAL,'
+                             ' PRIMARY KEY (dataset, valid_time, name))')
+            self._db.execute('CREATE INDEX IF NOT EXISTS files_pending ON files (dataset, path, status)')
+            #Where the file came from and what identified the copy on the server (see
+            #Downloader.version), added to manifests written before they were kept.
+            columns = [row[1] for row in self._db.execute('PRAGMA table_info(files)')]
+            for column, kind in self.VERSION_COLUMNS:
+                if column not in columns:
+                    self._db.execute('ALTER TABLE files ADD COLUMN '+column+' '+kind)
+            self._db.commit()
+
+    @staticmethod
+    def _time(valid_time):
+        """
+        The key used for a valid time.
+        """
+        return valid_time.strftime('%Y-%m-%dT%H:%M')
+
+    def _checksum(self, filename):
+        """
+        SHA-1 of a file.
+        """
+        sha = hashlib.sha1()
+        with open(filename, 'rb') as infile:
+            while True:
+                data = infile.read(self.BLOCK_SIZE)
+                if not data:
+                    break
+                sha.update(data)
+        return sha.hexdigest()
+
+    def get(self, dataset, valid_time, name):
+        """
+        The entry of a file as a dictionary or None if there is none. The
+        'version' of a downloaded file is what identified the copy on the server
+        at 'url' (see Downloader.version).
+        """
+        with self._lock:
+            row = self._db.execute('SELECT path, size, checksum, status, name_prepared, url, etag,'
+                                   ' last_modified, remote_size, fields FROM files'
+                                   ' WHERE dataset = ? AND valid_time = ? AND name = ?',
+                                   (dataset, self._time(valid_time), name)).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(('path', 'size', 'checksum', 'status', 'name_prepared', 'url'), row))
+        entry['version'] = dict(zip(('etag', 'last_modified', 'size'), row[6:9]))
+        entry['fields'] = row[9]
+        return entry
+
+    def fields_of(self, filename):
+        """
+        The fields_key of the Vtable fields the file filename was cut down to,
+        None if it is a whole file or not in the manifest.
+        """
+        path, name = os.path.split(filename)
+        with self._lock:
+            row = self._db.execute('SELECT fields FROM files WHERE path = ? AND name = ?',
+                                   (path, name)).fetchone()
+        return None if row is None else row[0]
+
+    def record(self, dataset, valid_time, name, path, status, name_prepared, url=None,
+               version=None, fields=None):
+        """
+        Add or update the entry of the file path/name. Downloaded files get a
+        checksum and may keep the url and version of the copy they came from,
+        and the fields_key of the Vtable fields if only those were downloaded.
+        """
+        version = version or {}
+        filename = path+'/'+name
+        size = None
+        checksum = None
+        if os.path.isfile(filename):
+            size = os.path.getsize(filename)
+            if status in (self.DOWNLOADED, self.VALID):
+                checksum = self._checksum(filename)
+
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO files (dataset, valid_time, name, path, size,'
+                             ' checksum, status, name_prepared, updated, url, etag, last_modified,'
+                             ' remote_size, fields) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (dataset, self._time(valid_time), name, path, size, checksum, status,
+                              name_prepared, time.time(), url, version.get('etag'),
+                              version.get('last_modified'), version.get('size'), fields))
+            self._db.commit()
+
+    def remove(self, dataset, valid_time, name):
+        """
+        Drop the entry of a file that is being replaced.
+        """
+        with self._lock:
+            self._db.execute('DELETE FROM files WHERE dataset = ? AND valid_time = ? AND name = ?',
+                             (dataset, self._time(valid_time), name))
+            self._db.commit()
+
+    def forget(self, filenames):
+        """
+        Drop the entries of files that have been deleted (i.e. evicted from the cache).
+        """
+        with self._lock:
+            for filename in filenames:
+                path, name = os.path.split(filename)
+                self._db.execute('DELETE FROM files WHERE path = ? AND (name = ? OR name_prepared = ?)',
+                                 (path, name, name))
+            self._db.commit()
+
+    def pending(self, dataset, path):
+        """
+        Names of the files of dataset in path that still have to be prepared.
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT name FROM files WHERE dataset = ? AND path = ?'
+                                    ' AND status != ? ORDER BY valid_time',
+                                    (dataset, path, self.PREPARED)).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_prepared(self, dataset, path, name, name_prepared):
+        """
+        Record that prepare() turned path/name into path/name_prepared.
+        """
+        with self._lock:
+            self._db.execute('UPDATE files SET status = ?, name_prepared = ?, updated = ?'
+                             ' WHERE dataset = ? AND path = ? AND name = ?',
+                             (self.PREPARED, name_prepared, time.time(), dataset, path, name))
+            self._db.commit()
+        logging.debug('Manifest: '+path+'/'+name+' prepared as '+str(name_prepared))
+
+    def close(self):
+        """
+        Close the database.
+        """
+        with self._lock:
+            self._db.close()
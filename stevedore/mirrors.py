@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Health of the servers input data is downloaded from. Latency, throughput
+    and failure rate are kept per host across runs so that datasets with
+    several mirrors try the one expected to deliver first, and a mirror that
+    keeps failing is not tried again for the rest of the run.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+
+import os
+import json
+import time
+import logging
+import threading
+import urlparse
+from scheduler import HostLimits
+
+
+class MirrorHealth(object):
+    '''
+    Per host download statistics, saved to a JSON file between runs.
+    '''
+
+    #Weight of the newest observation in the moving averages.
+    ALPHA = 0.3
+
+    #Assumed for hosts without statistics yet.
+    DEFAULT_LATENCY = 1.0
+    DEFAULT_THROUGHPUT = 1024*1024.0
+
+    #File size used to compare mirrors when the size of the file is not known.
+    DEFAULT_SIZE = 50*1024*1024
+
+    #Failures in a row after which a host is not used while another one can be.
+    TRIP_FAILURES = 2
+
+    #Seconds after which a host given up on is tried again by a single download.
+    RETRY_AFTER = 300
+
+    #Seconds between saves of the statistics while downloading.
+    SAVE_INTERVAL = 60
+
+    def __init__(self, filename=None):
+        '''
+        Constructor of a MirrorHealth object. Statistics are loaded from and
+        saved to filename if given.
+        '''
+        self.filename = filename
+        self.hosts = {}
+        #Failures in a row of each host in this run and the time each host given
+        #up on was given up on or last tried again.
+        self._failures = {}
+        self._tripped = {}
+        self._saved = time.time()
+        self._lock = threading.Lock()
+
+        if filename is not None and os.path.isfile(filename):
+            try:
+                self.hosts = json.load(open(filename))
+            except (IOError, ValueError):
+                logging.warning('MirrorHealth: ignoring unreadable '+filename)
+
+    @staticmethod
+    def host_of(url):
+        """
+        The host name of a url.
+        """
+        return urlparse.urlsplit(url).hostname
+
+    def _get(self, host):
+        """
+        The statistics of host. Must be called holding self._lock.
+        """
+        if host not in self.hosts:
+            self.hosts[host] = {'latency': None, 'throughput': None, 'failure_rate': 0.0,
+                                'successes': 0, 'failures': 0, 'last_success': None}
+        return self.hosts[host]
+
+    def _average(self, old, new):
+        """
+        Exponentially weighted moving average.
+        """
+        if old is None:
+            return new
+        return (1-self.ALPHA)*old + self.ALPHA*new
+
+    def expected_time(self, host, size=None):
+        """
+        Expected seconds to download a file of size bytes from host, allowing for
+        the attempts that fail.
+        """
+        with self._lock:
+            stats = self.hosts.get(host, {})
+            latency = stats.get('latency') or self.DEFAULT_LATENCY
+            throughput = stats.get('throughput') or self.DEFAULT_THROUGHPUT
+            failure_rate = stats.get('failure_rate', 0.0)
+        seconds = latency + (size or self.DEFAULT_SIZE)/throughput
+        return seconds/max(0.05, 1-failure_rate)
+
+    def is_tripped(self, host):
+        """
+        True if host has failed too often to try it now. Once RETRY_AFTER seconds
+        have passed one caller gets False to try the host again (half-open),
+        the others keep skipping it until that download is over.
+        """
+        with self._lock:
+            tripped = self._tripped.get(host)
+            if tripped is None:
+                return False
+            if time.time()-tripped >= self.RETRY_AFTER:
+                self._tripped[host] = time.time()
+                logging.info('MirrorHealth: trying '+str(host)+' again')
+                return False
+            return True
+
+    def order(self, urls, size=None, first=0):
+        """
+        Indexes of urls in the order they should be tried: the first first urls
+        as given (i.e. an alternate server), then the others fastest expected
+        first. Hosts given up on are left out, unless all of them are, in
+        which case all are tried in the order given.
+        """
+        front = []
+        candidates = []
+        for index, url in enumerate(urls):
+            host = self.host_of(url)
+            if self.is_tripped(host):
+                logging.info('MirrorHealth: skipping '+str(host)+', it is down')
+                continue
+            if index < first:
+                front.append(index)
+            else:
+                candidates.append((self.expected_time(host, size), index))
+        if not front and not candidates:
+            return range(len(urls))
+        return front+[index for _, index in sorted(candidates)]
+
+    def record_success(self, host, nbytes, seconds, latency=None):
+        """
+        Record a file of nbytes downloaded from host in seconds.
+        """
+        with self._lock:
+            stats = self._get(host)
+            if latency is not None:
+                stats['latency'] = self._average(stats['latency'], latency)
+            if seconds > 0 and nbytes > 0:
+                stats['throughput'] = self._average(stats['throughput'], nbytes/seconds)
+            stats['failure_rate'] = self._average(stats['failure_rate'], 0.0)
+            stats['successes'] = stats['successes']+1
+            stats['last_success'] = time.time()
+            self._failures[host] = 0
+            if self._tripped.pop(host, None) is not None:
+                logging.info('MirrorHealth: '+str(host)+' is back')
+        self._save_if_due()
+
+    def record_failure(self, host, error=None):
+        """
+        Record a failed download from host. Missing files (errors that are not
+        worth retrying) and throttling say nothing about the health of the host.
+        """
+        if error is not None and (not getattr(error, 'retry', True) or
+                                  getattr(error, 'status', None) in HostLimits.THROTTLE_STATUS):
+            return
+        with self._lock:
+            stats = self._get(host)
+            stats['failure_rate'] = self._average(stats['failure_rate'], 1.0)
+            stats['failures'] = stats['failures']+1
+            self._failures[host] = self._failures.get(host, 0)+1
+            if self._failures[host] >= self.TRIP_FAILURES:
+                if host not in self._tripped:
+                    logging.warning('MirrorHealth: '+str(host)+' failed '+str(self._failures[host])+
+                                    ' times in a row, not using it for '+str(self.RETRY_AFTER)+' s')
+                self._tripped[host] = time.time()
+        self._save_if_due()
+
+    def _save_if_due(self):
+        """
+        Save the statistics if they have not been saved for a while.
+        """
+        if time.time()-self._saved > self.SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """
+        Write the statistics to self.filename.
+        """
+        if self.filename is None:
+            return
+        with self._lock:
+            self._saved = time.time()
+            tmp = self.filename+'.tmp.'+str(os.getpid())
+            try:
+                with open(tmp, 'w') as outfile:
+                    json.dump(self.hosts, outfile, indent=1, sort_keys=True)
+                os.rename(tmp, self.filename)
+            except (IOError, OSError), err:
+                logging.warning('MirrorHealth: could not save '+self.filename+': '+str(err))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    A partially downloaded file and its journal. The journal records the
+    byte ranges that have been written and flushed to disk so that an
+    interrupted download can carry on where it stopped.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import os
+import json
+import logging
+import threading
+
+
+class PartialFile(object):
+    '''
+    A download in progress. Data is written to destination+'.part' and the
+    ranges known to be on disk are kept in destination+'.part.journal'.
+    '''
+
+    #Suffix of the file being downloaded.
+    PART_SUFFIX = '.part'
+
+    #Suffix of the journal of the file being downloaded.
+    JOURNAL_SUFFIX = '.part.journal'
+
+    def __init__(self, destination):
+        '''
+        Constructor of a PartialFile object.
+        '''
+        self.destination = destination
+        self.part = destination+self.PART_SUFFIX
+        self.journal = destination+self.JOURNAL_SUFFIX
+        #The url being downloaded and its size in bytes (None if unknown).
+        self.url = None
+        self.size = None
+        #Sorted list of [first, last] byte ranges on disk (inclusive).
+        self.ranges = []
+        self._lock = threading.Lock()
+
+    def open(self, url, size):
+        """
+        Load the journal of an earlier attempt at downloading url. The earlier
+        data is dropped if it was for a different url or a file of another size.
+        """
+        with self._lock:
+            self.url = url
+            self.size = size
+            self.ranges = []
+            if os.path.isfile(self.part) and os.path.isfile(self.journal):
+                try:
+                    journal = json.load(open(self.journal))
+                    if journal.get('url') == url and size is not None and \
+                       journal.get('size') == size:
+                        self.ranges = [list(r) for r in journal.get('ranges', [])]
+                except (IOError, ValueError):
+                    logging.info('PartialFile: unreadable journal '+self.journal+', starting again')
+
+            if self.ranges:
+                logging.info('PartialFile: resuming '+url+' with '+str(self.received())+
+                             ' of '+str(size)+' bytes on disk')
+            else:
+                #Start from an empty file.
+                open(self.part, 'wb').close()
+                self._save()
+
+    def received(self):
+        """
+        Number of bytes on disk.
+        """
+        return sum(last-first+1 for first, last in self.ranges)
+
+    def resume_offset(self):
+        """
+        The first byte not on disk when the file is read from the start.
+        """
+        if self.ranges and self.ranges[0][0] == 0:
+            return self.ranges[0][1]+1
+        return 0
+
+    def missing(self):
+        """
+        The (first, last) byte ranges not yet on disk. Needs a known size.
+        """
+        missing = []
+        position = 0
+        for first, last in self.ranges:
+            if first > position:
+                missing.append((position, first-1))
+            position = max(position, last+1)
+        if position < self.size:
+            missing.append((position, self.size-1))
+        return missing
+
+    def record(self, first, last):
+        """
+        Add bytes first to last, flushed to disk by the caller, to the journal.
+        """
+        if last < first:
+            return
+        with self._lock:
+            ranges = sorted(self.ranges+[[first, last]])
+            merged = []
+            for rng in ranges:
+                if merged and rng[0] <= merged[-1][1]+1:
+                    merged[-1][1] = max(merged[-1][1], rng[1])
+                else:
+                    merged.append(rng)
+            self.ranges = merged
+            self._save()
+
+    def _save(self):
+        """
+        Write the journal. It is replaced in one step so it is never half written.
+        Must be called holding self._lock.
+        """
+        tmp = self.journal+'.tmp'
+        with open(tmp, 'w') as journal:
+            json.dump({'url': self.url, 'size': self.size, 'ranges': self.ranges}, journal)
+        os.rename(tmp, self.journal)
+
+    def truncate(self, offset):
+        """
+        Forget everything on disk from byte offset on (i.e. data found to be corrupt).
+        """
+        with self._lock:
+            self.ranges = [[first, min(last, offset-1)] for first, last in self.ranges
+                           if first < offset]
+            self._save()
+
+    def is_complete(self):
+        """
+        True if every byte of the file is on disk.
+        """
+        if self.size == 0:
+            return True
+        return self.size is not None and self.ranges == [[0, self.size-1]]
+
+    def finish(self):
+        """
+        Move the completed file to its destination and drop the journal.
+        """
+        os.rename(self.part, self.destination)
+        self.discard()
+
+    def discard(self):
+        """
+        Remove the journal and any partial data.
+        """
+        for filename in (self.journal, self.part):
+            if os.path.isfile(filename):
+                os.remove(filename)
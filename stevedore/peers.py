@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Sharing of the input data directory between the nodes of a cluster. A node
+    can serve its input data read-only over HTTP and announce itself on the
+    local network. Other nodes keep a registry of these peers and try them
+    before the data servers, checking every file against the peer's checksum.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import os
+import re
+import json
+import fnmatch
+import hashlib
+import httplib
+import logging
+import socket
+import threading
+import time
+import urllib
+import uuid
+import BaseHTTPServer
+import SocketServer
+from downloader import get_downloader, DownloadError
+from partialfile import PartialFile
+from manifest import Manifest
+
+#TCP port the input data is served on.
+PEER_PORT = 8470
+
+#UDP port used to announce peers on the local network.
+DISCOVERY_PORT = 8471
+
+#Seconds between two announcements of a serving node.
+ANNOUNCE_INTERVAL = 30
+
+#Identifies this process in announcements so that it does not register itself.
+NODE_ID = uuid.uuid4().hex
+
+#Response header carrying the SHA-1 of the whole file.
+CHECKSUM_HEADER = 'X-Checksum-SHA1'
+
+#Response header carrying the fields_key of the Vtable fields a file was cut down to.
+FIELDS_HEADER = 'X-Vtable-Fields'
+
+
+def file_checksum(filename):
+    """
+    SHA-1 of the content of filename.
+    """
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as infile:
+        while True:
+            block = infile.read(1024*1024)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CacheRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    Answers GET and HEAD requests for files of the input data directory.
+    Single byte ranges are supported so that downloads can be resumed.
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self._send(False)
+
+    def do_GET(self):
+        self._send(True)
+
+    def _send(self, with_body):
+        """
+        Send the headers and, if with_body, the content of the requested file.
+        """
+        filename = self.server.resolve(self.path)
+        if filename is None:
+            self.send_error(404, 'Not in the input data cache')
+            return
+
+        size = os.path.getsize(filename)
+        first, last = 0, size-1
+        found = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if found is not None:
+            first = int(found.group(1))
+            if found.group(2):
+                last = min(int(found.group(2)), size-1)
+            if first > last:
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */'+str(size))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes '+str(first)+'-'+str(last)+'/'+str(size))
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(last-first+1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header(CHECKSUM_HEADER, self.server.checksum(filename))
+        fields = self.server.fields_of(filename)
+        if fields is not None:
+            self.send_header(FIELDS_HEADER, fields)
+        self.end_headers()
+        if not with_body:
+            return
+
+        with open(filename, 'rb') as infile:
+            infile.seek(first)
+            remaining = last-first+1
+            while remaining > 0:
+                block = infile.read(min(remaining, 1024*1024))
+                if not block:
+                    break
+                self.wfile.write(block)
+                remaining = remaining - len(block)
+
+    def log_message(self, format, *args):
+        logging.debug('CacheServer: '+self.address_string()+' '+(format % args))
+
+
+class CacheServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    Read-only HTTP server of the input data directory of this node.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    #Files never served: downloads in progress and bookkeeping of this node.
+    HIDDEN = ['*.part', '*.part.journal', '*.tmp', '*.db', '*.db-journal', '*.json', '*.lock']
+
+    def __init__(self, directory, port=PEER_PORT):
+        '''
+        Constructor of a CacheServer object.
+        '''
+        BaseHTTPServer.HTTPServer.__init__(self, ('', port), CacheRequestHandler)
+        self.directory = os.path.realpath(directory)
+        self.port = self.server_address[1]
+        #(filename, size, mtime) -> SHA-1, so that a file is only hashed once.
+        self._checksums = {}
+        self._lock = threading.Lock()
+        #The manifest of the directory, opened once a request needs it.
+        self._manifest = None
+        #Set by stop() to end the announcements.
+        self._stopped = threading.Event()
+        #The threads serving, announcing and answering requests, joined by stop().
+        self._threads = []
+
+    def resolve(self, path):
+        """
+        The file of the input data directory at url path, None if there is no
+        such file or it must not be served.
+        """
+        path = urllib.unquote(path.split('?', 1)[0])
+        names = [name for name in path.split('/') if name]
+        if not names or any(name.startswith('.') for name in names):
+            return None
+        if any(fnmatch.fnmatch(names[-1], pattern) for pattern in self.HIDDEN):
+            return None
+
+        filename = os.path.realpath(os.path.join(self.directory, *names))
+        if not filename.startswith(self.directory+os.sep) or not os.path.isfile(filename) or \
+           os.path.getsize(filename) == 0:
+            return None
+        return filename
+
+    def checksum(self, filename):
+        """
+        SHA-1 of filename, computed once per version of the file.
+        """
+        stat = os.stat(filename)
+        key = (filename, stat.st_size, stat.st_mtime)
+        with self._lock:
+            checksum = self._checksums.get(key)
+        if checksum is None:
+            checksum = file_checksum(filename)
+            with self._lock:
+                self._checksums[key] = checksum
+        return checksum
+
+    def fields_of(self, filename):
+        """
+        The fields_key of the Vtable fields filename was cut down to according
+        to the manifest of the directory, None for a whole file.
+        """
+        if self._manifest is None:
+            if not os.path.isfile(self.directory+'/manifest.db'):
+                return None
+            with self._lock:
+                if self._manifest is None:
+                    self._manifest = Manifest(self.directory+'/manifest.db')
+        return self._manifest.fields_of(filename)
+
+    def start(self):
+        """
+        Serve and announce this node in background threads.
+        """
+        logging.info('CacheServer: serving '+self.directory+' on port '+str(self.port))
+        for target, name in ((self.serve_forever, 'peer-server'), (self._announce, 'peer-announce')):
+            self._start_thread(target, (), name)
+
+    def stop(self, timeout=10):
+        """
+        Stop serving and announcing, waiting up to timeout seconds for each
+        background thread, i.e. a request still being answered.
+        """
+        self._stopped.set()
+        with self._lock:
+            started = bool(self._threads)
+        #shutdown() waits for serve_forever, which only runs once started.
+        if started:
+            self.shutdown()
+        self.server_close()
+        with self._lock:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(timeout)
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+
+    def process_request(self, request, client_address):
+        """
+        Answer a request in a thread of its own (see SocketServer.ThreadingMixIn).
+        """
+        self._start_thread(self.process_request_thread, (request, client_address), 'peer-request')
+
+    def _start_thread(self, target, args, name):
+        """
+        Run target(*args) in a daemon thread that stop() waits for.
+        """
+        thread = threading.Thread(target=target, args=args, name=name)
+        thread.daemon = True
+        with self._lock:
+            self._threads = [running for running in self._threads if running.is_alive()]
+            self._threads.append(thread)
+        thread.start()
+
+    def _announce(self):
+        """
+        Broadcast the port of this server on the local network every ANNOUNCE_INTERVAL
+        seconds until stop() is called.
+        """
+        message = json.dumps({'id': NODE_ID, 'port': self.port})
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        try:
+            while not self._stopped.is_set():
+                try:
+                    sock.sendto(message, ('<broadcast>', DISCOVERY_PORT))
+                except socket.error, err:
+                    logging.debug('CacheServer: announcement failed: '+str(err))
+                self._stopped.wait(ANNOUNCE_INTERVAL)
+        finally:
+            sock.close()
+
+
+class PeerRegistry(object):
+    '''
+    The nodes this node may fetch input data from. Peers are listed by hand in
+    the registry file (or STEVEDORE_PEERS) or discovered from announcements.
+    '''
+
+    #Discovered peers are forgotten when they have not been heard of for this many seconds.
+    PEER_TIMEOUT = 3*ANNOUNCE_INTERVAL
+
+    def __init__(self, directory, filename=None):
+        '''
+        Constructor of a PeerRegistry object.
+        directory is the local input data directory, mirrored by every peer.
+        '''
+        self.directory = os.path.realpath(directory)
+        self.filename = filename or directory+'/peers.json'
+        #Peer urls listed in the registry file.
+        self.listed = []
+        #Peer url -> time it was last announced.
+        self.discovered = {}
+        #Peers that failed during this run and are no longer asked.
+        self.down = set()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """
+        Read the registry file. Missing or unreadable files give an empty registry.
+        """
+        try:
+            registry = json.load(open(self.filename))
+        except (IOError, ValueError):
+            return
+        self.listed = [url.rstrip('/') for url in registry.get('peers', [])]
+        now = time.time()
+        for url, seen in registry.get('discovered', {}).items():
+            if now-seen < self.PEER_TIMEOUT:
+                self.discovered[url] = seen
+
+    def save(self):
+        """
+        Write the registry file so that other runs on this node know the discovered peers.
+        """
+        with self._lock:
+            registry = {'peers': self.listed, 'discovered': dict(self.discovered)}
+        try:
+            tmp = self.filename+'.tmp'
+            with open(tmp, 'w') as outfile:
+                json.dump(registry, outfile, indent=1)
+            os.rename(tmp, self.filename)
+        except (IOError, OSError), err:
+            logging.info('PeerRegistry: can not write '+self.filename+': '+str(err))
+
+    def peers(self):
+        """
+        Urls of the peers to try, listed ones first.
+        """
+        now = time.time()
+        found = [url.rstrip('/') for url in
+                 re.split(r'[\s,]+', os.environ.get('STEVEDORE_PEERS', '')) if url]
+        with self._lock:
+            found.extend(url for url in self.listed if url not in found)
+            found.extend(sorted(url for url, seen in self.discovered.items()
+                                if now-seen < self.PEER_TIMEOUT and url not in found))
+            return [url for url in found if url not in self.down]
+
+    def listen(self):
+        """
+        Register peers announcing themselves on the local network, in a background thread.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(('', DISCOVERY_PORT))
+        except socket.error, err:
+            logging.info('PeerRegistry: not listening for peers: '+str(err))
+            return
+        thread = threading.Thread(target=self._listen, args=(sock,), name='peer-listen')
+        thread.daemon = True
+        thread.start()
+
+    def _listen(self, sock):
+        """
+        Receive announcements for ever.
+        """
+        while True:
+            try:
+                message, address = sock.recvfrom(1024)
+                announcement = json.loads(message)
+                if announcement.get('id') == NODE_ID:
+                    continue
+                url = 'http://'+address[0]+':'+str(int(announcement['port']))
+            except (socket.error, ValueError, KeyError, TypeError, AttributeError), err:
+                logging.debug('PeerRegistry: bad announcement: '+str(err))
+                continue
+
+            with self._lock:
+                new = url not in self.discovered
+                self.discovered[url] = time.time()
+                self.down.discard(url)
+            if new:
+                logging.info('PeerRegistry: found peer '+url)
+                self.save()
+
+    def fetch(self, filename, validator=None, fields=None):
+        """
+        Download the local file filename from the first peer that has it and
+        check it against the checksum sent by the peer. Copies cut down to
+        other Vtable fields than fields (see gribindex.fields_key, None for the
+        whole file) are not taken.
+        Returns the url it came from, None if no peer had it.
+        """
+        relative = os.path.relpath(os.path.realpath(filename), self.directory)
+        if relative.startswith(os.pardir):
+            return None
+        path = '/'.join(urllib.quote(name) for name in relative.split(os.sep))
+
+        downloader = get_downloader()
+        for peer in self.peers():
+            url = peer+'/'+path
+            try:
+                #A single byte tells whether the peer has the file and its checksum.
+                transfer = downloader.open(url, offset=0, length=1)
+                transfer.read(1)
+                transfer.close()
+                checksum = transfer.headers.get(CHECKSUM_HEADER.lower())
+                cut_to = transfer.headers.get(FIELDS_HEADER.lower())
+                if cut_to is not None and cut_to != fields:
+                    logging.info('PeerRegistry: '+url+' only holds the fields of another Vtable')
+                    continue
+
+                if validator is not None:
+                    validator.reset()
+                downloader.fetch(url, filename, validator=validator, retries=1)
+                if checksum is None or file_checksum(filename) != checksum:
+                    os.remove(filename)
+                    raise DownloadError('Checksum of '+url+' does not match', url, retry=False)
+
+            except DownloadError, err:
+                PartialFile(filename).discard()
+                if err.status != 404:
+                    logging.info('PeerRegistry: '+peer+' failed: '+str(err))
+                    with self._lock:
+                        self.down.add(peer)
+                continue
+            except (socket.error, httplib.HTTPException, OSError), err:
+                logging.info('PeerRegistry: '+peer+' failed: '+str(err))
+                with self._lock:
+                    self.down.add(peer)
+                continue
+
+            logging.info('Downloaded '+filename+' from peer '+peer)
+            return url
+
+        return None
+
+
+#The peer registry shared by every download of this process.
+_SHARED_REGISTRY = None
+_SHARED_LOCK = threading.Lock()
+
+
+def get_peer_registry(directory):
+    """
+    Return the PeerRegistry shared by this process, creating it and listening
+    for announcements on first use.
+    """
+    global _SHARED_REGISTRY
+    with _SHARED_LOCK:
+        if _SHARED_REGISTRY is None:
+            _SHARED_REGISTRY = PeerRegistry(directory)
+            _SHARED_REGISTRY.listen()
+        return _SHARED_REGISTRY
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Pipelined preparation of input data. Files are handed to a prepare
+    process as soon as they are downloaded, so downloading, prepare() and
+    ungrib.exe keep the network, the CPUs and the disk busy at the same time.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+import logging
+import multiprocessing
+import threading
+import time
+import Queue
+from inputdataset import InputDataSet
+from manifest import Manifest
+
+
+class PreparePipeline(object):
+    '''
+    Runs prepare() of the datasets of a run in a separate process while their
+    files are still being downloaded. The process has its own working directory,
+    so the chdir() done by prepare() does not disturb ungrib in this process.
+    A dataset is ready for ungrib once every one of its files has been
+    downloaded and prepare() has run after the last of them.
+    The process is started once, before this process starts any thread, and
+    serves its runs one after the other (see begin): a process forked while
+    another thread holds a lock (i.e. of logging) would hang on it.
+    '''
+
+    #Downloaded files waiting for prepare(). Download threads wait when it is full.
+    QUEUE_SIZE = 8
+
+    #Seconds the prepare process may work on the files handed to it without
+    #finishing any before it is given up on and prepare() is left to the caller.
+    READY_TIMEOUT = 1800
+
+    def __init__(self, queue_size=None):
+        '''
+        Constructor of a PreparePipeline object.
+        '''
+        self.queue_size = queue_size or self.QUEUE_SIZE
+        #The run being served, its arguments of prepare() and its manifest database.
+        self.run = 0
+        self.prepare_args = {}
+        self.database = None
+        #Dataset name -> InputDataSet object used for prepare() and number of files expected.
+        self.datasets = {}
+        self.expected = {}
+        #Dataset name -> files handed to the prepare process and files it has prepared.
+        self._sent = {}
+        self._done = {}
+        #Set once the prepare process is given up on.
+        self.broken = False
+        self._lock = threading.Lock()
+        self._queue = None
+        self._results = None
+        self._process = None
+
+    def start(self):
+        """
+        Start the prepare process.
+        """
+        self._queue = multiprocessing.Queue(self.queue_size)
+        self._results = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=self._work, name='prepare')
+        self._process.daemon = True
+        self._process.start()
+
+    def begin(self, prepare_args):
+        """
+        Start serving a new run. prepare_args are passed to every call of prepare().
+        """
+        with self._lock:
+            self.run = self.run+1
+            self.prepare_args = prepare_args
+            self.database = None if InputDataSet.manifest is None else InputDataSet.manifest.database
+            self.datasets = {}
+            self.expected = {}
+            self._sent = {}
+            self._done = {}
+
+    def expect(self, ids, dataset, count):
+        """
+        Announce count files of the dataset ids, prepared with the InputDataSet dataset.
+        """
+        with self._lock:
+            self.datasets[ids] = dataset
+            self.expected[ids] = self.expected.get(ids, 0)+count
+
+    def downloaded(self, ids):
+        """
+        Hand a downloaded (or failed) file of the dataset ids to the prepare process.
+        """
+        with self._lock:
+            if ids not in self.expected or self.broken:
+                return
+            self._sent[ids] = self._sent.get(ids, 0)+1
+            work = (self.run, ids, self.datasets[ids], self.prepare_args, self.database)
+        try:
+            self._queue.put(work, True, self.READY_TIMEOUT)
+        except Queue.Full:
+            self._give_up('takes no more files')
+
+    def wait_ready(self, ids):
+        """
+        Wait until the dataset ids is ready for ungrib. Returns False if the
+        pipeline will not prepare it (the prepare process died or hangs), the
+        caller then has to call prepare() itself.
+        """
+        if ids not in self.expected:
+            return False
+        logging.info('PreparePipeline: waiting for '+str(ids))
+        return self._wait(lambda: self._done.get(ids, 0) >= self.expected[ids])
+
+    def finish(self):
+        """
+        Wait for the prepare process to finish the files of this run handed to it.
+        """
+        self._wait(lambda: not self._outstanding())
+
+    def close(self):
+        """
+        Stop the prepare process once it has finished the work queued.
+        """
+        if self._process is None:
+            return
+        if not self.broken:
+            self._queue.put(None)
+            self._process.join()
+        self._process = None
+
+    def _outstanding(self):
+        """
+        True if files handed to the prepare process in this run are not prepared yet.
+        """
+        with self._lock:
+            return any(self._done.get(ids, 0) < sent for ids, sent in self._sent.items())
+
+    def _wait(self, done):
+        """
+        Collect what the prepare process has prepared until done() is True.
+        Returns False if the process is given up on first.
+        """
+        progress = time.time()
+        while not done():
+            if self.broken:
+                return False
+            if not self._process.is_alive():
+                self._give_up('has died')
+                return False
+            try:
+                run, ids = self._results.get(True, 1.0)
+            except Queue.Empty:
+                #Only time the process while it has files to prepare.
+                if not self._outstanding():
+                    progress = time.time()
+                elif time.time()-progress > self.READY_TIMEOUT:
+                    self._give_up('has not prepared a file for '+str(self.READY_TIMEOUT)+' s')
+                    return False
+                continue
+            progress = time.time()
+            with self._lock:
+                if run == self.run:
+                    self._done[ids] = self._done.get(ids, 0)+1
+        return True
+
+    def _give_up(self, reason):
+        """
+        Stop using the prepare process, the runs prepare their datasets themselves.
+        """
+        with self._lock:
+            if self.broken:
+                return
+            self.broken = True
+        logging.error('PreparePipeline: prepare process '+reason+', preparing without it')
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join()
+
+    def _work(self):
+        """
+        Body of the prepare process.
+        """
+        manifest = None
+        while True:
+            work = self._queue.get()
+            if work is None:
+                break
+            run, ids, dataset, prepare_args, database = work
+
+            #Do not share the database connection of the parent process.
+            if database != (manifest.database if manifest is not None else None):
+                manifest = None if database is None else Manifest(database)
+            InputDataSet.manifest = manifest
+
+            #Every call picks up all files of the dataset not prepared yet.
+            try:
+                dataset.prepare(**prepare_args)
+            except Exception, err:
+                logging.error('PreparePipeline: prepare of '+str(ids)+' failed: '+str(err))
+            self._results.put((run, ids))
+
+
+#The prepare pipeline shared by the runs of this process.
+_SHARED_PIPELINE = None
+_SHARED_LOCK = threading.Lock()
+
+
+def get_prepare_pipeline():
+    """
+    Return the PreparePipeline shared by the runs of this process, starting its
+    process on first use. The first call should come before any thread is started.
+    """
+    global _SHARED_PIPELINE
+    with _SHARED_LOCK:
+        if _SHARED_PIPELINE is None:
+            _SHARED_PIPELINE = PreparePipeline()
+            _SHARED_PIPELINE.start()
+        return _SHARED_PIPELINE
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Expansion of the datasets of a run into the InputDataSet objects of every
+    file the run needs. Shared by Stevedore.check_input_data and the prefetcher.
+    Datasets described in the registry can also be planned over a whole time
+    range in one pass without creating objects (see plan_range). The files of
+    a run are kept compactly by an InputFileStore.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+from array import array
+from datetime import datetime, timedelta
+from datasets_aux import *
+from datasets_fcst import *
+from datasets_hist import *
+from datasets_sst import *
+from registry import get_spec
+
+#Seconds in an hour
+SEC_IN_HOUR = 3600
+
+#The InputDataSet class of each dataset name accepted on the command line.
+DATASET_CLASSES = dict((dataset_class.__name__[len('InputDataSet'):], dataset_class)
+                       for dataset_class in [InputDataSetCFDDA,
+                                             InputDataSetCFSR,
+                                             InputDataSetERAIML,
+                                             InputDataSetERAISFC,
+                                             InputDataSetFNL,
+                                             InputDataSetFNLp25,
+                                             InputDataSetGFS,
+                                             InputDataSetGFSFCST,
+                                             InputDataSetGFSp25,
+                                             InputDataSetGFSsubset,
+                                             InputDataSetLittleRSurface,
+                                             InputDataSetLittleRUpperAir,
+                                             InputDataSetMESONET,
+                                             InputDataSetMETAR,
+                                             InputDataSetNAM,
+                                             InputDataSetNASAGF,
+                                             InputDataSetNASALISCONUS,
+                                             InputDataSetPREPBufr,
+                                             InputDataSetRAP,
+                                             InputDataSetSSTJPL,
+                                             InputDataSetSSTNCEP,
+                                             InputDataSetSSTOISST,
+                                             InputDataSetSSTSPORT])
+
+
+def get_dataset_class(name):
+    """
+    Return the InputDataSet class of the dataset name, i.e. InputDataSetGFS for 'GFS'.
+    Raises ValueError for an unknown name.
+    """
+    try:
+        return DATASET_CLASSES[str(name)]
+    except KeyError:
+        raise ValueError('Unknown dataset '+str(name))
+
+
+class PlannedFile(object):
+    '''
+    A file of a dataset planned by plan_range.
+    '''
+
+    def __init__(self, date, hour, name, path, urls, name_prepared=None):
+        #Date the file is named for and the hour step of the run it is first needed at.
+        self.date = date
+        self.hour = hour
+        self.name = name
+        #Local directory of the file.
+        self.path = path
+        #Urls the file is tried from, in order.
+        self.urls = urls
+        #The file name after it is prepared.
+        self.name_prepared = name_prepared or name
+
+    @staticmethod
+    def of(inputDataSet):
+        """
+        The PlannedFile of the file of an InputDataSet object.
+        """
+        urls, _ = inputDataSet.download_key()
+        return PlannedFile(inputDataSet.date, inputDataSet.hour, inputDataSet.name,
+                           inputDataSet.path, urls, inputDataSet.name_prepared)
+
+    def download_key(self):
+        """
+        Same as InputDataSet.download_key of the object downloading this file.
+        """
+        return (self.urls, self.path+'/'+self.name)
+
+
+def hour_steps(intervalhours, forecast_length):
+    """
+    The hour steps of a run of forecast_length hours with a file every intervalhours hours.
+    """
+    return xrange(0, forecast_length+1, intervalhours)
+
+
+def plan_file(spec, datetime_start, hour, directory, is_analysis=False, today=None):
+    """
+    The PlannedFile of hour step hour of a run starting at datetime_start, from
+    the DatasetSpec of its dataset. today may be passed when planning many files.
+    """
+    date = spec.date_of(datetime_start, hour, is_analysis)
+    filename, urls, paths = spec.resolve(date, hour, today)
+    return PlannedFile(date, hour, filename, directory+'/'+spec.directory,
+                       tuple(url+'/'+server_path+'/'+filename
+                             for url, server_path in zip(urls, paths)),
+                       filename+spec.prepared)
+
+
+def expand_run(name, datetime_start, forecast_length, directory, bbox=None, is_analysis=False):
+    """
+    Create the InputDataSet objects of every file of the dataset name needed by
+    a run of forecast_length hours starting at datetime_start. bbox holds the
+    lon_min, lon_max, lat_min and lat_max of the outer domain.
+    Returns (dataset, files) where dataset describes the dataset as a whole.
+    """
+    dataset_class = get_dataset_class(name)
+    dataset = dataset_class(datetime_start, 0, directory, is_analysis=is_analysis)
+
+    #note we pass the hour steps rather than the new date as this depends on the dataset if we increment the date etc.
+    files = [dataset_class(datetime_start, hour, directory, is_analysis=is_analysis, **(bbox or {}))
+             for hour in hour_steps(dataset.intervalseconds/SEC_IN_HOUR, forecast_length)]
+    return dataset, files
+
+
+class InputFileStore(object):
+    '''
+    The input files of a run, kept as compact arrays of (dataset id, hour step)
+    with an integer task ID per distinct file. The valid time follows from the
+    hour step, the file name and urls from the registry (see plan_file). The
+    InputDataSet object of a task is created when it is asked for and not
+    kept, so that a run of months with hourly data does not hold hundreds of
+    thousands of objects. Task IDs are what is handed to the download threads.
+    '''
+
+    def __init__(self, datetime_start, directory, bbox=None, is_analysis=False):
+        '''
+        Constructor of an InputFileStore object, with the arguments of expand_run
+        shared by every dataset of the run.
+        '''
+        self.datetime_start = datetime_start
+        self.directory = directory
+        self.bbox = bbox or {}
+        self.is_analysis = is_analysis
+        #Dataset names, classes, DatasetSpecs and objects describing the dataset
+        #as a whole, the dataset id of a task is an index in these.
+        self.names = []
+        self.classes = []
+        self.specs = []
+        self.datasets = []
+        #Dataset id and hour step of each task.
+        self._datasets = array('H')
+        self._hours = array('l')
+        #PlannedFiles of the tasks of datasets not in the registry.
+        self._planned = {}
+        #Objects changed while downloading in a way a new object would not know (see keep).
+        self._kept = {}
+        self._today = datetime.today().date()
+
+    def expand(self, name, forecast_length):
+        """
+        Add the files of the dataset name needed by a run of forecast_length hours.
+        Returns (dataset, tasks) where dataset describes the dataset as a whole
+        and tasks are the task IDs of its distinct files (see plan_range).
+        """
+        dataset_class = get_dataset_class(name)
+        dataset = dataset_class(self.datetime_start, 0, self.directory, is_analysis=self.is_analysis)
+        planned = plan_range(name, self.datetime_start, forecast_length, self.directory,
+                             self.is_analysis)
+        if planned is None:
+            #Datasets not in the registry name their files themselves.
+            _, files = expand_run(name, self.datetime_start, forecast_length, self.directory,
+                                  self.bbox, self.is_analysis)
+            planned = [PlannedFile.of(inputDataSet) for inputDataSet in unique_downloads(files)]
+
+        if name not in self.names:
+            self.names.append(name)
+            self.classes.append(dataset_class)
+            self.specs.append(get_spec(name))
+            self.datasets.append(dataset)
+        dataset_id = self.names.index(name)
+
+        first = len(self._hours)
+        for planned_file in planned:
+            if self.specs[dataset_id] is None:
+                self._planned[len(self._hours)] = planned_file
+            self._datasets.append(dataset_id)
+            self._hours.append(planned_file.hour)
+        return dataset, xrange(first, len(self._hours))
+
+    def __len__(self):
+        return len(self._hours)
+
+    def __iter__(self):
+        for task in xrange(len(self._hours)):
+            yield self.planned(task)
+
+    def name_of(self, task):
+        """
+        The name of the dataset of a task.
+        """
+        return self.names[self._datasets[task]]
+
+    def dataset_of(self, task):
+        """
+        The object describing the dataset of a task as a whole.
+        """
+        return self.datasets[self._datasets[task]]
+
+    def hour_of(self, task):
+        """
+        The hour step of a task.
+        """
+        return self._hours[task]
+
+    def valid_time(self, task):
+        """
+        The time the file of a task is for.
+        """
+        return self.datetime_start+timedelta(hours=self._hours[task])
+
+    def planned(self, task):
+        """
+        The PlannedFile of a task, without creating its InputDataSet object.
+        """
+        if task in self._kept:
+            return PlannedFile.of(self._kept[task])
+        spec = self.specs[self._datasets[task]]
+        if spec is None:
+            return self._planned[task]
+        return plan_file(spec, self.datetime_start, self._hours[task], self.directory,
+                         self.is_analysis, self._today)
+
+    def get(self, task):
+        """
+        The InputDataSet object of a task, for the thread downloading it. Everything
+        else needs only its PlannedFile (see planned).
+        """
+        inputDataSet = self._kept.get(task)
+        if inputDataSet is None:
+            inputDataSet = self.classes[self._datasets[task]](self.datetime_start, self._hours[task],
+                                                              self.directory, is_analysis=self.is_analysis,
+                                                              **self.bbox)
+        return inputDataSet
+
+    def keep(self, task, inputDataSet):
+        """
+        Keep inputDataSet as the object of a task. Used when the name of its file
+        changed while downloading (i.e. InputDataSetSSTOISST.use_name), a new
+        object would look for the file under the name it starts with.
+        """
+        self._kept[task] = inputDataSet
+
+
+def plan_range(name, datetime_start, hours, directory, is_analysis=False):
+    """
+    Plan the files of the dataset name needed for hours hours from datetime_start
+    in one pass over its DatasetSpec, without creating an InputDataSet object per
+    hour step. Returns the PlannedFile of every distinct file in order, or None
+    if the dataset is not in the registry (use expand_run instead).
+    """
+    spec = get_spec(name)
+    if spec is None:
+        return None
+
+    today = datetime.today().date()
+    seen = set()
+    planned = []
+    for hour in hour_steps(spec.interval, hours):
+        planned_file = plan_file(spec, datetime_start, hour, directory, is_analysis, today)
+        key = planned_file.download_key()
+        if key not in seen:
+            seen.add(key)
+            planned.append(planned_file)
+    return planned
+
+
+def unique_downloads(files):
+    """
+    The InputDataSet objects of files that download distinct files, in order.
+    Objects downloading the same file as an earlier one are left out.
+    """
+    seen = set()
+    unique = []
+    for inputDataSet in files:
+        key = inputDataSet.download_key()
+        if key not in seen:
+            seen.add(key)
+            unique.append(inputDataSet)
+    return unique
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Polling of the server directories of real-time products (i.e. GFSFCST,
+    RAP, NAM) so that each forecast hour is downloaded as soon as it is
+    published instead of failing when a run starts before the data is out.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import time
+import logging
+import threading
+from downloader import get_downloader, DownloadError
+from scheduler import get_host_limits
+from availability import get_availability_index
+
+
+class PublicationPoller(object):
+    '''
+    Lists the server directory of files that are not published yet, backing
+    off while nothing new appears, and calls back for each file as soon as it
+    is there. Files still missing after the timeout are handed over anyway so
+    that their download fails the way it did without polling.
+    '''
+
+    #Seconds between two listings of a directory right after a file appeared in it.
+    INTERVAL = 15
+
+    #While nothing appears the interval doubles up to this many seconds.
+    MAX_INTERVAL = 240
+
+    def __init__(self, timeout, interval=None, max_interval=None):
+        '''
+        Constructor of a PublicationPoller object.
+        timeout is the number of seconds to wait for a file.
+        '''
+        self.timeout = timeout
+        self.interval = interval or self.INTERVAL
+        self.max_interval = max_interval or self.MAX_INTERVAL
+        #Directory url -> [(InputDataSet, callback)] of the files not published yet.
+        self._pending = {}
+        #Directory url -> (time of the next listing, current interval).
+        self._schedule = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self.started = None
+        self.stopped = False
+
+    @staticmethod
+    def directory_of(inputDataSet):
+        """
+        The url of the directory inputDataSet is published in.
+        """
+        return inputDataSet.server_url[0]+'/'+inputDataSet.server_path[0]
+
+    @staticmethod
+    def is_published(inputDataSet, names):
+        """
+        True if the file of inputDataSet is among the names listed in its directory.
+        Servers that publish .idx inventories write them after the file, so
+        there a file only counts once its inventory is listed too.
+        """
+        if inputDataSet.name not in names:
+            return False
+        if inputDataSet.name+'.idx' in names:
+            return True
+        return not any(name.endswith('.idx') for name in names)
+
+    def watch(self, inputDataSet, callback):
+        """
+        Call callback() once the file of inputDataSet is published.
+        """
+        directory = self.directory_of(inputDataSet)
+        with self._cond:
+            self._pending.setdefault(directory, []).append((inputDataSet, callback))
+            self._schedule.setdefault(directory, (0, self.interval))
+            self._cond.notify_all()
+
+    def start(self):
+        """
+        Poll in a background thread until every file watched is handed over.
+        """
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name='publication-poller')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling. Files not published yet are not handed over.
+        """
+        with self._cond:
+            self.stopped = True
+            self._cond.notify_all()
+
+    def _run(self):
+        """
+        List every directory when it is due.
+        """
+        while True:
+            with self._cond:
+                if self.stopped or not self._pending:
+                    return
+                now = time.time()
+                due = [directory for directory in self._pending
+                       if self._schedule[directory][0] <= now]
+                if not due:
+                    wake = min(self._schedule[directory][0] for directory in self._pending)
+                    self._cond.wait(max(0.01, min(wake-now, self.max_interval)))
+                    continue
+
+            for directory in due:
+                published = self._poll(directory)
+                with self._cond:
+                    interval = self._schedule[directory][1]
+                    interval = self.interval if published else min(2*interval, self.max_interval)
+                    self._schedule[directory] = (time.time()+interval, interval)
+
+    def _poll(self, directory):
+        """
+        List directory once and hand over the files found in it. Returns the
+        number of files that were published.
+        """
+        names = None
+        try:
+            with get_host_limits().slot(directory):
+                names = set(get_downloader().list_directory(directory))
+            #Downloads handed over must not be stopped by an older listing.
+            get_availability_index().update(directory, names)
+        except DownloadError, err:
+            logging.info('PublicationPoller: listing '+directory+' failed: '+str(err))
+
+        timed_out = time.time()-self.started > self.timeout
+        with self._cond:
+            ready = []
+            waiting = []
+            for entry in self._pending.get(directory, []):
+                if names is not None and self.is_published(entry[0], names):
+                    ready.append(entry)
+                elif timed_out:
+                    logging.warning('PublicationPoller: '+entry[0].name+' not published after '+
+                                    str(int(self.timeout))+' s, downloading it anyway')
+                    ready.append(entry)
+                else:
+                    waiting.append(entry)
+            if waiting:
+                self._pending[directory] = waiting
+            else:
+                self._pending.pop(directory, None)
+
+        published = 0
+        for inputDataSet, callback in ready:
+            if names is not None and inputDataSet.name in names:
+                published = published + 1
+                logging.info('PublicationPoller: '+inputDataSet.name+' is published')
+            try:
+                callback()
+            except Exception, err:
+                logging.error('PublicationPoller: handing over '+inputDataSet.name+
+                              ' failed with '+str(err))
+        return published
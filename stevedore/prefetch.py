@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Background prefetcher filling the input data directory with the files of
+    runs planned for later, within a bandwidth and a disk budget, so that a
+    multi-day batch finds the input data of each day already on local disk.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import os
+import logging
+import threading
+import time
+from inputdataset import InputDataSet
+from downloader import get_downloader
+from planner import InputFileStore
+
+
+class PlannedRun(object):
+    '''
+    A simulation that will be run later and whose input data may be fetched ahead.
+    '''
+
+    def __init__(self, datetime_start, forecast_length, datasets, bbox=None, is_analysis=False):
+        self.datetime_start = datetime_start
+        self.forecast_length = forecast_length
+        #Names of the datasets used, i.e. ['GFS', 'SSTNCEP']
+        self.datasets = datasets
+        #lon_min, lon_max, lat_min, lat_max of the outer domain.
+        self.bbox = bbox
+        self.is_analysis = is_analysis
+
+
+class TokenBucket(object):
+    '''
+    Keeps the average transfer rate below rate bytes per second, allowing
+    bursts of up to burst bytes.
+    '''
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst if burst is not None else self.rate*10
+        self.tokens = self.burst
+        self.updated = time.time()
+        #The segments of a download take from the bucket in their own threads.
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        """
+        Take nbytes out of the bucket, sleeping until it is no longer in debt.
+        """
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens+(now-self.updated)*self.rate)-nbytes
+            self.updated = now
+            debt = -self.tokens
+        if debt > 0:
+            time.sleep(debt/self.rate)
+
+
+class Prefetcher(object):
+    '''
+    Downloads the input data of planned runs in a background thread, earliest
+    run first and within a run the initial conditions first. Runs that the
+    foreground has reached (see advance) are left to the foreground.
+    '''
+
+    #Seconds between checks of the disk budget while it is used up.
+    POLL = 60
+
+    def __init__(self, directory, runs, bandwidth=None, disk_budget=None, configure=None,
+                 crop_halo=None):
+        '''
+        Constructor of a Prefetcher object.
+        bandwidth is in bytes per second and disk_budget in bytes, None for no limit.
+        configure is called with every InputDataSet and the start of its run
+        before it is looked for to apply the settings of the run (i.e.
+        Stevedore.configure_download).
+        If crop_halo is given files are also cropped to the bounding box of
+        their run plus crop_halo degrees (see InputDataSet.crop).
+        '''
+        self.directory = directory
+        self.runs = sorted(runs, key=lambda run: run.datetime_start)
+        self.bucket = TokenBucket(bandwidth) if bandwidth else None
+        self.disk_budget = disk_budget
+        self.configure = configure
+        self.crop_halo = crop_halo
+        #Start time of the run the foreground is working on.
+        self.current = None
+        #Start time of the run of the file being downloaded, None if idle.
+        self.in_flight = None
+        self.stopped = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """
+        Start prefetching in a background thread.
+        """
+        self._thread = threading.Thread(target=self._run, name='prefetch')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop after the file in flight.
+        """
+        with self._cond:
+            self.stopped = True
+            self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """
+        Wait for the background thread to end, i.e. after stop().
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def advance(self, datetime_start):
+        """
+        Tell the prefetcher that the foreground starts the run at datetime_start.
+        Waits for a download of that run (or an earlier one) to finish so that
+        both do not write the same file.
+        """
+        with self._cond:
+            self.current = datetime_start
+            self._cond.notify_all()
+            while self.in_flight is not None and self.in_flight <= datetime_start:
+                self._cond.wait(1.0)
+
+    def _is_due(self, run):
+        """
+        True if the foreground has not reached run yet. Must be called holding self._cond.
+        """
+        return not self.stopped and (self.current is None or run.datetime_start > self.current)
+
+    def _plan(self, run):
+        """
+        The InputFileStore of the files of run and their task IDs in the order to
+        fetch them. Files are planned from the registry, the InputDataSet object
+        of a file is only created when it is fetched.
+        """
+        store = InputFileStore(run.datetime_start, self.directory, run.bbox, run.is_analysis)
+        tasks = []
+        for name in run.datasets:
+            try:
+                _, dataset_tasks = store.expand(name, run.forecast_length)
+            except Exception, err:
+                logging.error('Prefetcher: can not plan '+str(name)+': '+str(err))
+                continue
+            tasks.extend(dataset_tasks)
+        #Initial conditions first, then the boundary conditions in time order.
+        return store, sorted(tasks, key=store.hour_of)
+
+    def disk_usage(self):
+        """
+        Bytes used by the input data directory.
+        """
+        if InputDataSet.cache is not None:
+            return InputDataSet.cache.size()
+        used = 0
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                try:
+                    used = used + os.path.getsize(os.path.join(root, filename))
+                except OSError:
+                    pass
+        return used
+
+    def _wait_for_room(self, run):
+        """
+        Wait until the disk budget allows another file. Returns False if run
+        is no longer due in the mean time. The disk usage may take a while to
+        work out, self._cond is only held to wait so that advance() is not held up.
+        """
+        while self.disk_budget is not None and self.disk_usage() >= self.disk_budget:
+            logging.info('Prefetcher: disk budget used up, waiting')
+            with self._cond:
+                if not self._is_due(run):
+                    return False
+                self._cond.wait(self.POLL)
+                if not self._is_due(run):
+                    return False
+        return True
+
+    def _run(self):
+        """
+        Fetch the files of every planned run.
+        """
+        for run in self.runs:
+            logging.info('Prefetcher: fetching input data of the run at '+str(run.datetime_start))
+            store, tasks = self._plan(run)
+            for task in tasks:
+                if not self._wait_for_room(run):
+                    break
+                with self._cond:
+                    if not self._is_due(run):
+                        break
+                    self.in_flight = run.datetime_start
+                try:
+                    self._fetch(store.get(task), run)
+                except Exception, err:
+                    logging.error('Prefetcher: failed to fetch '+str(store.planned(task).name)+': '+str(err))
+                finally:
+                    with self._cond:
+                        self.in_flight = None
+                        self._cond.notify_all()
+
+            with self._cond:
+                if self.stopped:
+                    return
+        logging.info('Prefetcher: all planned runs fetched')
+
+    def _fetch(self, inputDataSet, run):
+        """
+        Download the file of inputDataSet for run unless it is already there and
+        crop it if wanted.
+        """
+        #The settings of the run (i.e. its Vtable) tell whether the file on disk will do.
+        if self.configure is not None:
+            self.configure(inputDataSet, run.datetime_start)
+        if not inputDataSet.exists():
+            if self.bucket is None:
+                inputDataSet.download()
+            else:
+                #Charged block by block while the file downloads.
+                with get_downloader().throttled(self.bucket.consume):
+                    inputDataSet.download()
+
+        if self.crop_halo is not None and inputDataSet.croppable and run.bbox is not None:
+            inputDataSet.crop(run.bbox, self.crop_halo)
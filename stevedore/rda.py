@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    A single authenticated session with rda.ucar.edu shared by every RDA
+    dataset of the process. Cookies are renewed before they run out and
+    the login uses the same pooled connection as the downloads.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import os
+import logging
+import threading
+import time
+import urllib
+import urlparse
+from email.utils import parsedate_tz, mktime_tz
+from downloader import get_downloader, DownloadError
+
+
+class RDASession(object):
+    '''
+    The login cookies of rda.ucar.edu for this process.
+    '''
+
+    #Where to send the credentials.
+    LOGIN_URL = 'https://rda.ucar.edu/cgi-bin/login'
+
+    #Seconds a login is used for when the server does not say how long the cookies
+    #last. The old wget login was renewed every hour, this stays clear of that.
+    REFRESH = 50*60
+
+    #Cookies are renewed this many seconds before they expire.
+    EXPIRY_MARGIN = 5*60
+
+    def __init__(self, login_url=None, downloader=None):
+        '''
+        Constructor of a RDASession object.
+        '''
+        self.login_url = login_url or os.environ.get('RDA_LOGIN_URL', self.LOGIN_URL)
+        self.downloader = downloader or get_downloader()
+        #Cookie name -> value of the current login.
+        self.cookies = {}
+        #Time after which the cookies are renewed before use.
+        self.renew_at = 0
+        self._lock = threading.Lock()
+
+    def headers(self):
+        """
+        Return the request headers of an authenticated request, logging in
+        first if there is no login yet or it is about to run out.
+        """
+        with self._lock:
+            if not self.cookies or time.time() >= self.renew_at:
+                self._login()
+            return self._cookie_header(self.cookies)
+
+    def login(self):
+        """
+        Login now, replacing the current cookies.
+        """
+        with self._lock:
+            self._login()
+
+    def invalidate(self):
+        """
+        Forget the current login, i.e. after the server refused it.
+        The next call of headers() logs in again.
+        """
+        with self._lock:
+            self.cookies = {}
+            self.renew_at = 0
+
+    def _login(self):
+        """
+        Post the credentials found in RDA_EMAIL and RDA_PASS to the login page
+        and keep the cookies it sets. Must be called holding self._lock.
+        """
+        email = os.environ.get('RDA_EMAIL')
+        password = os.environ.get('RDA_PASS')
+        if not email or not password:
+            raise DownloadError('SET the environment variables RDA_EMAIL and'
+                                ' RDA_PASS to use this dataset', self.login_url, retry=False)
+
+        logging.info('Login to '+self.login_url+' with credentials'
+                     ' supplied by environment variables RDA_EMAIL and RDA_PASS')
+        body = urllib.urlencode([('email', email), ('passwd', password), ('action', 'login')])
+        url = self.login_url
+        status, headers, _ = self.downloader.post(url, body)
+
+        now = time.time()
+        cookies = {}
+        renew_at = now+self.REFRESH
+        for hop in range(self.downloader.MAX_REDIRECTS+1):
+            for header in headers.getheaders('set-cookie'):
+                name, value, expires = self._parse_cookie(header, now)
+                #Skip cookies the server deletes (expiry in the past).
+                if name is None or (expires is not None and expires <= now):
+                    cookies.pop(name, None)
+                    continue
+                if expires is not None:
+                    renew_at = min(renew_at, expires-self.EXPIRY_MARGIN)
+                cookies[name] = value
+
+            #The login page may redirect, i.e. to the page logged in users land on.
+            #Follow it with the cookies set so far, later hops may set more.
+            location = headers.get('location')
+            if status not in self.downloader.REDIRECT_STATUS or location is None or \
+               hop == self.downloader.MAX_REDIRECTS:
+                break
+            url = urlparse.urljoin(url, location)
+            logging.debug('Login redirected to '+url)
+            status, headers, _ = self.downloader.request(url, headers=self._cookie_header(cookies))
+
+        #Only the cookie tells a login that worked from one that did not, both are 200.
+        if not 200 <= status < 400 or not cookies:
+            raise DownloadError('Login to '+self.login_url+' failed with HTTP '+str(status),
+                                self.login_url, status, status in self.downloader.RETRY_STATUS)
+
+        self.cookies = cookies
+        self.renew_at = max(now, renew_at)
+        logging.info('Logged in to '+self.login_url+', renewing in '+
+                     str(int(self.renew_at-now))+' s')
+
+    @staticmethod
+    def _cookie_header(cookies):
+        """
+        The Cookie request header sending cookies.
+        """
+        return {'Cookie': '; '.join(name+'='+value for name, value in sorted(cookies.items()))}
+
+    @staticmethod
+    def _parse_cookie(header, now):
+        """
+        Split a Set-Cookie header into (name, value, expiry time).
+        The expiry time is None for session cookies.
+        """
+        attributes = [attribute.strip() for attribute in header.split(';')]
+        if '=' not in attributes[0]:
+            return None, None, None
+        name, value = attributes[0].split('=', 1)
+
+        expires = None
+        for attribute in attributes[1:]:
+            key, _, setting = attribute.partition('=')
+            key = key.lower()
+            if key == 'max-age' and setting.lstrip('-').isdigit():
+                #Max-Age wins over Expires.
+                return name, value, now+int(setting)
+            if key == 'expires':
+                parsed = parsedate_tz(setting)
+                if parsed is not None:
+                    expires = mktime_tz(parsed)
+        return name, value, expires
+
+
+#The RDA session shared by every download of this process.
+_SHARED_SESSION = None
+_SHARED_LOCK = threading.Lock()
+
+
+def get_rda_session():
+    """
+    Return the RDASession shared by this process, creating it on first use.
+    """
+    global _SHARED_SESSION
+    with _SHARED_LOCK:
+        if _SHARED_SESSION is None:
+            _SHARED_SESSION = RDASession()
+        return _SHARED_SESSION
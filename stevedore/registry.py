@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Declarative descriptions of the input datasets: the interval between
+    files, the directory they are kept in, and compiled templates of their
+    file names and server paths with the date rules choosing between them.
+    The InputDataSet classes name their files from these and the planner
+    expands whole time ranges from them without creating objects.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import re
+from datetime import datetime, timedelta
+
+#Positional fields of the date in a compiled Template, by strftime code.
+DATE_FIELDS = {'Y': '{0:04d}', 'y': '{1:02d}', 'm': '{2:02d}', 'd': '{3:02d}', 'H': '{4:02d}'}
+
+
+class Template(object):
+    '''
+    A file name or server path compiled from a pattern made of strftime codes
+    (%Y, %y, %m, %d and %H) for the date and {fh:03d} style fields for the
+    forecast hour. The pattern is compiled once into a format string, which
+    is cheaper to fill in than strftime.
+    '''
+
+    def __init__(self, pattern):
+        '''
+        Constructor of a Template object.
+        '''
+        self.pattern = pattern
+        try:
+            self.format = re.sub('%(.)', lambda code: DATE_FIELDS[code.group(1)], pattern).format
+        except KeyError, err:
+            raise ValueError('Template: unsupported code %'+str(err)+' in '+pattern)
+
+    def __call__(self, date, hour=0):
+        """
+        The text of the template for date and forecast hour.
+        """
+        return self.format(date.year, date.year%100, date.month, date.day, date.hour, fh=hour)
+
+
+class DateRule(object):
+    '''
+    A variant of the file name and servers of a dataset, used for the dates
+    after a given day or for the most recent days.
+    '''
+
+    def __init__(self, filename, servers=None, after=None, recent_days=None, future=True):
+        '''
+        Constructor of a DateRule object. Without servers the default servers are used.
+        '''
+        self.filename = Template(filename)
+        self.servers = None if servers is None else compile_servers(servers)
+        #The rule holds for dates after this day,
+        self.after = after
+        #or for the dates in the last recent_days days, and later ones if future.
+        self.recent_days = recent_days
+        self.future = future
+
+    def matches(self, date, today=None):
+        """
+        True if the rule holds for date. today may be passed when checking many dates.
+        """
+        day = date.date()
+        if self.after is not None:
+            return day > self.after
+        today = today or datetime.today().date()
+        if not self.future and day > today:
+            return False
+        return day > today-timedelta(days=self.recent_days)
+
+
+def compile_servers(servers):
+    """
+    (url, Template of the path) of a list of (url, path pattern).
+    """
+    return [(url, Template(path)) for url, path in servers]
+
+
+class DatasetSpec(object):
+    '''
+    Everything needed to name the files of a dataset and to find them on the servers.
+    '''
+
+    def __init__(self, name, directory, interval, filename, servers, shift=False, rules=None,
+                 prepared=''):
+        '''
+        Constructor of a DatasetSpec object.
+        '''
+        #Name of the dataset as given on the command line.
+        self.name = name
+        #Sub-directory of the input data directory the files are kept in.
+        self.directory = directory
+        #Hours between two files.
+        self.interval = interval
+        self.filename = Template(filename)
+        self.servers = compile_servers(servers)
+        #Is a file named for the date plus its hour step (True), only in analysis
+        #runs ('analysis') or for the start of the run and its forecast hour (False).
+        self.shift = shift
+        #DateRules tried in order before the default file name and servers.
+        self.rules = rules or []
+        #Suffix of the prepared file.
+        self.prepared = prepared
+
+    def date_of(self, date, hour, is_analysis=False):
+        """
+        The date the file of hour step hour of a run starting at date is named for.
+        """
+        if self.shift is True or (self.shift == 'analysis' and is_analysis):
+            return date+timedelta(hours=hour)
+        return date
+
+    def rule_of(self, date, today=None):
+        """
+        The DateRule holding for date, None if the default applies.
+        """
+        for rule in self.rules:
+            if rule.matches(date, today):
+                return rule
+        return None
+
+    def get_filename(self, date, hour=0):
+        """
+        The name of the file for date (see date_of) and forecast hour.
+        """
+        rule = self.rule_of(date)
+        return (self.filename if rule is None else rule.filename)(date, hour)
+
+    def get_servers(self, date, hour=0):
+        """
+        The urls of the servers and the paths on them of the file for date.
+        """
+        return self.resolve(date, hour)[1:]
+
+    def resolve(self, date, hour=0, today=None):
+        """
+        The file name, server urls and server paths for date and forecast hour
+        with a single look up of the DateRule.
+        """
+        rule = self.rule_of(date, today)
+        if rule is None:
+            filename, servers = self.filename, self.servers
+        else:
+            filename, servers = rule.filename, rule.servers or self.servers
+        return (filename(date, hour), [url for url, _ in servers],
+                [path(date, hour) for _, path in servers])
+
+
+#NCEP real-time servers keep about this many days.
+_RAP_RECENT = DateRule('rap.t%Hz.awp130bgrbf{fh:02d}.grib2',
+                       [('ftp://ftp.ncep.noaa.gov', 'pub/data/nccf/com/rap/prod')], recent_days=3)
+_NAM_RECENT = DateRule('nam.t%Hz.awphys{fh:02d}.grb2.tm00',
+                       [('ftp://ftp.ncep.noaa.gov', 'pub/data/nccf/com/nam/prod/')], recent_days=30)
+
+#The datasets named from templates. Datasets not listed here name their files themselves.
+DATASET_SPECS = dict((spec.name, spec) for spec in [
+    DatasetSpec('GFS', 'GFS', 3, 'gfs_4_%Y%m%d_%H00_{fh:03d}.grb2',
+                [('ftp://nomads.ncdc.noaa.gov', 'GFS/Grid4/%Y%m/%Y%m%d')]),
+    DatasetSpec('GFSp25', 'GFS', 3, 'gfs.0p25.%Y%m%d%H.f{fh:03d}.grib2',
+                [('http://rda.ucar.edu', 'data/ds084.1/%Y/%Y%m%d')]),
+    DatasetSpec('FNL', 'FNL', 6, 'fnl_%Y%m%d_%H_00.grib2',
+                [('http://rda.ucar.edu', 'data/ds083.2/grib2/%Y/%Y.%m')], shift=True),
+    DatasetSpec('FNLp25', 'FNL', 6, 'gdas1.fnl0p25.%Y%m%d%H.f00.grib2',
+                [('http://rda.ucar.edu', 'data/ds083.3/%Y/%Y%m')], shift=True),
+    DatasetSpec('CFSR', 'CFSR', 6, 'pgbh00.cfsr.%Y%m%d%H.grb2',
+                [('http://soostrc.comet.ucar.edu', 'data/grib/cfsr/%Y/%m')], shift=True,
+                rules=[DateRule('%y%m%d%H.cfsrr.t%Hz.pgrb2f00', after=datetime(2011, 4, 1).date())]),
+    DatasetSpec('CFDDA', 'CFDDA', 1, 'cfdda_%Y%m%d%H.v2.nc',
+                [('http://rda.ucar.edu', 'data/ds604.0/%Y/%m')], shift=True, prepared='.grb1'),
+    DatasetSpec('ERAISFC', 'ERAI', 3, 'ERA-Int_sfc_%Y%m01.grb',
+                [('ftp://10.118.50.245', '/pub')], shift=True),
+    DatasetSpec('ERAIML', 'ERAI', 3, 'ERA-Int_ml_%Y%m01.grb',
+                [('ftp://10.118.50.245', '/pub')], shift=True),
+    DatasetSpec('GFSFCST', 'GFSFCST', 3, '%y%m%d%H.gfs.t%Hz.0p50.pgrb2f{fh:03d}',
+                [('http://soostrc.comet.ucar.edu', 'data/grib/gfs/%Y%m%d/grib.t%Hz')]),
+    DatasetSpec('RAP', 'RAP', 1, '%y%m%d%H.rap.t%Hz.awp130bgrbf00.grib2',
+                [('http://soostrc.comet.ucar.edu', 'data/grib/rap/%Y%m%d/hybrid')], shift=True,
+                rules=[_RAP_RECENT]),
+    DatasetSpec('NAM', 'NAM', 1, 'nam_218_%Y%m%d_%H00_0{fh:02d}.grb',
+                [('ftp://nomads.ncdc.noaa.gov', 'NAM/Grid218/%Y%m/%Y%m%d')], rules=[_NAM_RECENT]),
+    DatasetSpec('SSTNCEP', 'SST-NCEP', 24, 'rtg_sst_grb_hr_0.083.%Y%m%d',
+                [('ftp://polar.ncep.noaa.gov', 'pub/history/sst/ophi')], shift='analysis',
+                rules=[DateRule('rtgssthr_grb_0.083.grib2',
+                                [('ftp://ftp.ncep.noaa.gov', 'pub/data/nccf/com/gfs/prod/sst.%Y%m%d')],
+                                recent_days=1, future=False)]),
+    #There seams to be 17 days of _preliminary files... Not sure why 17 but there you go.
+    DatasetSpec('SSTOISST', 'SST-NOAAOI', 24, 'avhrr-only-v2.%Y%m%d.nc',
+                [('http://www.ncei.noaa.gov',
+                  'data/sea-surface-temperature-optimum-interpolation/access/avhrr-only/%Y%m'),
+                 ('ftp://eclipse.ncdc.noaa.gov', '/pub/oisst/NetCDF/%Y/AVHRR/')],
+                shift='analysis', prepared='.grb2',
+                rules=[DateRule('avhrr-only-v2.%Y%m%d_preliminary.nc', recent_days=17)]),
+    DatasetSpec('NASALISCONUS', 'sportlis_3km', 1, 'sportlis_conus3km_model_%Y%m%d_%H00.grb2',
+                [('ftp://geo.msfc.nasa.gov', 'SPoRT/modeling/lis/conus3km')], shift=True),
+    DatasetSpec('LittleRSurface', 'LITTLE_R', 3, 'SURFACE_OBS:%Y%m%d%H',
+                [('http://rda.ucar.edu', 'data/ds461.0/little_r/%Y')], shift=True),
+    DatasetSpec('LittleRUpperAir', 'LITTLE_R', 3, 'OBS:%Y%m%d%H',
+                [('http://rda.ucar.edu', 'data/ds351.0/little_r/%Y')], shift=True),
+    DatasetSpec('MESONET', 'MESONET', 3, '%Y%m%d_%H00.gz',
+                [('ftp://pftp.madis-data.noaa.gov', 'archive/%Y%m%d/LDAD/mesonet/netCDF/')],
+                shift=True),
+    DatasetSpec('METAR', 'METAR', 3, '%Y%m%d_%H00.gz',
+                [('ftp://madis-data.ncep.noaa.gov', 'archive/%Y/%m/%d/point/metar/netcdf/')],
+                shift=True)])
+
+
+def get_spec(name):
+    """
+    The DatasetSpec of the dataset name, None if it names its files itself.
+    """
+    return DATASET_SPECS.get(name)
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Download scheduler with per-host concurrency limits. Limits adapt while
+    the run progresses: they shrink when a host throttles or fails and grow
+    back while it keeps serving files.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import logging
+import threading
+import time
+import urlparse
+import heapq
+from contextlib import contextmanager
+
+
+class HostLimit(object):
+    '''
+    The concurrency limit and current load of a single host.
+    '''
+
+    def __init__(self, host, limit, maximum):
+        self.host = host
+        #Number of transfers allowed at the same time right now.
+        self.limit = limit
+        #The limit never grows past this.
+        self.maximum = maximum
+        #Number of transfers in flight.
+        self.active = 0
+        #Successful transfers since the limit last changed.
+        self.successes = 0
+        #No new transfer is started before this time (set when throttled).
+        self.resume_at = 0
+
+
+class HostSlot(object):
+    '''
+    A single transfer slot held on a host. Used to report the outcome.
+    '''
+
+    def __init__(self, host):
+        self.host = host
+        self.error = None
+        self.failed_flag = False
+
+    def failed(self, error=None):
+        """
+        Record that the transfer using this slot failed.
+        """
+        self.failed_flag = True
+        self.error = error
+
+
+class HostLimits(object):
+    '''
+    Per-host concurrency limits shared by every download of this process.
+    '''
+
+    #Starting number of parallel transfers per host.
+    #rda.ucar.edu does not allow parallel sessions.
+    HOST_LIMITS = {'rda.ucar.edu': 1,
+                   'nomads.ncep.noaa.gov': 8,
+                   'nomads.ncdc.noaa.gov': 4,
+                   'ftp.ncep.noaa.gov': 4,
+                   'soostrc.comet.ucar.edu': 4,
+                   'www.ncei.noaa.gov': 4,
+                   'podaac-ftp.jpl.nasa.gov': 2,
+                   'geo.msfc.nasa.gov': 2}
+
+    #Starting limit for hosts not listed in HOST_LIMITS.
+    DEFAULT_LIMIT = 2
+
+    #Hosts may grow to this multiple of their starting limit. rda.ucar.edu is never grown.
+    GROWTH = 2
+
+    #HTTP status codes and FTP replies that mean the server is asking us to slow down.
+    THROTTLE_STATUS = [429, 503, '421']
+
+    #Seconds to hold back new transfers to a host that throttled us.
+    THROTTLE_PAUSE = 30
+
+    def __init__(self, limits=None):
+        '''
+        Constructor of a HostLimits object.
+        '''
+        self.limits = dict(self.HOST_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self._cond = threading.Condition()
+        self._hosts = {}
+        #Slots handed to a thread in advance by the DownloadScheduler.
+        self._local = threading.local()
+
+    @staticmethod
+    def host_of(url):
+        """
+        The host name of a url.
+        """
+        return urlparse.urlsplit(url).hostname
+
+    def _get(self, host):
+        """
+        Return the HostLimit for host. Must be called holding self._cond.
+        """
+        if host not in self._hosts:
+            limit = self.limits.get(host, self.DEFAULT_LIMIT)
+            maximum = limit if host == 'rda.ucar.edu' else limit*self.GROWTH
+            self._hosts[host] = HostLimit(host, limit, maximum)
+        return self._hosts[host]
+
+    def _is_free(self, host):
+        """
+        True if a new transfer to host may start. Must be called holding self._cond.
+        """
+        hlimit = self._get(host)
+        return hlimit.active < hlimit.limit and time.time() >= hlimit.resume_at
+
+    def try_acquire(self, host):
+        """
+        Take a slot on host if one is free. Returns True on success.
+        """
+        with self._cond:
+            if self._is_free(host):
+                self._get(host).active += 1
+                return True
+        return False
+
+    def acquire(self, host):
+        """
+        Block until a slot on host is free and take it.
+        """
+        with self._cond:
+            while not self._is_free(host):
+                self._cond.wait(1.0)
+            self._get(host).active += 1
+
+    def release(self, host, slot=None):
+        """
+        Give back a slot on host and adapt the limit to the outcome of the transfer.
+        """
+        with self._cond:
+            hlimit = self._get(host)
+            hlimit.active -= 1
+            if slot is not None:
+                self._adapt(hlimit, slot)
+            self._cond.notify_all()
+
+    def _adapt(self, hlimit, slot):
+        """
+        Additive increase / multiplicative decrease of the limit of a host.
+        """
+        if not slot.failed_flag:
+            hlimit.successes += 1
+            if hlimit.successes >= hlimit.limit and hlimit.limit < hlimit.maximum:
+                hlimit.limit += 1
+                hlimit.successes = 0
+                logging.debug('HostLimits: raising limit of '+hlimit.host+' to '+str(hlimit.limit))
+            return
+
+        hlimit.successes = 0
+        status = getattr(slot.error, 'status', None)
+        retry = getattr(slot.error, 'retry', True)
+        if status in self.THROTTLE_STATUS:
+            hlimit.limit = max(1, hlimit.limit/2)
+            hlimit.resume_at = time.time()+self.THROTTLE_PAUSE
+            logging.info('HostLimits: '+hlimit.host+' is throttling, limit lowered to '+
+                         str(hlimit.limit))
+        elif retry:
+            hlimit.limit = max(1, hlimit.limit-1)
+            logging.debug('HostLimits: lowering limit of '+hlimit.host+' to '+str(hlimit.limit))
+
+    def hold(self, host):
+        """
+        Mark host as already acquired for the calling thread.
+        """
+        self._local.held = host
+
+    def unhold(self):
+        """
+        Forget the slot marked by hold() for the calling thread.
+        Returns the host of the slot, None if it was already handed back.
+        """
+        held = getattr(self._local, 'held', None)
+        self._local.held = None
+        return held
+
+    @contextmanager
+    def slot(self, url):
+        """
+        Context manager holding a slot on the host of url for one transfer.
+        If the DownloadScheduler already took a slot for this thread on the same
+        host that one is used instead of taking a second. A slot it took on another
+        host (the transfer moved to a mirror or peer) is given back first, so that
+        the thread never waits for a slot while holding one.
+        """
+        host = self.host_of(url)
+        slot = HostSlot(host)
+        held = getattr(self._local, 'held', None) == host
+        if not held:
+            if getattr(self._local, 'held', None) is not None:
+                self.release(self.unhold())
+            self.acquire(host)
+        try:
+            yield slot
+        except Exception as err:
+            slot.failed(err)
+            raise
+        finally:
+            if held:
+                with self._cond:
+                    self._adapt(self._get(host), slot)
+            else:
+                self.release(host, slot)
+
+
+#The host limits shared by every download of this process.
+_SHARED_LIMITS = None
+_SHARED_LOCK = threading.Lock()
+
+
+def get_host_limits():
+    """
+    Return the HostLimits shared by this process, creating it on first use.
+    """
+    global _SHARED_LIMITS
+    with _SHARED_LOCK:
+        if _SHARED_LIMITS is None:
+            _SHARED_LIMITS = HostLimits()
+        return _SHARED_LIMITS
+
+
+class DownloadScheduler(object):
+    '''
+    Runs downloads on a pool of threads, starting each one only when its
+    host has a free slot so that a slow host with a low limit does not
+    hold up downloads from other hosts. Among the downloads that may start
+    the one with the lowest priority value goes first. The completion of
+    each download is published as an event other stages can wait for.
+    '''
+
+    def __init__(self, workers, limits=None):
+        '''
+        Constructor of a DownloadScheduler object.
+        workers is the maximum number of downloads in flight across all hosts.
+        '''
+        self.workers = workers
+        self.limits = limits or get_host_limits()
+        #Heap of (priority, order submitted, task) waiting per host.
+        self._pending = {}
+        self._submitted = 0
+        self._running = 0
+        #Completion event of each download with a key.
+        self._events = {}
+        #Keys of downloads that will be submitted later (see defer).
+        self._deferred = set()
+        self._thread = None
+
+    def submit(self, url, function, *args, **options):
+        """
+        Queue function(*args) as a download whose first transfer is from url.
+        options may give its priority (lower goes first, default 0) and a key
+        under which its completion is published (see wait).
+        """
+        host = HostLimits.host_of(url)
+        key = options.get('key')
+        with self.limits._cond:
+            if key is not None:
+                self._events.setdefault(key, threading.Event())
+                self._deferred.discard(key)
+            self._submitted += 1
+            heapq.heappush(self._pending.setdefault(host, []),
+                           (options.get('priority', 0), self._submitted, (function, args, key)))
+            self.limits._cond.notify_all()
+
+    def defer(self, key):
+        """
+        Announce a download that will be submitted with key later, i.e. once
+        the file is published. run() does not return before it is submitted
+        and has finished, and it can be waited for already.
+        """
+        with self.limits._cond:
+            self._events.setdefault(key, threading.Event())
+            self._deferred.add(key)
+
+    def _next(self):
+        """
+        Pick the task with the lowest priority whose host has a free slot.
+        Returns (host, task) or None.
+        """
+        heads = sorted((tasks[0], host) for host, tasks in self._pending.items() if tasks)
+        for _, host in heads:
+            if self.limits.try_acquire(host):
+                return host, heapq.heappop(self._pending[host])[2]
+        return None
+
+    def _run_task(self, host, task):
+        """
+        Execute a task in a worker thread holding the slot taken for it.
+        """
+        function, args, key = task
+        self.limits.hold(host)
+        try:
+            function(*args)
+        except Exception as err:
+            logging.error('DownloadScheduler: download failed with '+str(err))
+        finally:
+            #The slot is already back if the transfer moved to another host.
+            if self.limits.unhold() == host:
+                self.limits.release(host)
+            if key is not None:
+                self._events[key].set()
+            with self.limits._cond:
+                self._running -= 1
+                self.limits._cond.notify_all()
+
+    def run(self, block=True):
+        """
+        Run every submitted task. Returns when all of them have finished or,
+        if block is False, at once leaving them to a background thread.
+        """
+        if not block:
+            self._thread = threading.Thread(target=self._run, name='download-scheduler')
+            self._thread.daemon = True
+            self._thread.start()
+            return
+        self._run()
+
+    def _run(self):
+        """
+        Start tasks as slots become free until all of them have finished.
+        """
+        threads = []
+        cond = self.limits._cond
+        while True:
+            with cond:
+                waiting = sum(len(tasks) for tasks in self._pending.values())
+                if not waiting and self._running == 0 and not self._deferred:
+                    break
+                picked = None
+                if waiting and self._running < self.workers:
+                    picked = self._next()
+                if picked is None:
+                    cond.wait(1.0)
+                    continue
+                self._running += 1
+
+            host, task = picked
+            thread = threading.Thread(target=self._run_task, args=(host, task),
+                                      name='download-'+str(host))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+    def wait(self, keys=None):
+        """
+        Wait for the downloads submitted with one of keys to finish, for all
+        downloads if keys is None. Unknown keys are not waited for.
+        """
+        if keys is None:
+            if self._thread is not None:
+                self._thread.join()
+            return
+        for key in keys:
+            event = self._events.get(key)
+            if event is not None:
+                while not event.is_set():
+                    event.wait(1.0)
+
+    def is_done(self, key):
+        """
+        True if the download submitted with key has finished.
+        """
+        event = self._events.get(key)
+        return event is None or event.is_set()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Preparation of sea surface temperature grids for ungrib in memory: read
+    the source netCDF file once, crop it to the domain, fill the land points
+    by relaxation of Poisson's equation and write a GRIB2 file with the
+    latitudes running north to south, as the ncea/ncl/ncks/cdo/wgrib2 chain
+    used to produce.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+import os
+import struct
+import logging
+from datetime import datetime
+import numpy
+from netCDF4 import Dataset, num2date
+
+#GRIB2 code of the originating centre written to the prepared files (7 = NCEP).
+CENTRE = 7
+
+#Decimal digits of the values kept by the GRIB2 packing, 0.01 K.
+DECIMAL_SCALE = 2
+
+
+def poisson_grid_fill(grid, is_cyclic=False, guess=1, nscan=500, eps=1.e-2, relc=0.6):
+    """
+    Fill the missing (masked) points of a (lat, lon) grid by relaxation of
+    Poisson's equation, as poisson_grid_fill of NCL with the same arguments.
+    The first guess is the zonal average of each row if guess is 1, 0 otherwise.
+    Relaxation stops after nscan scans or once no point changes by eps or more.
+    Returns the filled grid as a numpy array.
+    """
+    grid = numpy.ma.masked_invalid(grid)
+    missing = numpy.ma.getmaskarray(grid)
+    if missing.all():
+        raise ValueError('poisson_grid_fill: every point of the grid is missing')
+    values = grid.filled(0.0).astype(numpy.float64)
+    if not missing.any():
+        return values
+
+    if guess == 1:
+        rows = grid.mean(axis=1).filled(grid.mean())
+        values[missing] = numpy.repeat(rows[:, numpy.newaxis], values.shape[1], axis=1)[missing]
+
+    #Red-black ordering: each half scan updates the points whose neighbours
+    #are all of the other colour, converging like a point by point scan.
+    rows, columns = numpy.indices(values.shape)
+    colours = [missing & ((rows+columns) % 2 == parity) for parity in (0, 1)]
+    #Beyond the edges the grid is mirrored, or wrapped around in longitude if cyclic.
+    lon_mode = 'wrap' if is_cyclic else 'reflect'
+    for scan in xrange(nscan):
+        largest = 0.0
+        for colour in colours:
+            padded = numpy.pad(numpy.pad(values, ((1, 1), (0, 0)), 'reflect'),
+                               ((0, 0), (1, 1)), lon_mode)
+            residual = (padded[:-2, 1:-1]+padded[2:, 1:-1]+padded[1:-1, :-2]+
+                        padded[1:-1, 2:])*0.25-values
+            residual = residual[colour]
+            values[colour] += relc*residual
+            if residual.size:
+                largest = max(largest, numpy.abs(residual).max())
+        if largest < eps:
+            break
+
+    logging.debug('poisson_grid_fill: '+str(missing.sum())+' points filled in '+str(scan+1)+
+                  ' scans')
+    return values
+
+
+def _first_date(variable):
+    """
+    The first date of a netCDF time variable, None if it can not be read.
+    """
+    try:
+        date = num2date(variable[0], variable.units)
+        return datetime(date.year, date.month, date.day, date.hour, date.minute)
+    except Exception, err:
+        logging.debug('_first_date: can not read the time: '+str(err))
+        return None
+
+
+def read_sst(filename, variable, bbox=None):
+    """
+    Read the first time of variable from the netCDF file filename, cropped to
+    the lon_min, lon_max, lat_min and lat_max of bbox if given.
+    Returns (grid, lats, lons, date), grid being a masked array and date None
+    if the file has no readable time.
+    """
+    root = Dataset(filename, 'r')
+    try:
+        names = root.variables.keys()
+        lats = root.variables['lat' if 'lat' in names else 'latitude'][:]
+        lons = root.variables['lon' if 'lon' in names else 'longitude'][:]
+        date = _first_date(root.variables['time']) if 'time' in names else None
+
+        #Coordinates within the box, both ends included (as ncea -d).
+        lat_index = numpy.arange(len(lats))
+        lon_index = numpy.arange(len(lons))
+        if bbox:
+            lat_index = lat_index[(lats >= bbox['lat_min']) & (lats <= bbox['lat_max'])]
+            lon_index = lon_index[(lons >= bbox['lon_min']) & (lons <= bbox['lon_max'])]
+            if not len(lat_index) or not len(lon_index):
+                raise ValueError('read_sst: '+filename+' has no points in '+str(bbox))
+        lat_slice = slice(lat_index[0], lat_index[-1]+1)
+        lon_slice = slice(lon_index[0], lon_index[-1]+1)
+
+        data = root.variables[variable]
+        if data.ndim == 3:
+            grid = data[0, lat_slice, lon_slice]
+        else:
+            grid = data[lat_slice, lon_slice]
+        return (numpy.ma.asarray(grid, dtype=numpy.float64), numpy.asarray(lats[lat_slice]),
+                numpy.asarray(lons[lon_slice]), date)
+    finally:
+        root.close()
+
+
+def _signed(value, size):
+    """
+    value as a GRIB2 sign and magnitude integer of size bytes.
+    """
+    if value < 0:
+        return -value | (1 << (8*size-1))
+    return value
+
+
+def _degrees(value):
+    """
+    An angle in the micro-degrees used by GRIB2 grid definitions.
+    """
+    return int(round(value*1e6))
+
+
+def _pack(values, nbits):
+    """
+    The non-negative integers values packed into nbits bits each, big-endian.
+    """
+    if nbits == 0:
+        return ''
+    words = values.astype('>u4').view(numpy.uint8).reshape(-1, 4)
+    bits = numpy.unpackbits(words, axis=1)[:, 32-nbits:]
+    return numpy.packbits(bits.ravel()).tostring()
+
+
+def grib2_message(grid, lats, lons, date, centre=CENTRE, decimal_scale=DECIMAL_SCALE):
+    """
+    A GRIB2 message of the temperature (TMP) at the surface on a regular
+    lat-lon grid, analysis at date, with simple packing. grid is (lat, lon)
+    with no missing points. The message scans west to east, north to south.
+    """
+    grid = numpy.asarray(grid, dtype=numpy.float64)
+    if lats[0] < lats[-1]:
+        grid, lats = grid[::-1, :], lats[::-1]
+    if lons[0] > lons[-1]:
+        grid, lons = grid[:, ::-1], lons[::-1]
+    nj, ni = grid.shape
+
+    #Simple packing: value = (reference+packed)/10**decimal_scale.
+    scaled = numpy.round(grid*10**decimal_scale)
+    reference = numpy.floor(scaled.min())
+    packed = (scaled-reference).astype(numpy.uint32)
+    nbits = int(packed.max()).bit_length()
+    if not nbits:
+        #A constant field is its reference value alone, not scaled (readers differ there).
+        decimal_scale, reference = 0, grid.flat[0]
+
+    #Identification: centre, GRIB master tables 2, local tables 1, analysis.
+    section1 = struct.pack('>IBHHBBBHBBBBBBB', 21, 1, centre, 0, 2, 1, 0,
+                           date.year, date.month, date.day, date.hour, date.minute, 0, 0, 0)
+
+    #Grid definition template 3.0, regular lat-lon on a sphere of radius 6371229 m.
+    lon_first, lon_last = [_degrees(lon % 360.0) for lon in (lons[0], lons[-1])]
+    step_lon = _degrees(abs(lons[-1]-lons[0])/(ni-1)) if ni > 1 else 0
+    step_lat = _degrees(abs(lats[-1]-lats[0])/(nj-1)) if nj > 1 else 0
+    section3 = struct.pack('>IBBIBBHBBIBIBIIIIIIIBIIIIB', 72, 3, 0, ni*nj, 0, 0, 0,
+                           6, 0, 0, 0, 0, 0, 0, ni, nj, 0, 0xffffffff,
+                           _signed(_degrees(lats[0]), 4), lon_first, 0x30,
+                           _signed(_degrees(lats[-1]), 4), lon_last, step_lon, step_lat, 0)
+
+    #Product definition template 4.0: temperature (0, 0, 0) analysis at the surface (1).
+    section4 = struct.pack('>IBHHBBBBBHBBIBBIBBI', 34, 4, 0, 0, 0, 0, 0, 255, 255, 0, 0, 1, 0,
+                           1, 0, 0, 255, 0, 0)
+
+    #Data representation template 5.0, simple packing of floating point values.
+    section5 = struct.pack('>IBIHfHHBB', 21, 5, ni*nj, 0, reference, 0,
+                           _signed(decimal_scale, 2), nbits, 0)
+
+    #No bitmap, every point has a value.
+    section6 = struct.pack('>IBB', 6, 6, 255)
+    data = _pack(packed.ravel(), nbits)
+    section7 = struct.pack('>IB', 5+len(data), 7)+data
+
+    body = section1+section3+section4+section5+section6+section7
+    return 'GRIB'+struct.pack('>HBBQ', 0, 0, 2, 16+len(body)+4)+body+'7777'
+
+
+def prepare_sst(filename, destination, variable, date, bbox=None):
+    """
+    Turn the SST variable of the netCDF file filename into the GRIB2 file
+    destination read by ungrib: cropped to bbox if given, land points filled
+    and written with the NCEP centre. date is used if the file has no time.
+    """
+    grid, lats, lons, file_date = read_sst(filename, variable, bbox)
+    logging.info('prepare_sst: filling '+str(numpy.ma.count_masked(grid))+' of '+
+                 str(grid.size)+' points of '+filename)
+    message = grib2_message(poisson_grid_fill(grid), lats, lons, file_date or date)
+
+    part = destination+'.part'
+    with open(part, 'wb') as outfile:
+        outfile.write(message)
+    os.rename(part, destination)
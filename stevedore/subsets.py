@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Index of the regional subsets of global grids kept in an input data
+    directory (i.e. GFSsubset). Subsets are fetched for a grid aligned box
+    around the domain and a later request for any region inside that box is
+    cut from the file already there.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import os
+import re
+import glob
+import math
+
+#Degrees the boxes of downloaded subsets are aligned to. Domains close to each
+#other then fall into the same box.
+SUBSET_GRID = 5.0
+
+#The whole globe, for datasets created without a domain.
+GLOBE = {'lon_min': 0.0, 'lon_max': 360.0, 'lat_min': -90.0, 'lat_max': 90.0}
+
+
+def grid_region(bbox, grid=SUBSET_GRID):
+    """
+    The smallest box aligned to grid degrees holding bbox.
+    """
+    return {'lon_min': math.floor(bbox['lon_min']/grid)*grid,
+            'lon_max': math.ceil(bbox['lon_max']/grid)*grid,
+            'lat_min': max(-90.0, math.floor(bbox['lat_min']/grid)*grid),
+            'lat_max': min(90.0, math.ceil(bbox['lat_max']/grid)*grid)}
+
+
+def contains(outer, inner):
+    """
+    True if the box outer holds the box inner.
+    """
+    return outer['lon_min'] <= inner['lon_min'] and outer['lon_max'] >= inner['lon_max'] and \
+           outer['lat_min'] <= inner['lat_min'] and outer['lat_max'] >= inner['lat_max']
+
+
+def subset_name(prefix, bbox):
+    """
+    Name of the file holding the subset of prefix (i.e. gfs.2017010100.t00z.pgrb2.0p25.f003)
+    for bbox. Subsets of other regions have other names.
+    """
+    return prefix+'.sub_%s_%s_%s_%s' % (float(bbox['lon_min']), float(bbox['lon_max']),
+                                        float(bbox['lat_min']), float(bbox['lat_max']))
+
+
+class SubsetIndex(object):
+    '''
+    The subsets in a directory, found by the boxes in their names.
+    '''
+
+    #lon_min, lon_max, lat_min and lat_max as written by subset_name.
+    BOX = re.compile(r'\.sub_(-?[\d.]+)_(-?[\d.]+)_(-?[\d.]+)_(-?[\d.]+)$')
+
+    def __init__(self, directory):
+        '''
+        Constructor of a SubsetIndex object.
+        '''
+        self.directory = directory
+
+    def subsets(self, prefix):
+        """
+        (file name, box) of every subset of prefix in the directory.
+        """
+        found = []
+        for filename in glob.glob(self.directory+'/'+prefix+'.sub_*'):
+            box = self.BOX.search(filename)
+            if box is None or not os.path.isfile(filename):
+                continue
+            found.append((filename, dict(zip(('lon_min', 'lon_max', 'lat_min', 'lat_max'),
+                                             [float(value) for value in box.groups()]))))
+        return found
+
+    def find(self, prefix, bbox):
+        """
+        The smallest subset of prefix holding bbox, None if there is none.
+        """
+        best = None
+        for filename, box in self.subsets(prefix):
+            if not contains(box, bbox):
+                continue
+            area = (box['lon_max']-box['lon_min'])*(box['lat_max']-box['lat_min'])
+            if best is None or area < best[0]:
+                best = (area, filename)
+        return None if best is None else best[1]
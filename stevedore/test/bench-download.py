@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Download throughput benchmark. Starts the stand-in servers of standin.py
+    with the latency, bandwidth, error and truncation rates given and drives
+    InputDataSet.download() and Stevedore.check_input_data() at several worker
+    counts, reporting files/s, MB/s and the retry overhead of each run.
+
+    i.e. python bench-download.py --protocol http,ftp --workers 1,4,8 --latency 50
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import stevedore
+from stevedore import downloader, scheduler, rda
+from standin import StandInFiles, StandInHTTPServer, StandInFTPServer, Conditions
+
+#Credentials of the stand-in RDA server.
+RDA_CREDENTIALS = ('bench@example.com', 'bench')
+
+
+def reset_clients(workers):
+    """
+    Start every run with new connections, a fresh RDA login and host limits
+    that allow workers transfers to the stand-in servers.
+    """
+    if downloader._SHARED_DOWNLOADER is not None:
+        downloader._SHARED_DOWNLOADER.close()
+        downloader._SHARED_DOWNLOADER = None
+    scheduler._SHARED_LIMITS = scheduler.HostLimits({'127.0.0.1': workers})
+    rda._SHARED_SESSION = None
+
+
+def make_datasets(server, directory, count, is_rda):
+    """
+    InputDataSet objects of count files on server.
+    """
+    datasets = []
+    for i in range(count):
+        inputDataSet = stevedore.InputDataSet(datetime(2017, 1, 1), i, directory)
+        inputDataSet.type = 'BENCH'
+        inputDataSet.name = 'bench_'+str(i).zfill(4)+'.grb2'
+        inputDataSet.name_prepared = inputDataSet.name
+        inputDataSet.server_url = [server.url]
+        inputDataSet.server_path = ['pub/BENCH']
+        inputDataSet.is_rda = [is_rda]
+        datasets.append(inputDataSet)
+    return datasets
+
+
+def directory_size(directory):
+    """
+    Number of files and bytes under directory, leaving out the manifest and logs.
+    """
+    count = 0
+    size = 0
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.endswith('.db') or filename.endswith('.json') or filename.endswith('.log'):
+                continue
+            count = count + 1
+            size = size + os.path.getsize(os.path.join(root, filename))
+    return count, size
+
+
+def bench_datasets(server, args, workers, is_rda):
+    """
+    Download args.files files with InputDataSet.download() on a DownloadScheduler.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        schedule = scheduler.DownloadScheduler(workers)
+        for inputDataSet in make_datasets(server, directory+'/BENCH', args.files, is_rda):
+            schedule.submit(server.url, inputDataSet.download)
+        started = time.time()
+        schedule.run()
+        elapsed = time.time()-started
+        return directory_size(directory)+(elapsed,)
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_stevedore(server, args, workers):
+    """
+    Download the input data of a args.length hour run of args.dataset with
+    Stevedore.check_input_data(), every file coming from server.
+    """
+    root = tempfile.mkdtemp()
+    os.environ['DEEPTHUNDER_ROOT'] = root
+    try:
+        stevedore.Stevedore.DOWNLOAD_WORKERS = workers
+        instance = stevedore.Stevedore(datetime(2017, 1, 1), args.length, [args.lat], [args.long],
+                                       ndomains=1, projectdir='bench', altftpserver=server.url,
+                                       initialConditions=[args.dataset],
+                                       boundaryConditions=[args.dataset])
+        started = time.time()
+        instance.check_input_data()
+        elapsed = time.time()-started
+        return directory_size(root+'/data/inputDataSets')+(elapsed,)
+    finally:
+        shutil.rmtree(root)
+
+
+def report(label, workers, files, size, elapsed, stats):
+    """
+    Print one line of results.
+    """
+    elapsed = max(elapsed, 1e-6)
+    overhead = 100.0*(stats['bytes_sent']-size)/size if size else 0.0
+    print '%-14s %7d %7d %9.2f %9.2f %10.2f %9.1f%% %7d %9d' % (
+        label, workers, files, files/elapsed, size/elapsed/1024**2,
+        float(stats['requests'])/max(files, 1), overhead, stats['errors'], stats['truncated'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the download of input data'
+                                                 ' from local stand-in servers.')
+    parser.add_argument('--protocol', default='http,ftp,rda',
+                        help='Comma separated servers to try: http, ftp and/or rda')
+    parser.add_argument('--workers', default='1,4,8', help='Comma separated worker counts')
+    parser.add_argument('--files', default=32, type=int, help='Files per run')
+    parser.add_argument('--size', default=4.0, type=float, help='Size of each file in MB')
+    parser.add_argument('--latency', default=20.0, type=float, help='Latency of each reply in ms')
+    parser.add_argument('--bandwidth', default=None, type=float,
+                        help='Bandwidth of each transfer in MB/s, unlimited if not given')
+    parser.add_argument('--errors', default=0.0, type=float, help='Rate of failed transfers')
+    parser.add_argument('--truncate', default=0.0, type=float, help='Rate of truncated transfers')
+    parser.add_argument('--waitretry', default=0.1, type=float,
+                        help='Seconds between download attempts')
+    parser.add_argument('--seed', default=1, type=int, help='Seed of the error and truncation rates')
+    parser.add_argument('--stevedore', action='store_true',
+                        help='Also run Stevedore.check_input_data() for --dataset')
+    parser.add_argument('--dataset', default='GFS', help='Dataset of --stevedore')
+    parser.add_argument('--length', default=24, type=int, help='Forecast length of --stevedore')
+    parser.add_argument('--lat', default=29.434, type=float, help='Latitude of --stevedore')
+    parser.add_argument('--long', default=-98.499, type=float, help='Longitude of --stevedore')
+    parser.add_argument('--verbose', action='store_true', help='Log the downloads')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.CRITICAL)
+    stevedore.Stevedore.SCREEN_LOG_LEVEL = logging.DEBUG if args.verbose else logging.CRITICAL
+    stevedore.Downloader.WAIT_RETRY = args.waitretry
+
+    conditions = Conditions(latency=args.latency/1000.0,
+                            bandwidth=args.bandwidth*1024**2 if args.bandwidth else None,
+                            error_rate=args.errors, truncate_rate=args.truncate, seed=args.seed)
+    files = StandInFiles(size=int(args.size*1024**2))
+    servers = {'http': StandInHTTPServer(files, conditions),
+               'ftp': StandInFTPServer(files, conditions),
+               'rda': StandInHTTPServer(files, conditions, login=True, credentials=RDA_CREDENTIALS)}
+    os.environ['RDA_EMAIL'], os.environ['RDA_PASS'] = RDA_CREDENTIALS
+    os.environ['RDA_LOGIN_URL'] = servers['rda'].login_url
+
+    print '%-14s %7s %7s %9s %9s %10s %10s %7s %9s' % ('run', 'workers', 'files', 'files/s',
+                                                       'MB/s', 'requests', 'overhead',
+                                                       'errors', 'truncated')
+    for protocol in args.protocol.split(','):
+        server = servers[protocol]
+        server.start()
+        for workers in [int(count) for count in args.workers.split(',')]:
+            reset_clients(workers)
+            server.stats.reset()
+            result = bench_datasets(server, args, workers, protocol == 'rda')
+            report(protocol, workers, *(result+(server.stats.snapshot(),)))
+
+            if args.stevedore and protocol != 'rda':
+                reset_clients(workers)
+                server.stats.reset()
+                result = bench_stevedore(server, args, workers)
+                report(protocol+'/stevedore', workers, *(result+(server.stats.snapshot(),)))
+        #Hang up the idle connections before the server goes.
+        reset_clients(1)
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,577 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IBM Containerized Forecasting Workflow
+
+DESCRIPTION
+
+    Local stand-ins for the HTTP, FTP and RDA servers the input data comes
+    from. Latency, bandwidth, errors and truncated transfers can be set so
+    that the download path can be tested and benchmarked without network.
+
+AUTHOR
+
+    Timothy Lynar <timlynar@au1.ibm.com>, IBM Research, Melbourne, Australia
+    Frank Suits <frankst@au1.ibm.com>, IBM Research, Melbourne, Australia;
+                                       Dublin, Ireland; Yorktown, USA
+    Beat Buesser <beat.buesser@ie.ibm.com>, IBM Research, Dublin, Ireland
+
+NOTICE
+
+    Licensed Materials - Property of IBM
+    "Restricted Materials of IBM"
+     Copyright IBM Corp. 2017 ALL RIGHTS RESERVED
+    US GOVERNMENT USERS RESTRICTED RIGHTS - USE, DUPLICATION OR DISCLOSURE
+    RESTRICTED BY GSA ADP SCHEDULE CONTRACT WITH IBM CORP.
+    THE SOURCE CODE FOR THIS PROGRAM IS NOT PUBLISHED OR OTHERWISE DIVESTED OF
+    ITS TRADE SECRETS, IRRESPECTIVE OF WHAT HAS BEEN DEPOSITED WITH
+    THE U. S. COPYRIGHT OFFICE. IBM GRANTS LIMITED PERMISSION TO LICENSEES TO
+    MAKE HARDCOPY OR OTHER REPRODUCTIONS OF ANY MACHINE- READABLE DOCUMENTATION,
+    PROVIDED THAT EACH SUCH REPRODUCTION SHALL CARRY THE IBM COPYRIGHT NOTICES
+    AND THAT USE OF THE REPRODUCTION SHALL BE GOVERNED BY THE TERMS AND
+    CONDITIONS SPECIFIED BY IBM IN THE LICENSED PROGRAM SPECIFICATIONS. ANY
+    REPRODUCTION OR USE BEYOND THE LIMITED PERMISSION GRANTED HEREIN SHALL BE A
+    BREACH OF THE LICENSE AGREEMENT AND AN INFRINGEMENT OF THE APPLICABLE
+    COPYRIGHTS.
+
+"""
+
+import os
+import re
+import time
+import uuid
+import hashlib
+import email.utils
+import random
+import socket
+import urllib
+import urlparse
+import threading
+import SocketServer
+import BaseHTTPServer
+
+
+class StandInFiles(object):
+    '''
+    The files served by the stand-in servers, by absolute path. With a size
+    every other path is served as a file of that many bytes.
+    '''
+
+    def __init__(self, files=None, size=None, mtime=None):
+        '''
+        Constructor of a StandInFiles object.
+        '''
+        self.files = {}
+        for path, data in (files or {}).items():
+            self.put(path, data)
+        self.payload = None if size is None else make_payload(size)
+        #Modification time of every file.
+        self.mtime = mtime or time.time()
+
+    @staticmethod
+    def normalize(path):
+        """
+        Absolute path with duplicate slashes collapsed.
+        """
+        return '/'+'/'.join(name for name in path.split('/') if name)
+
+    def put(self, path, data):
+        """
+        Serve data at path.
+        """
+        self.files[self.normalize(path)] = data
+
+    def get(self, path):
+        """
+        The content of path, None if there is no such file.
+        """
+        return self.files.get(self.normalize(path), self.payload)
+
+    def list(self, directory):
+        """
+        Names of the files put in directory.
+        """
+        directory = self.normalize(directory)
+        return sorted(path.rsplit('/', 1)[1] for path in self.files
+                      if path.rsplit('/', 1)[0] == directory.rstrip('/'))
+
+
+def make_payload(size):
+    """
+    size bytes of data that does not compress.
+    """
+    block = os.urandom(min(size, 1024*1024))
+    return (block*(size/len(block)+1))[:size]
+
+
+class Conditions(object):
+    '''
+    How badly a stand-in server behaves: latency before every reply, bandwidth
+    of each transfer and the rates of failed and truncated transfers.
+    error_next and truncate_next fail or truncate the next transfers whatever
+    the rates are.
+    '''
+
+    #Bytes sent at a time.
+    CHUNK = 64*1024
+
+    def __init__(self, latency=0.0, bandwidth=None, error_rate=0.0, truncate_rate=0.0, seed=None):
+        '''
+        Constructor of a Conditions object.
+        latency is in seconds and bandwidth in bytes per second per transfer.
+        '''
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.error_next = 0
+        self.truncate_next = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """
+        Wait for the latency of a reply.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+    def fails(self):
+        """
+        True if the transfer starting now fails.
+        """
+        with self._lock:
+            if self.error_next:
+                self.error_next = self.error_next - 1
+                return True
+            return self._random.random() < self.error_rate
+
+    def cut(self, length):
+        """
+        Where a transfer of length bytes starting now is cut off, None if it is not.
+        """
+        with self._lock:
+            if self.truncate_next:
+                self.truncate_next = self.truncate_next - 1
+            elif length < 2 or self._random.random() >= self.truncate_rate:
+                return None
+        return length/2
+
+    def send(self, outfile, data, stats):
+        """
+        Write data to outfile at the bandwidth set. Returns False if the client went away.
+        """
+        started = time.time()
+        sent = 0
+        try:
+            while sent < len(data):
+                chunk = data[sent:sent+self.CHUNK]
+                outfile.write(chunk)
+                outfile.flush()
+                sent = sent + len(chunk)
+                stats.add('bytes_sent', len(chunk))
+                if self.bandwidth:
+                    ahead = started+float(sent)/self.bandwidth-time.time()
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except socket.error:
+            return False
+        return True
+
+
+class Stats(object):
+    '''
+    What a stand-in server did: requests, errors, truncated transfers, logins
+    and bytes sent.
+    '''
+
+    NAMES = ('requests', 'errors', 'truncated', 'logins', 'bytes_sent')
+
+    def __init__(self):
+        '''
+        Constructor of a Stats object.
+        '''
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Start counting from zero.
+        """
+        with self._lock:
+            for name in self.NAMES:
+                setattr(self, name, 0)
+
+    def add(self, name, count=1):
+        """
+        Add count to the counter name.
+        """
+        with self._lock:
+            setattr(self, name, getattr(self, name)+count)
+
+    def snapshot(self):
+        """
+        The counters as a dict.
+        """
+        with self._lock:
+            return dict((name, getattr(self, name)) for name in self.NAMES)
+
+
+class StandInHTTPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    Serves GET and HEAD with single byte ranges, index pages of directories
+    and the RDA login form.
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._send(False)
+
+    def do_GET(self):
+        self._send(True)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('content-length', 0)))
+        server.conditions.delay()
+        server.stats.add('requests')
+        if urlparse.urlsplit(self.path).path != server.LOGIN_PATH or server.sessions is None:
+            self._reply(404)
+            return
+
+        fields = urlparse.parse_qs(body)
+        credentials = (fields.get('email', [None])[0], fields.get('passwd', [None])[0])
+        if server.credentials is not None and credentials != server.credentials:
+            #Like RDA, a failed login is a page without a cookie.
+            self._reply(200)
+            return
+
+        token = uuid.uuid4().hex
+        with server.lock:
+            server.sessions.add(token)
+        server.stats.add('logins')
+        #The login page of RDA sends users on to the page they came from.
+        self.send_response(302 if server.login_redirect else 200)
+        if server.login_redirect:
+            self.send_header('Location', '/')
+        self.send_header('Set-Cookie', 'sess='+token+'; Path=/; Max-Age='+str(server.session_age))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _reply(self, status):
+        """
+        Send a reply without a body.
+        """
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _logged_in(self):
+        """
+        True if the request carries the cookie of a login.
+        """
+        found = re.search(r'(?:^|;)\s*sess=(\w+)', self.headers.get('cookie', ''))
+        with self.server.lock:
+            return found is not None and found.group(1) in self.server.sessions
+
+    def _send(self, with_body):
+        """
+        Reply to GET or HEAD.
+        """
+        server = self.server
+        server.conditions.delay()
+        server.stats.add('requests')
+        if server.conditions.fails():
+            server.stats.add('errors')
+            self._reply(503)
+            return
+        if server.sessions is not None and not self._logged_in():
+            self._reply(403)
+            return
+
+        path = urllib.unquote(urlparse.urlsplit(self.path).path)
+        if path.endswith('/'):
+            #Index page of a directory, like the ones of Apache.
+            data = ''.join('<a href="'+urllib.quote(name)+'">'+name+'</a>\n'
+                           for name in server.files.list(path))
+            data = '<html><body>\n<a href="../">Parent Directory</a>\n'+data+'</body></html>\n'
+        else:
+            data = server.files.get(path)
+        if data is None:
+            self._reply(404)
+            return
+
+        #Validators of the file for conditional requests.
+        etag = '"'+hashlib.sha1(data).hexdigest()[:16]+'"'
+        modified = email.utils.formatdate(server.files.mtime, usegmt=True)
+        if self.headers.get('if-none-match') == etag or \
+           (self.headers.get('if-none-match') is None and
+            self.headers.get('if-modified-since') == modified):
+            self._reply(304)
+            return
+
+        status = 200
+        first, last = 0, len(data)-1
+        found = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('range', ''))
+        if found is not None:
+            first = int(found.group(1))
+            if found.group(2):
+                last = min(last, int(found.group(2)))
+            if first > last:
+                self._reply(416)
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(last-first+1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', modified)
+        if status == 206:
+            self.send_header('Content-Range', 'bytes '+str(first)+'-'+str(last)+'/'+str(len(data)))
+        self.end_headers()
+        if not with_body:
+            return
+
+        payload = data[first:last+1]
+        cut = server.conditions.cut(len(payload))
+        if cut is not None:
+            server.stats.add('truncated')
+            payload = payload[:cut]
+            self.close_connection = 1
+        if not server.conditions.send(self.wfile, payload, server.stats):
+            self.close_connection = 1
+
+
+class StandInHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    A stand-in HTTP server on the loopback interface. With login it also
+    stands in for rda.ucar.edu: files are only served to clients that logged
+    in at LOGIN_PATH, with credentials if given as (email, password).
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    LOGIN_PATH = '/cgi-bin/login'
+
+    def __init__(self, files, conditions=None, login=False, credentials=None, session_age=3600,
+                 login_redirect=False):
+        '''
+        Constructor of a StandInHTTPServer object. With login_redirect a login
+        is answered with a redirect to the index page.
+        '''
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StandInHTTPHandler)
+        self.files = files
+        self.conditions = conditions or Conditions()
+        self.stats = Stats()
+        self.sessions = set() if login else None
+        self.credentials = credentials
+        self.session_age = session_age
+        self.login_redirect = login_redirect
+        self.lock = threading.Lock()
+        self.port = self.server_address[1]
+        self.url = 'http://127.0.0.1:'+str(self.port)
+        self.login_url = self.url+self.LOGIN_PATH
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        _start(self, 'standin-http')
+
+    def stop(self):
+        """
+        Stop serving.
+        """
+        self.shutdown()
+        self.server_close()
+
+
+class StandInFTPHandler(SocketServer.StreamRequestHandler):
+    '''
+    The part of FTP used by the Downloader: anonymous login, binary passive
+    transfers with REST, SIZE, MDTM and NLST.
+    '''
+
+    def handle(self):
+        self.rest = 0
+        self.passive = None
+        self._reply('220 Stand-in FTP server ready')
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    break
+                command, _, argument = line.strip().partition(' ')
+                self.server.conditions.delay()
+                handler = getattr(self, 'ftp_'+command.upper(), None)
+                if handler is None:
+                    self._reply('502 Command not implemented')
+                elif handler(argument) is False:
+                    break
+        except socket.error:
+            pass
+        finally:
+            if self.passive is not None:
+                self.passive.close()
+
+    def _reply(self, line):
+        self.wfile.write(line+'\r\n')
+        self.wfile.flush()
+
+    def ftp_USER(self, argument):
+        self._reply('331 Password required')
+
+    def ftp_PASS(self, argument):
+        self._reply('230 Logged in')
+
+    def ftp_TYPE(self, argument):
+        self._reply('200 Type set to '+argument)
+
+    def ftp_CWD(self, argument):
+        self._reply('250 Directory changed')
+
+    def ftp_PWD(self, argument):
+        self._reply('257 "/"')
+
+    def ftp_NOOP(self, argument):
+        self._reply('200 OK')
+
+    def ftp_QUIT(self, argument):
+        self._reply('221 Goodbye')
+        return False
+
+    def ftp_SIZE(self, argument):
+        data = self.server.files.get(argument)
+        if data is None:
+            self._reply('550 No such file')
+        else:
+            self._reply('213 '+str(len(data)))
+
+    def ftp_MDTM(self, argument):
+        if self.server.files.get(argument) is None:
+            self._reply('550 No such file')
+        else:
+            self._reply('213 '+time.strftime('%Y%m%d%H%M%S', time.gmtime(self.server.files.mtime)))
+
+    def ftp_REST(self, argument):
+        self.rest = int(argument)
+        self._reply('350 Restarting at '+argument)
+
+    def ftp_PASV(self, argument):
+        if self.passive is not None:
+            self.passive.close()
+        self.passive = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.passive.bind(('127.0.0.1', 0))
+        self.passive.listen(1)
+        port = self.passive.getsockname()[1]
+        self._reply('227 Entering Passive Mode (127,0,0,1,'+str(port/256)+','+str(port%256)+')')
+
+    def _data_connection(self):
+        """
+        Accept the data connection opened after PASV.
+        """
+        self.passive.settimeout(10)
+        conn = self.passive.accept()[0]
+        self.passive.close()
+        self.passive = None
+        return conn
+
+    def ftp_NLST(self, argument):
+        server = self.server
+        server.stats.add('requests')
+        if self.passive is None:
+            self._reply('425 Use PASV first')
+            return
+        self._reply('150 Here comes the listing')
+        conn = self._data_connection()
+        listing = ''.join(name+'\r\n' for name in server.files.list(argument or '/'))
+        outfile = conn.makefile('wb')
+        server.conditions.send(outfile, listing, server.stats)
+        outfile.close()
+        conn.close()
+        self._reply('226 Transfer complete')
+
+    def ftp_RETR(self, argument):
+        server = self.server
+        server.stats.add('requests')
+        offset = self.rest
+        self.rest = 0
+        if server.conditions.fails():
+            server.stats.add('errors')
+            #Busy servers hang up, which the HostLimits take as a request to slow down.
+            self._reply('421 Too many connections, try again later')
+            return False
+        data = server.files.get(argument)
+        if data is None:
+            self._reply('550 No such file')
+            return
+        if self.passive is None:
+            self._reply('425 Use PASV first')
+            return
+
+        self._reply('150 Opening BINARY mode data connection')
+        conn = self._data_connection()
+        payload = data[offset:]
+        cut = server.conditions.cut(len(payload))
+        if cut is not None:
+            server.stats.add('truncated')
+            payload = payload[:cut]
+        outfile = conn.makefile('wb')
+        sent = server.conditions.send(outfile, payload, server.stats)
+        try:
+            outfile.close()
+        except socket.error:
+            sent = False
+        conn.close()
+        if cut is not None or not sent:
+            self._reply('426 Connection closed; transfer aborted')
+        else:
+            self._reply('226 Transfer complete')
+
+
+class StandInFTPServer(SocketServer.ThreadingTCPServer):
+    '''
+    A stand-in anonymous FTP server on the loopback interface.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, files, conditions=None):
+        '''
+        Constructor of a StandInFTPServer object.
+        '''
+        SocketServer.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), StandInFTPHandler)
+        self.files = files
+        self.conditions = conditions or Conditions()
+        self.stats = Stats()
+        self.port = self.server_address[1]
+        self.url = 'ftp://127.0.0.1:'+str(self.port)
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        _start(self, 'standin-ftp')
+
+    def stop(self):
+        """
+        Stop serving.
+        """
+        self.shutdown()
+        self.server_close()
+
+
+def _start(server, name):
+    """
+    Run server.serve_forever in a daemon thread.
+    """
+    thread = threading.Thread(target=server.serve_forever, name=name)
+    thread.daemon = True
+    thread.start()
@@ -0,0 +1,119 @@
+import unittest
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from stevedore import *
+
+"""
+Unit tests of InputDataCache in a temporary input data directory.
+"""
+
+
+class TestCache(unittest.TestCase):
+
+    SIZE = 1000
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = InputDataCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = self.directory+'/'+name
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as outfile:
+            outfile.write(content)
+        return path
+
+    def query(self, sql, args=()):
+        db = self.cache._connect()
+        try:
+            rows = db.execute(sql, args).fetchall()
+            db.commit()
+            return rows
+        finally:
+            db.close()
+
+    def age(self, path, seconds):
+        """Make the object of path look last used seconds ago."""
+        self.query('UPDATE objects SET last_access = ? WHERE hash ='
+                   ' (SELECT hash FROM links WHERE path = ?)', (time.time()-seconds, path))
+
+    def test_duplicates(self):
+        """Files with the same content share one cached object"""
+        first = self.write('20170101/gfs.grb2', 'a'*self.SIZE)
+        second = self.write('20170102/gfs.grb2', 'a'*self.SIZE)
+        other = self.write('20170102/nam.grb2', 'b'*self.SIZE)
+        for path in [first, second, other]:
+            self.cache.add(path)
+        self.assertTrue(os.path.samefile(first, second))
+        self.assertFalse(os.path.samefile(first, other))
+        self.assertEqual(len(self.query('SELECT hash FROM objects')), 2)
+        self.assertEqual(self.cache.size(), 2*self.SIZE)
+        self.assertEqual(open(second, 'rb').read(), 'a'*self.SIZE)
+
+    def test_evict(self):
+        """Eviction removes the least recently used unpinned files until the budget is met"""
+        paths = [self.write('20170101/file'+str(i), str(i)*self.SIZE) for i in range(4)]
+        for path in paths:
+            self.cache.add(path, pin=False)
+        #file0 is the oldest but pinned, file1 and file2 are next to go.
+        for i, path in enumerate(paths):
+            self.age(path, 100-i)
+        self.cache.touch(paths[0])
+        self.age(paths[0], 1000)
+
+        self.cache.budget = 2*self.SIZE
+        self.assertEqual(self.cache.evict(), paths[1:3])
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[3]))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertFalse(os.path.exists(paths[2]))
+        self.assertEqual(self.cache.size(), 2*self.SIZE)
+        self.assertEqual(self.cache.evict(), [])
+
+    def test_evict_pinned(self):
+        """Pinned files stay even if the cache does not fit into the budget"""
+        paths = [self.write('20170101/file'+str(i), str(i)*self.SIZE) for i in range(2)]
+        for path in paths:
+            self.cache.add(path)
+        self.cache.budget = 0
+        self.assertEqual(self.cache.evict(), [])
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+        #Once this run releases them they may go.
+        self.cache.release()
+        self.assertEqual(self.query('SELECT * FROM pins'), [])
+        self.assertEqual(sorted(self.cache.evict()), paths)
+        self.assertEqual(self.cache.size(), 0)
+
+    def test_stale_pins(self):
+        """Pins of finished runs and expired pins are dropped, live ones are kept"""
+        path = self.write('20170101/gfs.grb2', 'a'*self.SIZE)
+        self.cache.add(path)
+        finished = subprocess.Popen(['true'])
+        finished.wait()
+        self.query('INSERT INTO pins (path, host, pid, pinned_at) VALUES (?, ?, ?, ?)',
+                   (path, self.cache.host, finished.pid, time.time()))
+        self.query('INSERT INTO pins (path, host, pid, pinned_at) VALUES (?, ?, ?, ?)',
+                   (path, 'elsewhere', 1, time.time()-self.cache.PIN_TIMEOUT-1))
+        self.query('INSERT INTO pins (path, host, pid, pinned_at) VALUES (?, ?, ?, ?)',
+                   (path, 'elsewhere', 2, time.time()))
+
+        db = self.cache._connect()
+        try:
+            self.cache._drop_stale_pins(db)
+            db.commit()
+        finally:
+            db.close()
+        pins = self.query('SELECT host, pid FROM pins ORDER BY host')
+        self.assertEqual(pins, [('elsewhere', 2), (self.cache.host, self.cache.pid)])
+
+
+if __name__ == '__main__':
+    unittest.main()
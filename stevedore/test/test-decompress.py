@@ -0,0 +1,53 @@
+import unittest
+import os
+import bz2
+import gzip
+import shutil
+import tempfile
+from stevedore import *
+
+"""
+Unit tests of decompressing files while they download.
+"""
+
+
+class TestDecompress(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data = ''.join(str(i) for i in range(200000))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def feed(self, fmt, compressed, chunk=4096):
+        decompressor = StreamDecompressor(fmt, self.directory+'/out')
+        for i in range(0, len(compressed), chunk):
+            decompressor.feed(compressed[i:i+chunk])
+        decompressor.finish()
+        return open(self.directory+'/out', 'rb').read()
+
+    def test_gzip_members(self):
+        compressed = ''
+        for part in (self.data[:1000], self.data[1000:]):
+            outfile = gzip.open(self.directory+'/in.gz', 'wb')
+            outfile.write(part)
+            outfile.close()
+            compressed = compressed+open(self.directory+'/in.gz', 'rb').read()
+        self.assertEqual(self.feed('gz', compressed), self.data)
+
+    def test_bzip2_streams(self):
+        #Several streams, as written by pbzip2, are decoded in parallel.
+        compressed = ''.join(bz2.compress(self.data[i:i+100000])
+                             for i in range(0, len(self.data), 100000))
+        self.assertEqual(self.feed('bz2', compressed), self.data)
+        self.assertEqual(self.feed('bz2', bz2.compress(self.data), 1000), self.data)
+
+    def test_truncated(self):
+        compressed = bz2.compress(self.data)
+        self.assertRaises(DecompressError, self.feed, 'bz2', compressed[:-100])
+        self.assertFalse(os.path.isfile(self.directory+'/out'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,301 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import threading
+from datetime import datetime
+from stevedore import *
+from stevedore import rda
+from standin import *
+
+"""
+Unit tests of InputDataSet.download() against the local stand-in servers of
+standin.py, so no network is needed. See bench-download.py for throughput.
+"""
+
+
+class TestDownload(unittest.TestCase):
+
+    SIZE = 3*1024*1024
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.files = StandInFiles({'/pub/TEST/test.grb2': make_payload(self.SIZE)})
+        self.wait_retry = Downloader.WAIT_RETRY
+        Downloader.WAIT_RETRY = 0
+        self.servers = []
+
+    def tearDown(self):
+        Downloader.WAIT_RETRY = self.wait_retry
+        #Hang up the idle connections before the servers go.
+        get_downloader().close()
+        for server in self.servers:
+            server.stop()
+        shutil.rmtree(self.directory)
+
+    def serve(self, server):
+        server.start()
+        self.servers.append(server)
+        return server
+
+    def download(self, server, is_rda=False):
+        testds = InputDataSet(datetime(2017, 1, 1), 0, self.directory)
+        testds.type = 'TEST'
+        testds.name = 'test.grb2'
+        testds.name_prepared = 'test.grb2'
+        testds.server_url = [server.url]
+        testds.server_path = ['pub/TEST']
+        testds.is_rda = [is_rda]
+        testds.download()
+        return open(self.directory+'/test.grb2', 'rb').read()
+
+    def test_http_resume(self):
+        """Truncated HTTP transfers carry on from where they stopped"""
+        server = self.serve(StandInHTTPServer(self.files))
+        server.conditions.truncate_next = 2
+        self.assertEqual(self.download(server), self.files.get('/pub/TEST/test.grb2'))
+        stats = server.stats.snapshot()
+        self.assertEqual(stats['truncated'], 2)
+        self.assertTrue(stats['bytes_sent'] < 2*self.SIZE)
+
+    def test_ftp_errors(self):
+        """FTP servers hanging up are tried again"""
+        server = self.serve(StandInFTPServer(self.files))
+        server.conditions.error_next = 1
+        server.conditions.truncate_next = 1
+        self.assertEqual(self.download(server), self.files.get('/pub/TEST/test.grb2'))
+        self.assertEqual(server.stats.snapshot()['errors'], 1)
+
+    def test_rda_login(self):
+        """RDA files are fetched with the cookie of a login, redirected or not"""
+        os.environ['RDA_EMAIL'] = 'user@example.com'
+        os.environ['RDA_PASS'] = 'secret'
+        try:
+            for login_redirect in (False, True):
+                server = self.serve(StandInHTTPServer(self.files, login=True,
+                                                      credentials=('user@example.com', 'secret'),
+                                                      login_redirect=login_redirect))
+                rda._SHARED_SESSION = RDASession(server.login_url)
+                self.assertEqual(self.download(server, True), self.files.get('/pub/TEST/test.grb2'))
+                self.assertEqual(server.stats.snapshot()['logins'], 1)
+                os.remove(self.directory+'/test.grb2')
+        finally:
+            rda._SHARED_SESSION = None
+            del os.environ['RDA_EMAIL']
+            del os.environ['RDA_PASS']
+
+    def test_poll_publication(self):
+        """Files are handed over as soon as they are listed with their inventory"""
+        #The server publishes inventories, so files without one are still being written.
+        self.files.put('/pub/TEST/test.grb2.idx', '1:0:d=2017010100:TMP:2 m above ground:anl:')
+        for server in (self.serve(StandInHTTPServer(self.files)),
+                       self.serve(StandInFTPServer(self.files))):
+            testds = InputDataSet(datetime(2017, 1, 1), 0, self.directory)
+            testds.name = 'late.grb2'
+            testds.server_url = [server.url]
+            testds.server_path = ['pub/TEST']
+            published = []
+            poller = PublicationPoller(60, interval=0.05, max_interval=0.1)
+            poller.watch(testds, lambda: published.append(time.time()))
+            poller.start()
+            time.sleep(0.3)
+            self.files.put('/pub/TEST/late.grb2', 'GRIB')
+            time.sleep(0.3)
+            self.assertEqual(published, [])
+            self.files.put('/pub/TEST/late.grb2.idx', '1:0:d=2017010100:TMP:2 m above ground:anl:')
+            poller._thread.join(5)
+            self.assertEqual(len(published), 1)
+            del self.files.files['/pub/TEST/late.grb2']
+            del self.files.files['/pub/TEST/late.grb2.idx']
+
+    def test_throttle(self):
+        """A bandwidth limit holds back a transfer while it runs"""
+        server = self.serve(StandInHTTPServer(self.files))
+        bucket = TokenBucket(self.SIZE, burst=self.SIZE/8)
+        charged = []
+
+        def consume(nbytes):
+            charged.append(nbytes)
+            bucket.consume(nbytes)
+
+        started = time.time()
+        with get_downloader().throttled(consume):
+            self.download(server)
+        self.assertTrue(time.time()-started > 0.7)
+        self.assertTrue(len(charged) > 1)
+        self.assertEqual(sum(charged), self.SIZE)
+
+    def test_mirror_breaker(self):
+        """Hosts that keep failing are skipped for a while, but never all of them"""
+        health = MirrorHealth()
+        urls = ['http://a.example.com/', 'http://b.example.com/']
+        health.record_failure('a.example.com', DownloadError('busy', status=503))
+        health.record_failure('a.example.com', DownloadError('busy', status=429))
+        self.assertFalse(health.is_tripped('a.example.com'))
+
+        health.record_failure('a.example.com', DownloadError('down'))
+        health.record_failure('a.example.com', DownloadError('down'))
+        self.assertEqual(health.order(urls), [1])
+        #The last host left is tried even though it is down.
+        health.record_failure('b.example.com', DownloadError('down'))
+        health.record_failure('b.example.com', DownloadError('down'))
+        self.assertEqual(health.order(urls), [0, 1])
+        self.assertEqual(health.order(urls[:1]), [0])
+
+        #After the cool-down a single download tries the host again.
+        health._tripped['a.example.com'] = time.time()-MirrorHealth.RETRY_AFTER
+        self.assertEqual(health.order(urls), [0])
+        self.assertEqual(health.order(urls), [0, 1])
+        health.record_success('a.example.com', 1000, 1.0)
+        self.assertEqual(health.order(urls), [0])
+
+    def test_availability(self):
+        """Only servers listing the file are asked for it"""
+        other = self.serve(StandInHTTPServer(StandInFiles({'/pub/TEST/other.grb2': 'GRIB'})))
+        server = self.serve(StandInFTPServer(self.files))
+        InputDataSet.availability = AvailabilityIndex()
+        try:
+            testds = InputDataSet(datetime(2017, 1, 1), 0, self.directory)
+            testds.type = 'TEST'
+            testds.name = 'test.grb2'
+            testds.name_prepared = 'test.grb2'
+            testds.server_url = [other.url, server.url]
+            testds.server_path = ['pub/TEST', 'pub/TEST']
+            testds.is_rda = [False, False]
+            testds.download()
+            self.assertEqual(open(self.directory+'/test.grb2', 'rb').read(),
+                             self.files.get('/pub/TEST/test.grb2'))
+            #The index page is all that is read from the server without the file.
+            self.assertEqual(other.stats.snapshot()['requests'], 1)
+
+            testds.name = 'missing.grb2'
+            testds.name_prepared = 'missing.grb2'
+            testds.download()
+            self.assertFalse(os.path.exists(self.directory+'/missing.grb2'))
+            self.assertEqual(other.stats.snapshot()['requests'], 1)
+        finally:
+            InputDataSet.availability = None
+
+    def test_other_run(self):
+        """A file downloaded by another run while we wait for its lock is used as it is"""
+        server = self.serve(StandInHTTPServer(self.files))
+        other = FileLock(self.directory+'/test.grb2')
+        other.acquire()
+        downloading = threading.Thread(target=self.download, args=(server,))
+        downloading.start()
+        time.sleep(0.2)
+        open(self.directory+'/test.grb2', 'wb').write('GRIB')
+        other.release()
+        downloading.join(10)
+        self.assertEqual(open(self.directory+'/test.grb2', 'rb').read(), 'GRIB')
+        self.assertEqual(server.stats.snapshot()['requests'], 0)
+
+    def test_unchanged(self):
+        """Files downloaded every run are only downloaded again once they change"""
+        manifest = Manifest(self.directory+'/manifest.db')
+        InputDataSet.manifest = manifest
+        try:
+            for server in (self.serve(StandInHTTPServer(self.files)),
+                           self.serve(StandInFTPServer(self.files))):
+                testds = InputDataSet(datetime(2017, 1, 1), 0, self.directory)
+                testds.type = 'TEST'
+                testds.name = 'test.grb2'
+                testds.name_prepared = 'test.grb2'
+                testds.server_url = [server.url]
+                testds.server_path = ['pub/TEST']
+                testds.is_rda = [False]
+                testds.keep_existing_file = False
+                testds.download()
+                sent = server.stats.snapshot()['bytes_sent']
+                testds.download()
+                self.assertTrue(server.stats.snapshot()['bytes_sent'] < sent+1024)
+
+                self.files.put('/pub/TEST/test.grb2', make_payload(1000))
+                self.files.mtime = self.files.mtime+60
+                testds.download()
+                self.assertEqual(os.path.getsize(self.directory+'/test.grb2'), 1000)
+                self.files.put('/pub/TEST/test.grb2', make_payload(self.SIZE))
+        finally:
+            InputDataSet.manifest = None
+            manifest.close()
+
+    def test_vtable_fields(self):
+        """A file cut down to the fields of one Vtable is not used by runs needing others"""
+        manifest = Manifest(self.directory+'/manifest.db')
+        InputDataSet.manifest = manifest
+        vtables = []
+        for fields in (['  0  |  0  |  0  | 100 |'], ['  0  |  0  |  0  | 100 |', '  0  |  2  |  2  | 100 |']):
+            vtables.append(self.directory+'/Vtable.'+str(len(vtables)))
+            with open(vtables[-1], 'w') as vtable:
+                for line in fields:
+                    vtable.write(' 11  | 100  |   *  |      | TT       | K       | Field |'+line+'\n')
+        try:
+            testds = InputDataSet(datetime(2017, 1, 1), 0, self.directory)
+            testds.type = 'TEST'
+            testds.name = 'test.grb2'
+            testds.name_prepared = 'test.grb2'
+            testds.partial_download = True
+            open(self.directory+'/test.grb2', 'wb').write('GRIB')
+            testds.vtable = vtables[0]
+            manifest.record('TEST', testds.valid_time, 'test.grb2', self.directory,
+                            Manifest.VALID, 'test.grb2', fields=testds._wanted_fields())
+            self.assertTrue(testds.exists())
+            testds.vtable = vtables[1]
+            self.assertFalse(testds.exists())
+            #Whole files are good for every Vtable.
+            manifest.record('TEST', testds.valid_time, 'test.grb2', self.directory,
+                            Manifest.VALID, 'test.grb2')
+            self.assertTrue(testds.exists())
+        finally:
+            InputDataSet.manifest = None
+            manifest.close()
+
+    def test_deleted(self):
+        """A file deleted since the manifest recorded it does not exist any more"""
+        manifest = Manifest(self.directory+'/manifest.db')
+        InputDataSet.manifest = manifest
+        try:
+            testds = InputDataSet(datetime(2017, 1, 1), 0, self.directory)
+            testds.type = 'TEST'
+            testds.name = 'test.grb2'
+            testds.name_prepared = 'test.grb2'
+            open(self.directory+'/test.grb2', 'wb').write('GRIB')
+            self.assertTrue(testds.exists())
+            self.assertNotEqual(manifest.get('TEST', testds.valid_time, 'test.grb2'), None)
+            os.remove(self.directory+'/test.grb2')
+            self.assertFalse(testds.exists())
+            self.assertEqual(manifest.get('TEST', testds.valid_time, 'test.grb2'), None)
+        finally:
+            InputDataSet.manifest = None
+            manifest.close()
+
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_moved_transfers(self):
+        """Transfers moved to another host give back the slot taken for them"""
+        limits = HostLimits({'a.example.com': 1, 'b.example.com': 1})
+        scheduler = DownloadScheduler(2, limits)
+        started = threading.Event()
+        moved = []
+
+        def transfer(url):
+            #Both tasks hold their first host while the other one starts.
+            started.wait(0.5)
+            started.set()
+            with limits.slot(url):
+                moved.append(url)
+
+        scheduler.submit('http://a.example.com/x', transfer, 'http://b.example.com/x')
+        scheduler.submit('http://b.example.com/y', transfer, 'http://a.example.com/y')
+        scheduler.run(block=False)
+        scheduler._thread.join(10)
+        self.assertFalse(scheduler._thread.is_alive())
+        self.assertEqual(len(moved), 2)
+        self.assertEqual(limits._get('a.example.com').active, 0)
+        self.assertEqual(limits._get('b.example.com').active, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import struct
+from stevedore import *
+
+"""
+Unit tests of the streaming GRIB check done while input data is downloaded.
+The GRIB2 messages are made up here so no download is needed.
+"""
+
+
+def grib2_message(category, number, level_type, level_value, forecast, discipline=0):
+    """Build a small GRIB2 message with one field."""
+    section1 = struct.pack('>IBHHBBBHBBBBBBB', 21, 1, 7, 0, 2, 1, 1, 2017, 1, 1, 0, 0, 0, 0, 1)
+    section3 = struct.pack('>IB', 10, 3)+'\0'*5
+    section4 = struct.pack('>IBHHBBBBBHBBIBBIBBI', 34, 4, 0, 0, category, number, 2, 0, 96, 0, 0,
+                           1, forecast, level_type, 0, level_value, 255, 255, 0xffffffff)
+    section5 = struct.pack('>IB', 10, 5)+'\0'*5
+    section6 = struct.pack('>IBB', 6, 6, 255)
+    section7 = struct.pack('>IB', 5+20, 7)+'x'*20
+    body = section1+section3+section4+section5+section6+section7+'7777'
+    return 'GRIB\0\0'+chr(discipline)+chr(2)+struct.pack('>Q', 16+len(body))+body
+
+
+class TestGribStream(unittest.TestCase):
+
+    def setUp(self):
+        self.first = grib2_message(0, 0, 103, 2, 0)
+        self.second = grib2_message(3, 5, 100, 50000, 6)
+
+    def feed(self, data, chunk=7):
+        validator = GribValidator()
+        for i in range(0, len(data), chunk):
+            validator.feed(data[i:i+chunk])
+        return validator
+
+    def test_inventory(self):
+        """Messages fed in small pieces are checked and listed"""
+        validator = self.feed(self.first+self.second)
+        validator.finish()
+        self.assertEqual(validator.count, 2)
+        self.assertEqual(validator.inventory,
+                         ['1:0:d=2017010100:TMP:2 m above ground:anl:',
+                          '2:'+str(len(self.first))+':d=2017010100:HGT:500 mb:6 hour fcst:'])
+
+    def test_truncated(self):
+        """A file ending inside a message fails at the start of that message"""
+        validator = self.feed(self.first+self.second[:-10])
+        with self.assertRaises(GribError) as context:
+            validator.finish()
+        self.assertEqual(context.exception.offset, len(self.first))
+
+    def test_corrupt_end_marker(self):
+        """A message without its 7777 marker is found while streaming"""
+        with self.assertRaises(GribError) as context:
+            self.feed(self.first+self.second[:-4]+'8888')
+        self.assertEqual(context.exception.offset, len(self.first))
+
+    def test_not_grib(self):
+        """Files that are not GRIB are passed through unchecked"""
+        validator = self.feed('CDF\x01'+'\0'*100)
+        validator.finish()
+        self.assertEqual(validator.is_grib, False)
+
+
+if __name__ == '__main__':
+    unittest.main()
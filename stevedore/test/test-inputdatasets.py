@@ -233,29 +233,15 @@ class TestUM(unittest.TestCase):
         """Test that we can login to RDA
         Note that this will only work if RDA_EMAIL and RDA_PASS are set
         """
-        ret = False
-
         date_test = datetime.strptime('2017-01-01:12', '%Y-%m-%d:%H')
         #date, hour, path
         testds = InputDataSet(date_test, 0, '/tmp')
 
-        if os.path.isfile(testds.RDA_LOGIN_PATH+'/login'):
-            os.remove(testds.RDA_LOGIN_PATH+'/login')
-
-        testds.rda_login()
-
-        if os.path.isfile(testds.RDA_LOGIN_PATH+'/login'):
-            #Get the first line of the file.
-            #That line should not contain "Error: bad action"
-            #The line should contain: "Authentication successful."
-            #For some reason it can take a few minutes to run this login command.
-            cfile = open(testds.RDA_LOGIN_PATH+'/login', 'r')
-            content = cfile.read()
-            if "successful" in content:
-                ret = True
+        ret = testds.rda_login()
 
-        #Assert that login was a success.
+        #Assert that login was a success and left the session with cookies to send.
         self.assertEqual( ret, True)
+        self.assertIn('Cookie', get_rda_session().headers())
 
 
     def test_InputDataSetGFSFCST_get_filename(self):
@@ -0,0 +1,70 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from stevedore import *
+
+"""
+Unit tests of sharing input data between nodes. Both nodes run in this
+process on the loopback interface.
+"""
+
+
+class TestPeers(unittest.TestCase):
+
+    def setUp(self):
+        self.served = tempfile.mkdtemp()
+        self.local = tempfile.mkdtemp()
+        os.mkdir(self.served+'/GFS')
+        os.mkdir(self.local+'/GFS')
+        with open(self.served+'/GFS/gfs.grb2', 'wb') as outfile:
+            outfile.write('not really GRIB'*1000)
+        with open(self.served+'/GFS/gfs.grb2.part', 'wb') as outfile:
+            outfile.write('in progress')
+
+        self.server = CacheServer(self.served, 0)
+        self.server.start()
+        os.environ['STEVEDORE_PEERS'] = 'http://127.0.0.1:'+str(self.server.port)
+        self.registry = PeerRegistry(self.local)
+
+    def tearDown(self):
+        #Hang up the idle connections so that the threads answering them end.
+        get_downloader().close()
+        self.server.stop()
+        #Nothing the server started is left running.
+        self.assertEqual([thread.name for thread in threading.enumerate()
+                          if thread.name.startswith('peer-')], [])
+        del os.environ['STEVEDORE_PEERS']
+        shutil.rmtree(self.served)
+        shutil.rmtree(self.local)
+
+    def test_fetch_from_peer(self):
+        url = self.registry.fetch(self.local+'/GFS/gfs.grb2')
+        self.assertTrue(url.endswith('/GFS/gfs.grb2'))
+        self.assertEqual(open(self.local+'/GFS/gfs.grb2').read(), 'not really GRIB'*1000)
+
+    def test_missing_file(self):
+        self.assertEqual(self.registry.fetch(self.local+'/GFS/other.grb2'), None)
+        #A peer without the file is still asked for the next one.
+        self.assertEqual(len(self.registry.peers()), 1)
+
+    def test_vtable_fields(self):
+        manifest = Manifest(self.served+'/manifest.db')
+        manifest.record('GFS', datetime(2017, 1, 1), 'gfs.grb2', os.path.realpath(self.served)+'/GFS',
+                        Manifest.VALID, 'gfs.grb2', fields='0123456789abcdef')
+        manifest.close()
+        #A copy cut down to the fields of another Vtable is left alone.
+        self.assertEqual(self.registry.fetch(self.local+'/GFS/gfs.grb2', fields='fedcba9876543210'), None)
+        self.assertEqual(self.registry.fetch(self.local+'/GFS/gfs.grb2'), None)
+        self.assertNotEqual(self.registry.fetch(self.local+'/GFS/gfs.grb2', fields='0123456789abcdef'), None)
+
+    def test_hidden_files(self):
+        self.assertEqual(self.server.resolve('/GFS/gfs.grb2.part'), None)
+        self.assertEqual(self.server.resolve('/GFS/../../etc/passwd'), None)
+        self.assertEqual(self.server.resolve('/.cache/objects'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
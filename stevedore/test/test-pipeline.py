@@ -0,0 +1,86 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from stevedore import *
+
+"""
+Unit tests of PreparePipeline with stand-in datasets whose prepare() leaves a
+mark in a temporary directory, hangs or kills the prepare process.
+"""
+
+
+class StandInDataSet(object):
+
+    def __init__(self, directory, name, action=None):
+        self.directory = directory
+        self.name = name
+        self.action = action
+
+    def prepare(self, **args):
+        if self.action == 'hang':
+            time.sleep(60)
+        elif self.action == 'die':
+            os._exit(1)
+        open(self.directory+'/'+self.name, 'a').write(str(args.get('run'))+'\n')
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pipeline = PreparePipeline()
+        self.pipeline.READY_TIMEOUT = 2
+        self.pipeline.start()
+
+    def tearDown(self):
+        self.pipeline.close()
+        shutil.rmtree(self.directory)
+
+    def marks(self, name):
+        return open(self.directory+'/'+name).read().split()
+
+    def test_runs(self):
+        """One prepare process serves the runs one after the other"""
+        for run in ['1', '2']:
+            self.pipeline.begin({'run': run})
+            self.pipeline.expect('GFS', StandInDataSet(self.directory, 'GFS'), 2)
+            self.pipeline.downloaded('GFS')
+            self.pipeline.downloaded('GFS')
+            self.assertTrue(self.pipeline.wait_ready('GFS'))
+            self.pipeline.finish()
+        self.assertEqual(self.marks('GFS'), ['1', '1', '2', '2'])
+
+    def test_unexpected(self):
+        """Datasets not announced are left to the caller"""
+        self.pipeline.begin({})
+        self.pipeline.downloaded('NAM')
+        self.assertFalse(self.pipeline.wait_ready('NAM'))
+        self.assertFalse(self.pipeline.broken)
+
+    def test_hang(self):
+        """A prepare process that hangs is given up on"""
+        self.pipeline.begin({})
+        self.pipeline.expect('GFS', StandInDataSet(self.directory, 'GFS', 'hang'), 1)
+        self.pipeline.downloaded('GFS')
+        self.assertFalse(self.pipeline.wait_ready('GFS'))
+        self.assertTrue(self.pipeline.broken)
+        #The next runs prepare without it.
+        self.pipeline.begin({})
+        self.pipeline.expect('GFS', StandInDataSet(self.directory, 'GFS'), 1)
+        self.pipeline.downloaded('GFS')
+        self.assertFalse(self.pipeline.wait_ready('GFS'))
+        self.assertFalse(os.path.exists(self.directory+'/GFS'))
+
+    def test_death(self):
+        """A prepare process that dies is given up on"""
+        self.pipeline.begin({})
+        self.pipeline.expect('GFS', StandInDataSet(self.directory, 'GFS', 'die'), 1)
+        self.pipeline.downloaded('GFS')
+        self.assertFalse(self.pipeline.wait_ready('GFS'))
+        self.assertTrue(self.pipeline.broken)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from datetime import datetime, timedelta
+from stevedore import *
+
+"""
+Unit tests of the dataset registry, of the planning of time ranges and of
+the store of the input files of a run.
+"""
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_template(self):
+        """Templates fill in the date and the forecast hour"""
+        template = Template('%y%m%d%H.gfs.t%Hz.0p50.pgrb2f{fh:03d}')
+        self.assertEqual(template(datetime(2017, 6, 27, 18), 36), '17062718.gfs.t18z.0p50.pgrb2f036')
+        self.assertRaises(ValueError, Template, 'sst.%j')
+
+    def test_classes(self):
+        """The classes name their files from the registry"""
+        for name in DATASET_SPECS:
+            dataset_class = get_dataset_class(name)
+            testds = dataset_class(datetime(2017, 1, 1, 6), 0, '/tmp')
+            self.assertEqual(testds.intervalseconds, DATASET_SPECS[name].interval*3600, name)
+        self.assertRaises(ValueError, get_dataset_class, 'ERAI')
+
+    def test_plan_range(self):
+        """A range is planned to the same files as created by expand_run"""
+        start = datetime.today().replace(minute=0, second=0, microsecond=0)-timedelta(days=20)
+        for name in ['CFDDA', 'GFS', 'NAM', 'RAP', 'SSTOISST']:
+            for is_analysis in (False, True):
+                planned = plan_range(name, start, 21*24, '/tmp', is_analysis)
+                _, files = expand_run(name, start, 21*24, '/tmp', None, is_analysis)
+                files = unique_downloads(files)
+                self.assertEqual([planned_file.download_key() for planned_file in planned],
+                                 [testds.download_key() for testds in files], name)
+                self.assertEqual([planned_file.name_prepared for planned_file in planned],
+                                 [testds.name_prepared for testds in files], name)
+        self.assertEqual(plan_range('GFSsubset', start, 24, '/tmp'), None)
+
+    def test_store(self):
+        """The store creates the objects of its tasks on demand"""
+        start = datetime(2017, 1, 1, 6)
+        store = InputFileStore(start, '/tmp', is_analysis=True)
+        dataset, tasks = store.expand('RAP', 48)
+        _, files = expand_run('RAP', start, 48, '/tmp', None, True)
+        self.assertEqual(dataset.intervalseconds, 3600)
+        self.assertEqual(len(store), len(files))
+        self.assertEqual([store.get(task).download_key() for task in tasks],
+                         [testds.download_key() for testds in files])
+        self.assertEqual([planned.download_key() for planned in store],
+                         [testds.download_key() for testds in files])
+        self.assertEqual(store.valid_time(tasks[-1]), start+timedelta(hours=48))
+
+        #Objects whose file was renamed while downloading are kept.
+        testds = store.get(tasks[0])
+        testds.name = 'renamed.grib2'
+        self.assertNotEqual(store.get(tasks[0]).name, testds.name)
+        store.keep(tasks[0], testds)
+        self.assertEqual(store.get(tasks[0]).name, testds.name)
+        self.assertEqual(store.planned(tasks[0]).name, testds.name)
+
+    def test_store_unplanned(self):
+        """Datasets not in the registry are planned from their objects, once per file"""
+        start = datetime(2017, 1, 1, 6)
+        bbox = {'lon_min': 140.0, 'lon_max': 150.0, 'lat_min': -5.0, 'lat_max': 5.0}
+        store = InputFileStore(start, '/tmp', bbox)
+        for name in ['GFSsubset', 'SSTJPL']:
+            _, tasks = store.expand(name, 48)
+            _, files = expand_run(name, start, 48, '/tmp', bbox)
+            files = unique_downloads(files)
+            self.assertEqual([store.planned(task).download_key() for task in tasks],
+                             [testds.download_key() for testds in files], name)
+            self.assertEqual([store.get(task).name_prepared for task in tasks],
+                             [testds.name_prepared for testds in files], name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import struct
+from datetime import datetime
+import numpy
+from stevedore.sstprep import grib2_message, poisson_grid_fill
+
+"""
+Unit tests of the in memory preparation of SST grids (JPL, SPoRT).
+"""
+
+
+class TestSSTPrep(unittest.TestCase):
+
+    def grid(self):
+        lats = numpy.linspace(-5.0, 5.0, 41)
+        lons = numpy.linspace(140.0, 150.0, 41)
+        lat, lon = numpy.meshgrid(lats, lons, indexing='ij')
+        #A linear field is its own Poisson fill.
+        return 290.0+0.5*lat+0.2*(lon-140.0), lats, lons
+
+    def test_fill(self):
+        """Land points are filled smoothly, sea points are kept"""
+        sst, _, _ = self.grid()
+        land = numpy.zeros(sst.shape, dtype=bool)
+        land[10:25, 5:30] = True
+        filled = poisson_grid_fill(numpy.ma.masked_where(land, sst), eps=1.e-4, nscan=5000)
+        self.assertTrue(numpy.array_equal(filled[~land], sst[~land]))
+        self.assertTrue(numpy.abs(filled-sst).max() < 0.05)
+
+    def test_grib2(self):
+        """The message is TMP at the surface from NCEP, north to south"""
+        sst, lats, lons = self.grid()
+        message = grib2_message(sst, lats, lons, datetime(2017, 3, 4))
+        self.assertEqual(message[:4], 'GRIB')
+        self.assertEqual(message[-4:], '7777')
+        self.assertEqual(struct.unpack('>Q', message[8:16])[0], len(message))
+        #Section 1 follows section 0, the centre is in its octets 6-7.
+        self.assertEqual(struct.unpack('>H', message[21:23])[0], 7)
+        #The latitude of the first point of section 3 is the northernmost one.
+        section3 = message[16+21:]
+        self.assertEqual(struct.unpack('>I', section3[46:50])[0], 5000000)
+        #The 7 K range of the field packed to 0.01 K takes 10 bits per value.
+        section5 = section3[72+34:]
+        self.assertEqual(ord(section5[19]), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from stevedore import *
+
+"""
+Unit tests of the index of regional subsets (GFSsubset).
+"""
+
+
+class TestSubsets(unittest.TestCase):
+
+    BBOX = {'lon_min': 143.21, 'lon_max': 147.8, 'lat_min': -39.5, 'lat_max': -36.02}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(self.directory+'/GFSsubset')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def put(self, prefix, bbox):
+        filename = self.directory+'/GFSsubset/'+subset_name(prefix, bbox)
+        open(filename, 'wb').write('GRIB\0\0\0\x02')
+        return filename
+
+    def test_grid_region(self):
+        """Boxes are grown to the grid"""
+        self.assertEqual(grid_region(self.BBOX),
+                         {'lon_min': 140.0, 'lon_max': 150.0, 'lat_min': -40.0, 'lat_max': -35.0})
+        self.assertTrue(contains(grid_region(self.BBOX), self.BBOX))
+
+    def test_find(self):
+        """The smallest subset holding the domain is used"""
+        prefix = 'gfs.2017010100.t00z.pgrb2.0p25.f003'
+        self.put(prefix, {'lon_min': 145.0, 'lon_max': 150.0, 'lat_min': -40.0, 'lat_max': -35.0})
+        large = self.put(prefix, {'lon_min': 130.0, 'lon_max': 160.0, 'lat_min': -45.0, 'lat_max': -30.0})
+        small = self.put(prefix, grid_region(self.BBOX))
+        self.put('gfs.2017010106.t06z.pgrb2.0p25.f003', grid_region(self.BBOX))
+        index = SubsetIndex(self.directory+'/GFSsubset')
+        self.assertEqual(index.find(prefix, self.BBOX), small)
+        os.remove(small)
+        self.assertEqual(index.find(prefix, self.BBOX), large)
+        self.assertEqual(index.find(prefix, GLOBE), None)
+
+    def test_cut(self):
+        """A run on a nearby domain uses the region downloaded for another"""
+        testds = InputDataSetGFSsubset(datetime(2017, 1, 1), 3, self.directory, **self.BBOX)
+        self.assertFalse(testds.exists())
+        self.put(testds.get_filename(), testds.region)
+        self.assertTrue(testds.exists())
+        self.assertTrue(os.path.isfile(testds.path+'/'+testds.name_prepared))
+
+
+if __name__ == '__main__':
+    unittest.main()